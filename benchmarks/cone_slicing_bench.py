@@ -0,0 +1,66 @@
+"""
+Benchmark of cone_slicing.cross_stl against the previous implementation
+(cone_cross for every triangle edge of every layer).
+
+The previous implementation is timed on the first --legacy-layers layers only
+and its time is scaled to the number of layers of cross_stl.
+
+Run from the repository root:
+python -m benchmarks.cone_slicing_bench --triangles 1000 10000 100000 200000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.generators import sphere_mesh
+from src.cone_slicing import cone_cross, cone_heights, cross_stl, mesh_edges
+from src.settings import load_settings
+
+
+def legacy_cross_stl(mesh_input, cone, heights):
+    layers = []
+    vertex = [*cone[1]]
+    for height in heights:
+        cross_p_list = []
+        vertex[2] = height
+        for triangle in mesh_input:
+            t = [triangle[:3], triangle[3:6], triangle[6:9]]
+            points = []
+            for x, y in ((t[0], t[1]), (t[0], t[2]), (t[1], t[2])):
+                cross_p = cone_cross(x, y, cone[0], np.array(vertex))
+                if cross_p and len(cross_p) == 3:
+                    if cross_p not in points:
+                        points.append(cross_p)
+                    if len(points) in [2, 4, 6]:
+                        cross_p_list.append(points)
+        layers.append(cross_p_list)
+    return layers
+
+
+def run(triangles, legacy_layers, cone):
+    model = sphere_mesh(triangles)
+    t = time.perf_counter()
+    layers = cross_stl(model, cone)
+    spent = time.perf_counter() - t
+    print("%7d triangles: cross_stl %8.2f s, %d layers, %d segments" %
+          (len(model.points), spent, len(layers), sum(map(len, layers))), end="")
+
+    if legacy_layers > 0:
+        t = time.perf_counter()
+        with np.errstate(all="ignore"):  # cone_cross divides by zero for degenerate edges
+            legacy_cross_stl(model, cone, cone_heights(mesh_edges(model), cone[0], cone[1][2])[:legacy_layers])
+        legacy = (time.perf_counter() - t) * len(layers) / legacy_layers
+        print(", legacy %9.1f s (x%.0f)" % (legacy, legacy / spent), end="")
+    print()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--triangles", type=int, nargs="+", default=[1000, 10000, 100000, 200000])
+    parser.add_argument("--legacy-layers", type=int, default=1, help="0 skips the previous implementation")
+    parser.add_argument("--angle", type=float, default=30)
+    args = parser.parse_args()
+    load_settings()
+    for n in args.triangles:
+        run(n, args.legacy_layers, (args.angle, (0.0, 0.0, 15.0)))
@@ -0,0 +1,65 @@
+"""
+Benchmark of gcode.writeGCode (write throughput in MB/s) against formatting every move
+by the "%" operator line by line.
+
+Run from the repository root:
+python -m benchmarks.gcode_writer_bench --points 100000 1000000 10000000
+"""
+import argparse
+import math
+import os
+import tempfile
+import time
+
+from benchmarks.generators import cone_gcode
+from src.gcode import extrusionPerMM, writeGCode
+from src.settings import load_settings, sett
+
+
+def legacy_write(gc, filename, slicing, hardware):
+    per_mm = extrusionPerMM(slicing, hardware)
+    e = 0.0
+    with open(filename, "w") as f:
+        for layer in range(gc.layersCount()):
+            f.write(";LAYER:%d\n" % layer)
+            points, offsets = gc.layerSlice(layer)
+            offsets = offsets - offsets[0]
+            for k in range(len(offsets) - 1):
+                path = points[offsets[k]:offsets[k + 1], :3].tolist()
+                f.write("G0 X%.3f Y%.3f Z%.3f\n" % tuple(path[0]))
+                for prev, cur in zip(path, path[1:]):
+                    e += math.dist(cur, prev) * per_mm
+                    f.write("G1 X%.3f Y%.3f Z%.3f E%.5f\n" % (cur[0], cur[1], cur[2], e))
+
+
+def run(points, legacy_points):
+    gc = cone_gcode(points)
+    s = sett()
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "out.gcode")
+        t = time.perf_counter()
+        size = writeGCode(gc, filename, s.slicing, s.hardware)
+        spent = time.perf_counter() - t
+        print("%9d points: writeGCode %7.1f MB in %6.2f s, %6.1f MB/s" %
+              (len(gc.points), size / 1e6, spent, size / 1e6 / spent), end="")
+
+        if legacy_points > 0:
+            part = cone_gcode(min(points, legacy_points))
+            t = time.perf_counter()
+            legacy_write(part, filename, s.slicing, s.hardware)
+            legacy = time.perf_counter() - t
+            legacy_size = os.path.getsize(filename)
+            print(", line by line %6.1f MB/s (x%.1f)" % (legacy_size / 1e6 / legacy,
+                                                        size / spent / (legacy_size / legacy)), end="")
+    print()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, nargs="+", default=[100000, 1000000, 10000000])
+    parser.add_argument("--legacy-points", type=int, default=200000,
+                        help="points written line by line, 0 skips it")
+    args = parser.parse_args()
+    load_settings()
+    for n in args.points:
+        run(n, args.legacy_points)
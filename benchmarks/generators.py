@@ -0,0 +1,133 @@
+"""
+Deterministic synthetic inputs of benchmarks: toolpaths, gcode texts, meshes and files of slicing planes.
+The same arguments always give the same data, so timings of different runs are comparable.
+"""
+import numpy as np
+import vtk
+from stl import mesh
+from vtk.util import numpy_support
+
+from src.gcode import GCode, Rotation
+
+
+def synthetic_gcode(segments, paths_per_layer=20, path_len=51, rotated_share=0.25, seed=0):
+    """ toolpath with the given number of segments, a quarter of layers is printed with A/B rotation """
+    rng = np.random.default_rng(seed)
+    layers = max(1, segments // (paths_per_layer * (path_len - 1)))
+    n = layers * paths_per_layer * path_len
+    points = np.zeros((n, 5))
+    points[:, :2] = rng.uniform(0, 100, (n, 2))
+    points[:, 2] = np.repeat(np.arange(layers) * 0.2, paths_per_layer * path_len)
+    rotated = np.repeat(rng.random(layers) < rotated_share, paths_per_layer * path_len)
+    points[rotated, 3] = 30
+    points[rotated, 4] = 45
+    path_offsets = np.arange(layers * paths_per_layer + 1) * path_len
+    layer_offsets = np.arange(layers + 1) * paths_per_layer
+    return GCode.fromArrays(points, path_offsets, layer_offsets, [Rotation(0, 0)], [0] * layers)
+
+
+def cone_gcode(points, path_len=500, paths_per_layer=4, angle=30):
+    """ toolpath like a result of cone slicing: circles on cones with the vertex going up """
+    layers = max(1, points // (path_len * paths_per_layer))
+    t = np.linspace(0, 2 * np.pi, path_len)
+    radius = np.arange(1, paths_per_layer + 1) * 5.0
+    slope = np.tan(np.radians(angle))
+    xyz = np.empty((layers, paths_per_layer, path_len, 3))
+    xyz[..., 0] = radius[:, None] * np.cos(t) + 100
+    xyz[..., 1] = radius[:, None] * np.sin(t) + 100
+    xyz[..., 2] = np.arange(layers)[:, None, None] * 0.2 + slope * (30 - radius)[:, None]
+    path_offsets = np.arange(layers * paths_per_layer + 1) * path_len
+    layer_offsets = np.arange(layers + 1) * paths_per_layer
+    return GCode.fromArrays(np.pad(xyz.reshape(-1, 3), ((0, 0), (0, 2))), path_offsets, layer_offsets,
+                            [Rotation(0, 0)], [0] * layers)
+
+
+def gcode_text(moves, five_axis=False, paths_per_layer=10, path_len=50, rotate_every=20, seed=0):
+    """
+    Text of a gcode file with about the given number of moves as goosli writes it.
+    A 5-axis one rotates the bed (T2/T1 and G1 E) every rotate_every layers and its moves have A and B.
+    """
+    rng = np.random.default_rng(seed)
+    layers = max(1, moves // (paths_per_layer * path_len))
+    lines = [";Generated by goosli", "G21", "G90", "M82", "G92 E0", "G1 F3000"]
+    e = 0.0
+    incline, rotation = 0.0, 0.0
+    for layer in range(layers):
+        if five_axis and layer % rotate_every == 0 and layer > 0:
+            incline, rotation = float(rng.choice([0, -30, -60])), float(rng.choice([0, 45, 90, 180]))
+            lines += ["T2", "G1 E%.3f" % incline, "T1", "G1 E%.3f" % rotation, "T0"]
+        lines.append(";LAYER:%d" % layer)
+        # paths are closed contours around random centers
+        angles = np.linspace(0, 2 * np.pi, path_len)
+        radius = rng.uniform(2, 10, (paths_per_layer, 1))
+        centers = rng.uniform(10, 90, (paths_per_layer, 1, 2))
+        xy = np.stack([np.cos(angles) * radius, np.sin(angles) * radius], axis=2) + centers
+        steps = np.linalg.norm(np.diff(xy, axis=1), axis=2)
+        extrusion = e + np.cumsum(steps, axis=1) * 0.03
+        e = float(extrusion[-1, -1])
+        z = layer * 0.2
+        axes = " A%.3f B%.3f" % (incline, rotation) if five_axis else ""
+        for path, values in zip(xy, extrusion):
+            lines.append("G0 X%.3f Y%.3f Z%.3f%s" % (path[0, 0], path[0, 1], z, axes))
+            lines += ["G1 X%.3f Y%.3f Z%.3f E%.5f%s" % (x, y, z, v, axes)
+                      for (x, y), v in zip(path[1:].tolist(), values.tolist())]
+    lines.append(";End")
+    return "\n".join(lines) + "\n"
+
+
+def sphere_mesh(triangles, radius=15.0, center=(0.0, 0.0, 15.0)):
+    """ UV sphere with about the given number of triangles """
+    rings = max(2, int((triangles / 4) ** 0.5))
+    sectors = max(3, triangles // (2 * rings))
+    theta = np.linspace(0, np.pi, rings + 1)
+    phi = np.linspace(0, 2 * np.pi, sectors + 1)
+    grid = np.stack([np.outer(np.sin(theta), np.cos(phi)),
+                     np.outer(np.sin(theta), np.sin(phi)),
+                     np.outer(np.cos(theta), np.ones_like(phi))], axis=-1) * radius + center
+    v00, v01, v10, v11 = grid[:-1, :-1], grid[:-1, 1:], grid[1:, :-1], grid[1:, 1:]
+    vectors = np.concatenate([np.stack([v00, v10, v11], axis=2).reshape(-1, 3, 3),
+                              np.stack([v00, v11, v01], axis=2).reshape(-1, 3, 3)])
+    return stl_mesh(vectors)
+
+
+def gyroid_mesh(triangles, size=30.0, periods=2):
+    """
+    Gyroid surface in a cube with about the given number of triangles (a surface with many holes and
+    saddles, unlike the sphere), it is the isosurface of a sampled implicit function
+    """
+    # the number of triangles grows as the square of the resolution, about 19 per cell of a face of the cube
+    resolution = max(4, int(round((triangles / (19.0 * periods ** 2)) ** 0.5 * periods)))
+    t = np.linspace(0, 2 * np.pi * periods, resolution)
+    x, y, z = np.meshgrid(t, t, t, indexing="ij")
+    values = np.sin(x) * np.cos(y) + np.sin(y) * np.cos(z) + np.sin(z) * np.cos(x)
+
+    image = vtk.vtkImageData()
+    image.SetDimensions(resolution, resolution, resolution)
+    step = size / (resolution - 1)
+    image.SetSpacing(step, step, step)
+    image.GetPointData().SetScalars(numpy_support.numpy_to_vtk(values.ravel(order="F")))
+    contour = vtk.vtkFlyingEdges3D()
+    contour.SetInputData(image)
+    contour.SetValue(0, 0.0)
+    contour.ComputeNormalsOff()
+    contour.Update()
+    output = contour.GetOutput()
+    points = numpy_support.vtk_to_numpy(output.GetPoints().GetData())
+    cells = numpy_support.vtk_to_numpy(output.GetPolys().GetConnectivityArray()).reshape(-1, 3)
+    return stl_mesh(points[cells].astype(np.float64))
+
+
+def stl_mesh(vectors):
+    data = np.zeros(len(vectors), dtype=mesh.Mesh.dtype)
+    data["vectors"] = vectors
+    return mesh.Mesh(data)
+
+
+def planes_text(count, seed=0):
+    """ file of slicing planes as save_splanes_to_file writes it """
+    rng = np.random.default_rng(seed)
+    lines = ["X%s Y%s Z%s T%s R%s" % (x, y, z, incline, rotation)
+             for x, y, z, incline, rotation in zip(*rng.uniform(-50, 50, (3, count)).round(3).tolist(),
+                                                   rng.uniform(-60, 0, count).round(1).tolist(),
+                                                   rng.uniform(0, 360, count).round(1).tolist())]
+    return "\n".join(lines) + "\n"
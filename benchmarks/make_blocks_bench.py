@@ -0,0 +1,74 @@
+"""
+Benchmark of gui_utils.makeBlocks against the previous implementation
+(vtkPoints.InsertNextPoint and a vtkLine cell per segment).
+
+Run from the repository root:
+python -m benchmarks.make_blocks_bench --segments 1000000
+"""
+import argparse
+import time
+
+import vtk
+
+from benchmarks.generators import synthetic_gcode
+from src import gui_utils
+from src.gcode import Rotation
+from src.settings import load_settings
+
+
+def legacy_make_blocks(layers, rotations, lays2rots):
+    blocks = []
+    for i in range(len(layers)):
+        points = vtk.vtkPoints()
+        lines = vtk.vtkCellArray()
+        block = vtk.vtkPolyData()
+        points_count = 0
+        for path in layers[i]:
+            line = vtk.vtkLine()
+            for k in range(len(path) - 1):
+                points.InsertNextPoint(legacy_xyz(path[k], rotations[lays2rots[i]]))
+                line.GetPointIds().SetId(0, points_count + k)
+                line.GetPointIds().SetId(1, points_count + k + 1)
+                lines.InsertNextCell(line)
+            points.InsertNextPoint(legacy_xyz(path[-1], rotations[lays2rots[i]]))
+            points_count += len(path)
+        block.SetPoints(points)
+        block.SetLines(lines)
+        blocks.append(block)
+    return blocks
+
+
+def legacy_xyz(point, rot):
+    cur = [point.x, point.y, point.z]
+    if point.a == 0:
+        return cur
+    return gui_utils.prepareTransform(Rotation(point.a, point.b), rot).TransformPoint(cur)
+
+
+def vtk_memory_mb(blocks):
+    return sum(b.GetActualMemorySize() for b in blocks) / 1024  # GetActualMemorySize is in KiB
+
+
+def run(segments, skip_legacy=False):
+    gc = synthetic_gcode(segments)
+    print("toolpath: %d layers, %d points, %d segments" %
+          (gc.layersCount(), len(gc.points), len(gc.points) - len(gc.path_offsets) + 1))
+
+    t = time.perf_counter()
+    blocks = gui_utils.makeBlocks(gc.layers, gc.rotations, gc.lays2rots)
+    print("makeBlocks:        %7.2f s, vtk memory %7.1f MB" % (time.perf_counter() - t, vtk_memory_mb(blocks)))
+
+    if not skip_legacy:
+        layers = [gc.layers[i] for i in range(gc.layersCount())]  # Points existed before the columnar GCode
+        t = time.perf_counter()
+        blocks = legacy_make_blocks(layers, gc.rotations, gc.lays2rots)
+        print("legacy makeBlocks: %7.2f s, vtk memory %7.1f MB" % (time.perf_counter() - t, vtk_memory_mb(blocks)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--segments", type=int, default=1000000)
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+    load_settings()
+    run(args.segments, args.skip_legacy)
@@ -0,0 +1,46 @@
+"""
+Benchmark of planar_slicing.slice_planes: contours of the regions of a sphere cut by slicing planes,
+and of planar_slicing.slice_layers (horizontal layers only, the preview of "3axes" slicing).
+
+Run from the repository root:
+python -m benchmarks.planar_slicing_bench --triangles 10000 100000 1000000 --planes 0 1 3
+"""
+import argparse
+import time
+
+from benchmarks.generators import sphere_mesh
+from src.gui_utils import Plane
+from src.planar_slicing import slice_layers, slice_planes
+from src.settings import load_settings
+
+
+def bench_planes(count):
+    """ planes going up the sphere and tilted in turn to different sides """
+    return [Plane(-30, 90 * k, [0.0, 0.0, 8.0 + 16.0 * k / max(count, 1)]) for k in range(count)]
+
+
+def run(triangles, planes, layer_height):
+    model = sphere_mesh(triangles)
+    t = time.perf_counter()
+    gc = slice_planes(model.vectors, bench_planes(planes), layer_height)
+    spent = time.perf_counter() - t
+    print("%8d triangles, %d planes: slice_planes %7.2f s, %d layers, %d points" %
+          (len(model.vectors), planes, spent, gc.layersCount(), len(gc.points)))
+    if planes == 0:
+        t = time.perf_counter()
+        gc = slice_layers(model.vectors, layer_height)
+        spent = time.perf_counter() - t
+        print("%8d triangles, preview: slice_layers %7.2f s, %d layers, %d points" %
+              (len(model.vectors), spent, gc.layersCount(), len(gc.points)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--triangles", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--planes", type=int, nargs="+", default=[0, 1, 3])
+    parser.add_argument("--layer-height", type=float, default=0.2)
+    args = parser.parse_args()
+    load_settings()
+    for n in args.triangles:
+        for count in args.planes:
+            run(n, count, args.layer_height)
@@ -0,0 +1,292 @@
+"""
+Benchmark suite of the hot paths of spycer on deterministic synthetic inputs (see generators.py).
+
+Every case is timed several times and the best time is compared with its baseline in baselines.json:
+a case is a regression when it is slower than the baseline by more than the threshold (a share of it).
+The exit status is 1 if there are regressions. Baselines depend on the machine, after changes of
+the machine or of the cases store them again with --update. Windows are rendered offscreen,
+so the suite runs without a display.
+
+Run from the repository root:
+python -m benchmarks.run
+python -m benchmarks.run -k parse make_blocks --repeat 5
+python -m benchmarks.run --update
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+import vtk
+from PyQt5.QtWidgets import QApplication
+
+from benchmarks import generators
+from src import gcode, gui_utils, planar_slicing, stl_loader
+from src.snapshots import Scene
+from src.cone_slicing import cone_cross, cross_stl, mesh_edges
+from src.settings import load_settings, sett
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+DEFAULT_THRESHOLD = 0.5
+
+# name -> function of the scale of inputs and a temporary directory, it prepares inputs and returns the timed function
+CASES = {}
+
+
+def case(func):
+    CASES[func.__name__[len("bench_"):]] = func
+    return func
+
+
+@case
+def bench_parse_gcode_3axis(scale, tmp):
+    lines = generators.gcode_text(int(100000 * scale)).splitlines()
+    return lambda: gcode.parseGCode(lines)
+
+
+@case
+def bench_parse_gcode_5axis(scale, tmp):
+    lines = generators.gcode_text(int(100000 * scale), five_axis=True).splitlines()
+    return lambda: gcode.parseGCode(lines)
+
+
+@case
+def bench_parse_gcode_fast_5axis(scale, tmp):
+    text = generators.gcode_text(int(1000000 * scale), five_axis=True).encode()
+    return lambda: gcode.parseGCodeFast(text)
+
+
+@case
+def bench_make_blocks(scale, tmp):
+    gc = gcode.parseGCodeFast(generators.gcode_text(int(1000000 * scale), five_axis=True).encode())
+    return lambda: gui_utils.makeBlocks(gc.layers, gc.rotations, gc.lays2rots)
+
+
+@case
+def bench_wrap_with_actors(scale, tmp):
+    gc = gcode.parseGCodeFast(generators.gcode_text(int(1000000 * scale), five_axis=True).encode())
+    blocks = gui_utils.makeBlocks(gc.layers, gc.rotations, gc.lays2rots)
+    return lambda: gui_utils.wrapWithActors(blocks, gc.rotations, gc.lays2rots)
+
+
+@case
+def bench_colorize_stl(scale, tmp):
+    model = generators.gyroid_mesh(int(500000 * scale))
+    polydata = stl_loader.polyData(*stl_loader.weldVertices(model.vectors))
+    mask = np.random.default_rng(0).integers(0, 2, polydata.GetNumberOfPolys(), dtype=np.uint8)
+    result = os.path.join(tmp, "colorize_triangles.bin")
+    mask.tofile(result)
+    colorizer = sett().colorizer
+
+    def colorize():  # it is too fast to be timed once
+        default, colorizer.result = colorizer.result, result
+        try:
+            for _ in range(50):
+                gui_utils.colorizeSTL(polydata)
+        finally:
+            colorizer.result = default
+
+    return colorize
+
+
+@case
+def bench_cross_stl(scale, tmp):
+    model = generators.sphere_mesh(int(20000 * scale))
+    return lambda: cross_stl(model, (30.0, (0.0, 0.0, 15.0)), workers=1)
+
+
+@case
+def bench_cone_cross(scale, tmp):
+    p_1, p_2 = (ends.reshape(-1, 3) for ends in mesh_edges(generators.sphere_mesh(int(2000 * scale))))
+    vertex = np.array([0.0, 0.0, 20.0])
+
+    def cross():
+        with np.errstate(all="ignore"):  # cone_cross divides by zero for degenerate edges
+            return [cone_cross(a, b, 30.0, vertex) for a, b in zip(p_1, p_2)]
+
+    return cross
+
+
+@case
+def bench_slice_planes(scale, tmp):
+    model = generators.sphere_mesh(int(200000 * scale))
+    planes = [gui_utils.Plane(-30, 90 * k, [0.0, 0.0, 8.0 + 8.0 * k]) for k in range(2)]
+    return lambda: planar_slicing.slice_planes(model.vectors, planes, 0.2)
+
+
+@case
+def bench_slice_layers(scale, tmp):
+    model = generators.sphere_mesh(int(1000000 * scale))
+    return lambda: planar_slicing.slice_layers(model.vectors, 0.2)
+
+
+@case
+def bench_write_gcode(scale, tmp):
+    gc = generators.cone_gcode(int(1000000 * scale))
+    s = sett()
+    return lambda: gcode.writeGCode(gc, os.path.join(tmp, "out.gcode"), s.slicing, s.hardware)
+
+
+@case
+def bench_read_planes(scale, tmp):
+    filename = os.path.join(tmp, "planes.txt")
+    with open(filename, "w") as f:
+        f.write(generators.planes_text(int(50000 * scale)))
+    return lambda: gui_utils.read_planes(filename)
+
+
+@case
+def bench_change_layer_view(scale, tmp):
+    return layer_view_sweep(scale, merged=False)
+
+
+@case
+def bench_change_layer_view_merged(scale, tmp):
+    return layer_view_sweep(scale, merged=True)
+
+
+def layer_view_sweep(scale, merged):
+    """
+    the slider of the window is moved down through layers of a 5-axis toolpath and up again, about 40 frames.
+    The toolpath has many small layers (about 5000), so a frame costs mostly by the number of drawn actors,
+    which merging reduces, rather than by drawing pixels
+    """
+    gc = gcode.parseGCodeFast(generators.gcode_text(int(100000 * scale), five_axis=True, paths_per_layer=2,
+                                                    path_len=10).encode())
+    window = offscreen_window()
+    if merged:
+        merged_layers = gui_utils.MergedLayers(gc.rotations)
+        window.load_gcode(merged_layers.append(gc), False, gui_utils.plane_tf(gc.rotations[0]), merged_layers)
+    else:
+        transforms = {}
+        blocks = gui_utils.makeBlocks(gc.layers, gc.rotations, gc.lays2rots)
+        actors = gui_utils.wrapWithActors(blocks, gc.rotations, gc.lays2rots, False, transforms)
+        window.load_gcode(actors, False, gui_utils.plane_tf(gc.rotations[0]), transforms=transforms)
+    count = window.layers_count()
+    step = max(1, count // 20)
+    values = list(range(count, -1, -step)) + list(range(0, count + 1, step))
+
+    def sweep():
+        value = window.change_layer_view(None, gc)
+        for v in values:
+            window.picture_slider.setValue(v)
+            value = window.change_layer_view(value, gc)
+
+    return sweep
+
+
+@case
+def bench_render_snapshots(scale, tmp):
+    """ frames of the offscreen scene of preview.py through layers of a 5-axis toolpath, about 20 frames """
+    gc = gcode.parseGCodeFast(generators.gcode_text(int(100000 * scale), five_axis=True).encode())
+    scene = Scene(640, 480)
+    scene.load_gcode(gc)
+    count = scene.layers_count()
+    values = list(range(0, count + 1, max(1, count // 20)))
+
+    def frames():
+        for v in values:
+            scene.show_layers(v)
+            scene.render_frame()
+
+    return frames
+
+
+_app = None
+
+
+def offscreen_window():
+    """ MainWindow which renders its scene by an offscreen vtk window instead of the Qt widget """
+    global _app
+    if _app is None:
+        _app = QApplication.instance() or QApplication(sys.argv[:1])
+    from src.window import MainWindow  # it needs QApplication
+    window = MainWindow()
+    window.interactor.GetRenderWindow().RemoveRenderer(window.render)
+    render_window = vtk.vtkRenderWindow()
+    render_window.SetOffScreenRendering(1)
+    render_window.SetSize(640, 480)
+    render_window.AddRenderer(window.render)
+    interactor = vtk.vtkRenderWindowInteractor()
+    interactor.SetRenderWindow(render_window)
+    interactor.Initialize()
+    window.interactor = interactor  # reload_scene renders by it
+    return window
+
+
+def measure(prepare, scale, repeat, tmp):
+    func = prepare(scale, tmp)
+    func()  # warm up: caches, lazy imports, the first render
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t)
+    return min(times)
+
+
+def load_baselines(filename):
+    if not os.path.exists(filename):
+        return {"scale": 1.0, "threshold": DEFAULT_THRESHOLD, "cases": {}}
+    with open(filename) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", "--cases", nargs="+", default=[], help="cases which names contain any of these")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier of sizes of inputs")
+    parser.add_argument("--repeat", type=int, default=3, help="the best of so many runs is taken")
+    parser.add_argument("--threshold", type=float, default=None, help="allowed slowdown, 0.5 is 50%%")
+    parser.add_argument("--baselines", default=BASELINES)
+    parser.add_argument("--update", action="store_true", help="store timings as baselines")
+    args = parser.parse_args()
+
+    load_settings()
+    # the Qt widget of the window has no OpenGL without a display, its errors are expected
+    vtk.vtkLogger.SetStderrVerbosity(vtk.vtkLogger.VERBOSITY_OFF)
+    baselines = load_baselines(args.baselines)
+    compare = not args.update and baselines.get("scale", 1.0) == args.scale
+    if not args.update and not compare:
+        print("baselines are for scale %s, timings are not compared" % baselines.get("scale"))
+    threshold = baselines.get("threshold", DEFAULT_THRESHOLD) if args.threshold is None else args.threshold
+
+    names = [name for name in CASES if not args.cases or any(k in name for k in args.cases)]
+    regressions = []
+    print("%-28s %10s %10s %8s" % ("case", "seconds", "baseline", "ratio"))
+    for name in names:
+        with tempfile.TemporaryDirectory() as tmp:
+            seconds = measure(CASES[name], args.scale, args.repeat, tmp)
+        entry = baselines["cases"].get(name)
+        if args.update:
+            baselines["cases"][name] = {**(entry or {}), "seconds": round(seconds, 6)}
+        if not compare or entry is None:
+            print("%-28s %10.4f %10s %8s" % (name, seconds, "-", "-"))
+            continue
+        ratio = seconds / entry["seconds"]
+        slower = ratio > 1 + entry.get("threshold", threshold)
+        if slower:
+            regressions.append(name)
+        print("%-28s %10.4f %10.4f %8.2f%s" % (name, seconds, entry["seconds"], ratio,
+                                               "  REGRESSION" if slower else ""))
+
+    if args.update:
+        baselines["scale"] = args.scale
+        baselines.setdefault("threshold", DEFAULT_THRESHOLD)
+        with open(args.baselines, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print("baselines are saved to", args.baselines)
+    if regressions:
+        print("regressions:", ", ".join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,5 @@
 import logging
+import multiprocessing
 import sys
 import traceback
 from PyQt5 import QtWidgets
@@ -21,6 +22,7 @@ def excepthook(exc_type, exc_value, exc_tb):
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # cone slicing workers of the frozen application
     load_settings()
 
     app = QApplication(sys.argv)
@@ -0,0 +1,83 @@
+"""
+Png snapshots of gcode and stl files without a display, files are rendered in parallel processes.
+A snapshot of a gcode layer shows the layers up to it as the window shows them with its slider at the layer.
+
+python preview.py model.gcode part.stl -o previews
+python preview.py model.gcode --layers 0:200:20 -1 --rotations
+python preview.py model.gcode --layers all --frames 20  # times of frames, e.g. to compare renderings
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import traceback
+
+import numpy as np
+import vtk
+
+from src.settings import load_settings
+from src.snapshots import snapshot_file
+
+logging.basicConfig(filename='interface.log', filemode='a+', level=logging.INFO, format='%(asctime)s %(message)s')
+
+
+def render_job(job):
+    filename, options = job
+    try:
+        images, times = snapshot_file(filename, **options)
+        return filename, images, times, None
+    except Exception:
+        tb = traceback.format_exc()
+        logging.error(tb)
+        return filename, [], [], tb
+
+
+def init_worker():
+    load_settings()
+    vtk.vtkLogger.SetStderrVerbosity(vtk.vtkLogger.VERBOSITY_ERROR)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="+", help="gcode and stl files")
+    parser.add_argument("-o", "--out", default=".", help="directory of png files")
+    parser.add_argument("--layers", nargs="+", default=[],
+                        help="layers: numbers, ranges first:last[:step], negative from the end, all")
+    parser.add_argument("--rotations", action="store_true", help="the last layer of every rotation of the bed")
+    parser.add_argument("--size", default="800x600", help="width x height of images")
+    parser.add_argument("--frames", type=int, default=1, help="times every snapshot is rendered")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="parallel processes")
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    os.makedirs(args.out, exist_ok=True)
+    options = dict(out_dir=args.out, layers=args.layers, rotations=args.rotations, size=(width, height),
+                   frames=args.frames)
+    jobs = [(filename, options) for filename in args.files]
+    workers = max(1, min(args.workers or 1, len(jobs)))
+    if workers == 1:
+        init_worker()
+        results = map(render_job, jobs)
+    else:
+        pool = multiprocessing.Pool(workers, initializer=init_worker)
+        results = pool.imap_unordered(render_job, jobs)
+
+    failed = 0
+    for filename, images, times, error in results:
+        if error is not None:
+            failed += 1
+            print("%s: failed\n%s" % (filename, error))
+            continue
+        ms = np.array(times) * 1000
+        print("%s: %d images, %d frames, ms per frame: mean %.2f, median %.2f, max %.2f"
+              % (filename, len(images), len(ms), ms.mean(), np.median(ms), ms.max()))
+    if workers > 1:
+        pool.close()
+        pool.join()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()  # workers of the frozen application
+    sys.exit(main())
@@ -1,6 +1,9 @@
 """
 Module contains logic behind the cone slicing
 """
+import multiprocessing
+import os
+from multiprocessing import shared_memory
 from typing import Tuple
 
 import numpy as np
@@ -8,6 +11,12 @@ from stl import mesh
 
 from src.settings import sett
 
+_INDEX_MARGIN = 1e-6  # triangles are checked a bit out of their bounds, it covers rounding of intersection points
+_PARALLEL_MIN_CANDIDATES = 1 << 20  # smaller meshes are sliced faster than worker processes start
+_TASKS_PER_WORKER = 4  # layers are given to workers by parts, so slow parts of the mesh are shared between them
+
+_shared = None  # (memory blocks, arrays) of the worker process, see _attach_shared
+
 
 def load_mesh(filename: str) -> mesh:
     # TODO: we should take already loaded mesh object, because it might be rotated or translated
@@ -19,7 +28,7 @@ def load_mesh(filename: str) -> mesh:
     return model
 
 
-def cross_stl(mesh_input: mesh.Mesh, cone: Tuple[float, Tuple[float, float, float]]):
+def cross_stl(mesh_input: mesh.Mesh, cone: Tuple[float, Tuple[float, float, float]], workers=None):
     """
     Intersection lines of stl model and cone surface
 
@@ -37,34 +46,263 @@ def cross_stl(mesh_input: mesh.Mesh, cone: Tuple[float, Tuple[float, float, floa
     cone[0] - cone angle in degrees
     cone[1] - vertex of the cone: [x, y, z]
 
-    Function returns a List of paths for each layer
+    workers - number of processes slicing layers at the same time, 0 means the number of CPUs.
+    By default it is sett().slicing.workers for big meshes and 1 for others. The result does not depend on it.
+
+    Function returns a List of paths for each layer, layers are at cone_heights
     """
     s = sett()
+    p_1, p_2 = mesh_edges(mesh_input)
+    bounds = triangle_bounds((p_1, p_2), cone[0])
+    heights = cone_heights((p_1, p_2), cone[0], cone[1][2], bounds)
+    triangles, offsets = layers_index(bounds, heights)
+
+    if workers is None:
+        workers = s.slicing.workers if len(triangles) >= _PARALLEL_MIN_CANDIDATES else 1
+    workers = min(workers or os.cpu_count() or 1, len(heights))
+    if workers > 1:
+        return _cross_layers_parallel([p_1, p_2, triangles, offsets], cone[0], heights, workers)
+    return _cross_layers(p_1, p_2, triangles, offsets, cone[0], heights, 0)
+    # return cross_p_list  # example: array([[[ 2. , -0.7, 20. ], [ 2. , -0.7, 20. ]], [[ 1.6, -1.3, 20. ], [ 1.7, -1.3, 20. ]]])
+
+
+def mesh_edges(mesh_input):
+    """
+    Edges of the triangles in the order of cross_stl: (t0, t1), (t0, t2), (t1, t2)
+    Returns two arrays of line points with shape (triangles, 3 edges, 3)
+    """
+    triangles = mesh_input.points if isinstance(mesh_input, mesh.Mesh) else mesh_input
+    t = np.asarray(triangles, dtype=np.float64).reshape(-1, 3, 3)
+    return t[:, [0, 0, 1]], t[:, [1, 2, 2]]
+
+
+def _cross_layers(p_1, p_2, triangles, offsets, alpha_cone, heights, first_layer):
     layers = []
-    vertex = [*cone[1]]
-    starting_height = vertex[2]
-    # update function to return layers
-    for layer_idx in range(100):
-        cross_p_list = []
-        vertex[2] = starting_height + s.slicing.layer_height * layer_idx
-        for triangle in mesh_input:
-            t = [triangle[:3], triangle[3:6], triangle[6:9]]
-
-            points = []
-            for x, y in ((t[0], t[1]), (t[0], t[2]), (t[1], t[2])):
-                cross_p = cone_cross(x, y, cone[0], np.array(vertex))  # find cross point(s) of line and cone
-                if cross_p:
-                    if len(cross_p) == 3:  # one intersection point of line and cone
-                        if cross_p not in points:
-                            points.append(cross_p)
-                        elif len(cross_p) == 2:  # two intersection points of line and cone
-                            points = cross_p
-                        if len(points) in [2, 4, 6]:
-                            cross_p_list.append(points)  # add intersection lines
-
-        layers.append(cross_p_list)
+    for layer_idx, z_cone in enumerate(heights, first_layer):
+        candidates = triangles[offsets[layer_idx]:offsets[layer_idx + 1]]
+        layers.append(cross_edges((p_1[candidates], p_2[candidates]), alpha_cone, z_cone))
     return layers
-    # return cross_p_list  # example: array([[[ 2. , -0.7, 20. ], [ 2. , -0.7, 20. ]], [[ 1.6, -1.3, 20. ], [ 1.7, -1.3, 20. ]]])
+
+
+def _cross_layers_parallel(arrays, alpha_cone, heights, workers):
+    """ _cross_layers in worker processes, arrays are read by them from shared memory """
+    blocks = []
+    try:
+        descriptions = []
+        for array in arrays:
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            blocks.append(block)
+            np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+            descriptions.append((block.name, array.shape, array.dtype.str))
+
+        bounds = np.linspace(0, len(heights), min(workers * _TASKS_PER_WORKER, len(heights)) + 1).astype(int).tolist()
+        tasks = [(alpha_cone, heights[start:end], start) for start, end in zip(bounds[:-1], bounds[1:])]
+        # spawn: forking a process with GUI threads is not safe
+        with multiprocessing.get_context("spawn").Pool(workers, _attach_shared, (descriptions,)) as pool:
+            parts = pool.starmap(_cross_shared_layers, tasks)  # in the order of tasks
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    return [layer for part in parts for layer in part]
+
+
+def _attach_shared(descriptions):
+    global _shared
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in descriptions]
+    arrays = [np.ndarray(shape, dtype, buffer=block.buf) for block, (_, shape, dtype) in zip(blocks, descriptions)]
+    _shared = blocks, arrays
+
+
+def _cross_shared_layers(alpha_cone, heights, first_layer):
+    return _cross_layers(*_shared[1], alpha_cone, heights, first_layer)
+
+
+def cone_heights(edges, alpha_cone, starting_height, bounds=None):
+    """
+    Heights of the cone vertex for layers from starting_height up to the height where the cone has passed the mesh.
+    Layers below the mesh are skipped. The step is slicing.layer_height,
+    with slicing.adaptive_layers it depends on the slope of the surface, see _adaptive_heights.
+    """
+    s = sett().slicing
+    lo, hi = triangle_bounds(edges, alpha_cone) if bounds is None else bounds
+    finite = np.isfinite(lo) & np.isfinite(hi)  # degenerate triangles are everywhere
+    if not np.any(finite):
+        return []
+    lowest, highest = lo[finite].min(), hi[finite].max()
+    step = s.min_layer_height if s.adaptive_layers else s.layer_height
+    first = max(0, int(np.ceil((lowest - starting_height) / step)))
+    last = int(np.floor((highest - starting_height) / step))
+    heights = [starting_height + step * layer_idx for layer_idx in range(first, last + 1)]
+    if s.adaptive_layers:
+        return _adaptive_heights(edges, alpha_cone, heights, (lo, hi))
+    return heights
+
+
+def _adaptive_heights(edges, alpha_cone, fine_heights, bounds):
+    """
+    Picks layers from fine_heights (the step is slicing.min_layer_height).
+    The layer height is min_layer_height / cos, where cos is between normals of the cone and of triangles crossed
+    by the layer, limited by layer_height: surfaces along the cone get thin layers, steep ones get thick layers.
+    """
+    s = sett().slicing
+    p_1, p_2 = edges
+    normals = np.cross(p_2[:, 0] - p_1[:, 0], p_2[:, 1] - p_1[:, 1])
+    centers = (p_1[:, 0] + p_2[:, 0] + p_2[:, 1]) / 3
+    r = np.hypot(centers[:, 0], centers[:, 1])
+    ctg_alpha_cone = 1 / np.tan(alpha_cone * np.pi / 180)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # gradient of z + r * ctg(alpha) which is constant on the cone
+        cone_normals = np.stack((centers[:, 0] / r * ctg_alpha_cone, centers[:, 1] / r * ctg_alpha_cone,
+                                 np.ones(len(r))), axis=1)
+        cone_normals[r == 0, :2] = 0
+        cos = np.abs(np.sum(normals * cone_normals, axis=1)) / (
+                np.linalg.norm(normals, axis=1) * np.linalg.norm(cone_normals, axis=1))
+    cos = np.nan_to_num(cos)  # degenerate triangles
+
+    triangles, offsets = layers_index(bounds, fine_heights)
+    level_cos = np.zeros(len(fine_heights))
+    crossed = np.flatnonzero(np.diff(offsets) > 0)
+    if len(triangles):
+        level_cos[crossed] = np.maximum.reduceat(cos[triangles], offsets[crossed])
+
+    max_steps = max(1, int(round(s.layer_height / s.min_layer_height)))
+    heights = []
+    level = 0
+    while level < len(fine_heights):
+        heights.append(fine_heights[level])
+        steps = max_steps
+        while steps > 1:  # the layer has to be thin enough for the surfaces it covers
+            cos_max = level_cos[level:level + steps + 1].max()
+            allowed = max(1, int(1 / cos_max)) if cos_max > 0 else max_steps
+            if allowed >= steps:
+                break
+            steps = allowed
+        level += steps
+    return heights
+
+
+def triangle_bounds(edges, alpha_cone):
+    """
+    Heights of the cone vertex between which the cone may cross the triangles
+
+    A point is on the cone (below the vertex) when z + r * ctg(alpha) is the vertex height, r is the distance to the axis.
+    It is convex, so the upper bound is at a vertex of the triangle.
+    The lower bound uses the distance of the axis to the triangle which is not less than the distance to
+    the nearest vertex minus the longest edge.
+    """
+    p_1, p_2 = edges
+    vertices = np.stack((p_1[:, 0], p_2[:, 0], p_2[:, 1]), axis=1)
+    a = p_2 - p_1
+    ctg_alpha_cone = 1 / np.tan(alpha_cone * np.pi / 180)
+    r = np.hypot(vertices[..., 0], vertices[..., 1])
+    longest = np.hypot(a[..., 0], a[..., 1]).max(axis=1)
+    lo = vertices[..., 2].min(axis=1) + np.maximum(r.min(axis=1) - longest, 0) * ctg_alpha_cone
+    hi = (vertices[..., 2] + r * ctg_alpha_cone).max(axis=1)
+
+    # cone_cross finds a point on lines of zero length at any height
+    degenerate = np.any(np.all(a == 0, axis=-1), axis=1)
+    lo[degenerate] = -np.inf
+    hi[degenerate] = np.inf
+    return lo - _INDEX_MARGIN, hi + _INDEX_MARGIN
+
+
+def layers_index(bounds, heights):
+    """
+    Triangles which may cross the cone for every height of the cone vertex
+
+    bounds - triangle_bounds of the mesh
+    heights - increasing heights of the cone vertex
+    Returns triangle indices and offsets, triangles of the i-th height are
+    triangles[offsets[i]:offsets[i + 1]] in the order of the mesh.
+    The size is the sum of layers crossing every triangle, not layers × triangles.
+    """
+    lo, hi = bounds
+    heights = np.asarray(heights, dtype=np.float64)
+    first = np.searchsorted(heights, lo, side="left")
+    spans = np.maximum(np.searchsorted(heights, hi, side="right") - first, 0)
+    triangles = np.repeat(np.arange(len(spans)), spans)
+    # layer of every triangle entry: first layer of the triangle + number of the entry in its span
+    starts = np.cumsum(spans) - spans
+    layer = np.arange(len(triangles)) - np.repeat(starts - first, spans)
+    order = np.argsort(layer, kind="stable")
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(layer, minlength=len(heights)))))
+    return triangles[order], offsets
+
+
+def cross_edges(edges, alpha_cone, z_cone):
+    """
+    Intersection lines of the triangles and the cone with vertex at height z_cone
+
+    edges - lines of triangles from mesh_edges
+    Every triangle with two or three different single intersection points of its edges gives
+    the list of these points, as the scalar cross_stl loop does. Edges crossing the cone twice are skipped by it too.
+    """
+    p_1, p_2 = edges
+    roots, points = cone_cross_edges(p_1, p_2, alpha_cone, z_cone)
+    single = roots == 1
+    points = points[:, :, 0]
+
+    def same(i, j):
+        return np.all(points[:, i] == points[:, j], axis=-1)
+
+    keep = np.empty(single.shape, dtype=bool)
+    keep[:, 0] = single[:, 0]
+    keep[:, 1] = single[:, 1] & ~(keep[:, 0] & same(1, 0))
+    keep[:, 2] = single[:, 2] & ~(keep[:, 0] & same(2, 0)) & ~(keep[:, 1] & same(2, 1))
+    counts = keep.sum(axis=1)
+    crossed = counts >= 2
+
+    flat = points[keep & crossed[:, None]].tolist()
+    ends = np.cumsum(counts[crossed]).tolist()
+    return [flat[start:end] for start, end in zip([0] + ends[:-1], ends)]
+
+
+def cone_cross_edges(p_1, p_2, alpha_cone=10.0, z_cone=0.0):
+    """
+    Vectorized cone_cross for many lines at once
+
+    p_1, p_2 - arrays of line points with shape (..., 3)
+    alpha_cone - cone angle in degrees
+    z_cone - height of the cone vertex, the axis of the cone is x = y = 0 as in cone_cross
+
+    Returns number of intersection points found by cone_cross for every line (0, 1 or 2)
+    and intersection points with shape (..., 2, 3), the single one is the first
+    """
+    p_1 = np.asarray(p_1, dtype=np.float64)
+    p_2 = np.asarray(p_2, dtype=np.float64)
+    a = p_2 - p_1  # direction vectors of the lines
+    ctg_alpha_cone = 1 / np.tan(alpha_cone * np.pi / 180)
+    x, y, z = p_1[..., 0], p_1[..., 1], p_1[..., 2]
+    a_1 = a[..., 2] ** 2 - (a[..., 0] ** 2 + a[..., 1] ** 2) * ctg_alpha_cone ** 2
+    b_1 = 2 * (a[..., 2] * z - a[..., 2] * z_cone - (a[..., 0] * x + a[..., 1] * y) * ctg_alpha_cone ** 2)
+    c_1 = z ** 2 + z_cone ** 2 - 2 * z_cone * z - (x ** 2 + y ** 2) * ctg_alpha_cone ** 2
+    D = b_1 ** 2 - 4 * a_1 * c_1  # discriminant
+
+    roots = (D == 0).astype(int)  # one point without checks as in cone_cross
+    points = np.zeros(D.shape + (2, 3))
+    # points with z above the cone vertex are skipped, so lines above it are not checked
+    found = (D > 0) & (np.minimum(p_1[..., 2], p_2[..., 2]) <= z_cone) | (D == 0)
+    p_1, p_2, a, b_1, D = p_1[found], p_2[found], a[found], b_1[found], D[found]
+    a_1 = a_1[found]
+
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        sqrt_d = np.sqrt(np.maximum(D, 0))  # D == 0 gives the same root twice
+        lam = np.stack(((-b_1 - sqrt_d) / (2 * a_1), (-b_1 + sqrt_d) / (2 * a_1)), axis=-1)
+        found_points = lam[:, :, None] * a[:, None, :] + p_1[:, None, :]
+
+        # check that points are on the line
+        lo = np.minimum(p_1, p_2)[:, None, :]
+        hi = np.maximum(p_1, p_2)[:, None, :]
+        on_line = np.all((lo <= found_points) & (found_points <= hi), axis=-1) & (found_points[:, :, 2] <= z_cone)
+
+    first, second = on_line[:, 0], on_line[:, 1]
+    found_roots = np.where(D > 0, np.where(first & second, 2, (first | second).astype(int)), 1)
+    only_second = (D > 0) & ~first & second
+    found_points[only_second, 0] = found_points[only_second, 1]
+    roots[found] = found_roots
+    points[found] = found_points
+    return roots, points
 
 
 def cone_cross(p_1, p_2, alpha_cone=10.0, p_cone=np.array([0.0, 0.0, 0.0])):
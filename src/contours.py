@@ -0,0 +1,140 @@
+"""
+Chaining of slicing segments into contours
+"""
+from typing import List, Tuple
+
+import numpy as np
+
+TOLERANCE = 1e-6  # segment ends closer than it (after rounding to its grid) are the same point
+
+
+def chain_segments(segments, tolerance=TOLERANCE) -> Tuple[List[np.ndarray], List[bool]]:
+    """
+    Joins segments with common ends into polylines
+
+    segments - array-like with shape (n, 2, 3), order and direction of segments do not matter
+    tolerance - ends are joined when they are rounded to the same point of the grid with this step
+
+    Returns polylines (arrays of points with shape (k, 3)) and closed flags for them,
+    a closed polyline ends with its first point. Open polylines are chains which could not be closed:
+    holes in the mesh or branches at non-manifold points.
+    """
+    segments = np.asarray(segments, dtype=np.float64).reshape(-1, 2, 3)
+    segments = segments[np.all(np.isfinite(segments), axis=(1, 2))]  # nan points of degenerate triangles
+    ends = point_ids(segments.reshape(-1, 3), tolerance).reshape(-1, 2)
+    points = np.empty((ends.max() + 1 if len(ends) else 0, 3))
+    points[ends.ravel()] = segments.reshape(-1, 3)
+
+    ends = ends[ends[:, 0] != ends[:, 1]]  # segments shorter than tolerance
+    chains = _walk(ends, len(points))
+    return [points[chain] for chain in chains], [len(chain) > 2 and chain[0] == chain[-1] for chain in chains]
+
+
+def chain_loops(segments, tolerance=TOLERANCE):
+    """
+    Joins directed segments into closed loops with array operations instead of walking them point by point
+
+    segments - array-like with shape (n, 2, 3), a segment goes from its first point to the second,
+    e.g. segments of a layer of a closed mesh with consistently oriented triangles
+    tolerance - as in chain_segments
+
+    Returns points (m, 3) and offsets of loops, loop k is points[offsets[k]:offsets[k + 1]] and ends with
+    its first point. Returns None when segments are not loops (every point must start one segment and end one),
+    then chain_segments joins them.
+    """
+    segments = np.asarray(segments, dtype=np.float64).reshape(-1, 2, 3)
+    segments = segments[np.all(np.isfinite(segments), axis=(1, 2))]
+    ids = point_ids(segments.reshape(-1, 3), tolerance)
+    points = np.empty((ids.max() + 1 if len(ids) else 0, 3))
+    points[ids] = segments.reshape(-1, 3)
+    ends = ids.reshape(-1, 2)
+    ends = ends[ends[:, 0] != ends[:, 1]]
+    if len(ends) == 0:
+        return np.zeros((0, 3)), np.zeros(1, dtype=np.int64)
+
+    # points of loops are numbered again, the successor of a point is the end of its segment
+    nodes, ends = np.unique(ends, return_inverse=True)
+    ends = ends.reshape(-1, 2)
+    if len(ends) != len(nodes) or np.any(np.bincount(ends[:, 0], minlength=len(nodes)) != 1) or \
+            np.any(np.bincount(ends[:, 1], minlength=len(nodes)) != 1):
+        return None
+    successor = np.empty(len(nodes), dtype=np.int64)
+    successor[ends[:, 0]] = ends[:, 1]
+
+    # pointer jumping: after k steps label is the least point of 2^k points from it, jump is 2^k points ahead
+    steps = int(len(nodes)).bit_length()
+    label, jump = np.arange(len(nodes)), successor
+    for _ in range(steps):
+        label = np.minimum(label, label[jump])
+        jump = jump[jump]
+    # the same for the distance to the least point of the loop along it, which stops there
+    head = label == np.arange(len(nodes))
+    distance = (~head).astype(np.int64)
+    jump = np.where(head, np.arange(len(nodes)), successor)
+    for _ in range(steps):
+        distance = distance + distance[jump]
+        jump = jump[jump]
+    sizes = np.bincount(label, minlength=len(nodes))
+    order = np.lexsort(((sizes[label] - distance) % sizes[label], label))
+
+    loop_sizes = sizes[head]
+    offsets = np.concatenate(([0], np.cumsum(loop_sizes + 1)))
+    index = np.empty(offsets[-1], dtype=np.int64)
+    last = np.ones(offsets[-1], dtype=bool)
+    last[offsets[1:] - 1] = False
+    index[last] = order
+    index[offsets[1:] - 1] = index[offsets[:-1]]  # loops are closed
+    return points[nodes[index]], offsets
+
+
+def chain_paths(paths, tolerance=TOLERANCE):
+    """ chain_segments for segments of paths, e.g. a layer of cross_stl (paths of 2 or 3 points) """
+    return chain_segments([pair for path in paths for pair in zip(path, path[1:])], tolerance)
+
+
+def point_ids(points, tolerance=TOLERANCE):
+    """ the same number for points rounded to the same point of the grid, numbers are 0, 1, 2, ... """
+    keys = np.round(points / tolerance).astype(np.int64)
+    order = np.lexsort(keys.T[::-1])
+    keys = keys[order]
+    new = np.ones(len(keys), dtype=bool)
+    new[1:] = np.any(keys[1:] != keys[:-1], axis=1)
+    ids = np.empty(len(keys), dtype=np.int64)
+    ids[order] = np.cumsum(new) - 1
+    return ids
+
+
+def _walk(ends, points_count):
+    """ chains of point ids covering all segments once, segments are pairs of point ids """
+    flat = ends.ravel()
+    degree = np.bincount(flat, minlength=points_count)
+    offsets = np.concatenate(([0], np.cumsum(degree))).tolist()
+    incident = (np.argsort(flat, kind="stable") // 2).tolist()  # segments of the point
+    pairs = ends.tolist()
+    used = bytearray(len(pairs))
+    first_unused = offsets[:-1]  # all segments of the point before it are used
+
+    def next_segment(point):
+        i, end = first_unused[point], offsets[point + 1]
+        while i < end and used[incident[i]]:
+            i += 1
+        first_unused[point] = i
+        return incident[i] if i < end else -1
+
+    chains = []
+    # chains from points with odd degree are open, the rest are loops
+    starts = np.concatenate((np.flatnonzero(degree % 2 == 1), np.flatnonzero(degree % 2 == 0))).tolist()
+    for start in starts:
+        segment = next_segment(start)
+        while segment >= 0:
+            chain = [start]
+            point = start
+            while segment >= 0:
+                used[segment] = 1
+                a, b = pairs[segment]
+                point = b if a == point else a
+                chain.append(point)
+                segment = next_segment(point)
+            chains.append(chain)
+            segment = next_segment(start)
+    return chains
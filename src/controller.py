@@ -1,28 +1,50 @@
 import logging
 import os
-import subprocess
+import re
 import sys
+import time
 from functools import partial
 from pathlib import Path
-from shutil import copy2
+from shutil import copy2, which
 from typing import Dict, List
 
 import vtk
 from PyQt5 import QtCore
 from PyQt5.QtWidgets import QDesktopWidget
 
-from src import gui_utils, locales
-from src.cone_slicing import cross_stl, load_mesh
+from src import gui_utils, locales, planar_slicing, slice_cache
+from src.cone_slicing import cross_stl
+from src.contours import chain_paths
 from src.figure_editor import PlaneEditor, ConeEditor
-from src.gcode import GCode, Rotation, Point
+from src.gcode import GCode, GCodeStreamParser, Rotation, TOOLPATH_EXT, saveSidecar, sourceSignature, writeGCode
 from src.gui_utils import showErrorDialog, plane_tf, isfloat, Plane, Cone
 from src.settings import sett, save_settings
 
+LAYER_VIEW_DELAY = 15  # ms, slider moves during this time are shown at once
+GCODE_TAIL_INTERVAL = 50  # ms, how often the gcode file is read while the slicer writes it
+OUTPUT_IN_ERROR = 20  # last lines of the command output shown when it fails
+PERCENT_RE = re.compile(r"(\d+(?:\.\d+)?)\s*%")
+COUNT_RE = re.compile(r"\b(\d+)\s*/\s*(\d+)\b")
+
 
 class MainController:
     def __init__(self, view, model):
         self.view = view
         self.model = model
+        self.gcode_loader = None  # timer which feeds parts of the gcode file to the view
+        self.gcode_stream = None  # GCodeStream of the running slicer
+        self.gcode_copying = None  # BackgroundCall which copies a cached gcode file to the gcode file
+        self.wanted_gcode_copy = None  # the copying which is loaded when it is done, None if another file is opened
+        self.cone_slicing = None  # BackgroundCall of cross_stl
+        self.planar_slicing = None  # BackgroundCall of planar_slicing when goosli is not used
+        self.command_job = None  # CommandJob of the external slicer, analyzer or colorizer
+        self.slice_cache = slice_cache.fromSettings()  # None if results of slicing are not cached
+        self.layer_view_timer = QtCore.QTimer()  # coalesces slider moves
+        self.layer_view_timer.setSingleShot(True)
+        self.layer_view_timer.setInterval(LAYER_VIEW_DELAY)
+        self.layer_view_timer.timeout.connect(self.update_layer_view)
+        self.simplify_call = None  # simplifies paths of merged layers in another thread
+        self.gcode_writing = None
         self._connect_signals()
 
     def _connect_signals(self):
@@ -44,6 +66,7 @@ class MainController:
         self.view.save_gcode_button.clicked.connect(self.save_gcode_file)
         self.view.analyze_model_button.clicked.connect(self.analyze_model)
         self.view.color_model_button.clicked.connect(self.colorize_model)
+        self.view.cancel_job_button.clicked.connect(self.cancel_commands)
 
         # bottom panel
         self.view.add_plane_button.clicked.connect(self.add_splane)
@@ -80,8 +103,38 @@ class MainController:
         self.view.parameters_tooling.show()
 
     def change_layer_view(self):
+        # the scene is updated once per LAYER_VIEW_DELAY with the last slider value, not for every move
+        if not self.layer_view_timer.isActive():
+            self.layer_view_timer.start()
+
+    def update_layer_view(self):
         self.model.current_slider_value = self.view.change_layer_view(self.model.current_slider_value, self.model.gcode)
 
+    def simplify_layers(self):
+        # chunks are simplified one by one while the toolpath is shown, the next one after the previous is done
+        if self.simplify_call is not None and self.simplify_call.isRunning():
+            return
+        merged = self.view.merged
+        chunk = merged.unsimplified() if merged is not None else None
+        if chunk is None:
+            self.simplify_call = None
+            return
+
+        def done(result):
+            merged.setSimplified(chunk, *result)
+            self.view.reload_scene()
+
+        def finished():
+            call.wait()  # finished is emitted by the thread just before it ends
+            if chunk.lod_mapper is not None:  # the next chunk, unless this one is failed
+                self.simplify_layers()
+
+        call = BackgroundCall(partial(gui_utils.simplifyPaths, chunk.xyz, chunk.path_offsets, merged.lod_step))
+        call.done.connect(done)
+        call.finished.connect(finished)
+        self.simplify_call = call
+        call.start()
+
     def move_model(self):
         self.view.move_stl2()
 
@@ -101,18 +154,180 @@ class MainController:
             showErrorDialog("Error during file opening:" + str(e))
 
     def load_stl(self, filename, colorize=False):
+        self.stop_gcode_loading()
         if filename is None or filename == "":
             filename = self.model.opened_stl
-        stl_actor = gui_utils.createStlActorInOrigin(filename, colorize)
-        self.model.opened_stl = filename
+        start = time.perf_counter()
+        stl_actor, polydata = gui_utils.createStlActorInOrigin(filename, colorize)
+        self.model.set_stl(filename, polydata)
         self.view.load_stl(stl_actor)
-
-    def load_gcode(self, filename, is_from_stl):
-        gc = self.model.load_gcode(filename)
-        blocks = gui_utils.makeBlocks(gc.layers, gc.rotations, gc.lays2rots)
-        actors = gui_utils.wrapWithActors(blocks, gc.rotations, gc.lays2rots)
-
-        self.view.load_gcode(actors, is_from_stl, plane_tf(gc.rotations[0]))
+        self.view.show_stl_status(filename, polydata.GetNumberOfPolys(), polydata.GetNumberOfPoints(),
+                                  gui_utils.lodTriangles(stl_actor), time.perf_counter() - start)
+
+    def load_gcode(self, filename, is_from_stl, on_loaded=None):
+        # file is parsed part by part in the event loop, so the first layers are shown while the rest is read
+        self.stop_gcode_loading()
+        parts = self.model.stream_gcode(filename)
+        show_part = self.gcode_part_loader(is_from_stl)
+
+        def load_next_part():
+            try:
+                part = next(parts, None)
+            except (OSError, ValueError) as e:  # the file is read here, not in open_file
+                self.stop_gcode_loading()
+                showErrorDialog("Error during file opening:" + str(e))
+                return
+            if part is None:
+                self.stop_gcode_loading()
+                self.view.finish_gcode()
+                if on_loaded is not None:
+                    on_loaded()
+                return
+            show_part(part)
+
+        self.gcode_loader = QtCore.QTimer()
+        self.gcode_loader.timeout.connect(load_next_part)
+        self.gcode_loader.start(0)
+
+    def gcode_part_loader(self, is_from_stl):
+        """ function which shows the next part of gcode, the first part replaces the shown one """
+        is_first = True
+        merged = None
+        transforms = {}
+
+        def show_part(part):
+            nonlocal is_first, merged
+            if sett().common.merge_layers:
+                if merged is None:
+                    merged = gui_utils.MergedLayers(part.rotations)
+                actors = merged.append(part)
+            else:
+                blocks = gui_utils.makeBlocks(part.layers, part.rotations, part.lays2rots)
+                actors = gui_utils.wrapWithActors(blocks, part.rotations, part.lays2rots, False, transforms)
+            if is_first:
+                self.view.load_gcode(actors, is_from_stl, plane_tf(part.rotations[0]), merged, transforms)
+                is_first = False
+            else:
+                self.view.append_gcode(actors, self.model.gcode)
+            if merged is not None:
+                self.simplify_layers()
+
+        return show_part
+
+    def stream_sliced_gcode(self, cmd, gcode_file, from_stdout, on_done=None):
+        # layers are shown as soon as the slicer writes them to stdout or to the file
+        if self.command_job is not None:  # the previous one is not finished
+            return
+        self.stop_gcode_loading()
+        self.model.start_gcode(gcode_file)
+        show_part = self.gcode_part_loader(True)
+        try:
+            stream = GCodeStream(gcode_file, from_stdout)
+        except OSError as e:
+            showErrorDialog("Error during file opening:" + str(e))
+            return
+        self.gcode_stream = stream
+
+        def add_part(part):
+            self.model.gcode.extend(part)
+            show_part(part)
+
+        def failed(error):
+            # the slicer result can not be read, so there is no point to wait for it
+            if self.gcode_stream is stream:
+                self.gcode_stream = None
+                self.cancel_commands()
+            showErrorDialog("Error during file opening:" + error)
+
+        def finish():
+            if self.gcode_stream is not stream:  # another file is opened while slicing or reading failed
+                return
+            self.gcode_stream = None
+            if not stream.finish():
+                return
+            self.view.finish_gcode()
+            saveSidecar(self.model.gcode, gcode_file, sourceSignature(gcode_file))
+            if on_done is not None:
+                on_done()
+
+        stream.part.connect(add_part)
+        stream.failed.connect(failed)
+        job = self.run_commands([cmd], finish, from_stdout)
+        job.data.connect(stream.write)
+        job.failed.connect(stream.stop)
+        job.cancelled.connect(stream.stop)
+
+    def slicing_key(self, kind, files=(), **values):
+        # key of the slice cache for the opened model and saved settings, None if caching is off
+        if self.slice_cache is None or not os.path.isfile(self.model.opened_stl):
+            return None
+        return slice_cache.slicingKey(kind, self.model.opened_stl, files, **values)
+
+    def load_cached_gcode(self, key):
+        # the result of the same slicing is loaded instead of slicing again
+        cached = None if key is None else self.slice_cache.gcodeFile(key)
+        if cached is None:
+            return False
+        gcode_file = sett().slicing.gcode_file
+        toolpath = self.slice_cache.toolpathFile(key)
+
+        def copy():
+            # the file could be a few gigabytes, so it is copied in another thread
+            copy2(cached, gcode_file)
+            if toolpath is not None:  # copies keep modification time, so it is the up to date sidecar of the copy
+                copy2(toolpath, gcode_file + TOOLPATH_EXT)
+
+        def done(_):
+            if self.wanted_gcode_copy is copying:
+                self.wanted_gcode_copy = None
+                self.load_gcode(gcode_file, True)
+
+        def failed(error):
+            if self.wanted_gcode_copy is copying:
+                self.wanted_gcode_copy = None
+                showErrorDialog("Error during file opening:" + error)
+
+        def finished():
+            copying.wait()  # finished is emitted by the thread just before it ends
+            if self.gcode_copying is copying:
+                self.gcode_copying = None
+
+        self.stop_gcode_loading()
+        if self.gcode_copying is not None:  # the previous copy writes the same file
+            self.gcode_copying.wait()
+        copying = BackgroundCall(copy)
+        copying.done.connect(done)
+        copying.failed.connect(failed)
+        copying.finished.connect(finished)
+        self.gcode_copying = copying
+        self.wanted_gcode_copy = copying
+        copying.start()
+        return True
+
+    def load_sliced_gcode(self, key):
+        if key is not None:
+            self.slice_cache.putGCodeFile(key, sett().slicing.gcode_file)
+        self.load_gcode(sett().slicing.gcode_file, True, partial(self.cache_toolpath_file, key))
+
+    def cache_gcode_file(self, key):
+        # the gcode file and its sidecar toolpath file
+        if key is not None:
+            self.slice_cache.putGCodeFile(key, sett().slicing.gcode_file)
+            self.cache_toolpath_file(key)
+
+    def cache_toolpath_file(self, key):
+        toolpath = sett().slicing.gcode_file + TOOLPATH_EXT
+        if key is not None and os.path.exists(toolpath):
+            self.slice_cache.putToolpathFile(key, toolpath)
+
+    def stop_gcode_loading(self):
+        self.wanted_gcode_copy = None  # the copy is finished in the background but not loaded
+        if self.gcode_loader is not None:
+            self.gcode_loader.stop()
+            self.gcode_loader = None
+        if self.gcode_stream is not None:
+            self.gcode_stream.stop()
+            self.gcode_stream = None
 
     def slice_stl(self, slicing_type):
         if slicing_type == "vip" and len(self.model.splanes) == 0:
@@ -123,50 +338,190 @@ class MainController:
         save_splanes_to_file(self.model.splanes, s.slicing.splanes_file)
         self.save_settings(slicing_type)
 
-        call_command(s.slicing.cmd)
-
-        self.load_gcode(s.slicing.gcode_file, True)
+        if slicing_type in ("vip", "3axes") and self.builtin_slicing(slicing_type):
+            self.slice_builtin(slicing_type)
+            return
+        key = self.slicing_key("stl", [s.slicing.splanes_file])
+        if self.load_cached_gcode(key):
+            return
+        if s.slicing.gcode_stream in ("file", "stdout"):
+            self.stream_sliced_gcode(s.slicing.cmd, s.slicing.gcode_file, s.slicing.gcode_stream == "stdout",
+                                     partial(self.cache_gcode_file, key))
+        else:
+            job = self.run_commands([s.slicing.cmd], partial(self.load_sliced_gcode, key))
+            if job is not None and slicing_type == "3axes" and s.slicing.preview:
+                self.slice_builtin(slicing_type, job)
         # self.debugMe()
 
+    def builtin_slicing(self, slicing_type):
+        # planar_slicing is used instead of goosli when it is set so or, for "vip" only, goosli is not found:
+        # layers of "3axes" have no infill, so they replace goosli only when it is chosen explicitly
+        s = sett().slicing
+        engine = s.engine
+        if engine == "auto" and slicing_type == "vip":
+            program = s.cmd.split()[0] if s.cmd.split() else ""
+            return which(program) is None
+        return engine == "builtin"
+
+    def slice_builtin(self, slicing_type, preview_of=None):
+        # "vip" planes or "3axes" layers are sliced by planar_slicing,
+        # the preview of the running slicer job (preview_of) is shown until the job is done
+        self.stop_gcode_loading()
+        if self.planar_slicing is not None or self.model.stl_mesh is None:  # the previous one is not finished
+            return
+
+        planes = [p for p in self.model.splanes if isinstance(p, Plane)] if slicing_type == "vip" else []
+        stl_file = self.model.opened_stl
+        stl_mesh = self.model.stl_mesh
+        matrix = gui_utils.matrixArray(self.view.stlActor.GetUserTransform())  # the model as it is shown
+        key = self.slicing_key("planes" if planes else "layers", planes=[p.toFile() for p in planes],
+                               matrix=matrix.tolist())
+        cached = None if key is None else self.slice_cache.toolpath(key)
+        if cached is not None:
+            self.show_sliced_gcode(cached)
+            return
+        if planes:
+            self.planar_slicing = BackgroundCall(lambda: planar_slicing.slice_planes(stl_mesh.triangles(matrix),
+                                                                                     planes))
+        else:
+            self.planar_slicing = BackgroundCall(lambda: planar_slicing.slice_layers(stl_mesh.triangles(matrix)))
+        button = self.view.slice_vip_button if slicing_type == "vip" else self.view.slice3a_button
+        self.planar_slicing.done.connect(partial(self.load_planar_slices, stl_file, key, button, preview_of))
+        self.planar_slicing.failed.connect(partial(self.planar_slicing_failed, button))
+        button.setEnabled(False)
+        self.planar_slicing.start()
+
+    def planar_slicing_failed(self, button, error):
+        self.planar_slicing = None
+        button.setEnabled(True)
+        showErrorDialog(error)
+
+    def load_planar_slices(self, stl_file, key, button, preview_of, gcode):
+        self.planar_slicing = None
+        button.setEnabled(True)
+        if key is not None:
+            self.slice_cache.putToolpath(key, gcode)
+        if stl_file != self.model.opened_stl:  # another model is opened while slicing
+            return
+        if preview_of is not None and preview_of is not self.command_job:  # the slicer is already done
+            return
+        self.show_sliced_gcode(gcode, preview_of is not None)
+
+    def show_sliced_gcode(self, gcode, preview=False):
+        # the toolpath is not in a file, save_gcode_file writes it unless it is the preview
+        self.model.start_gcode("")
+        self.model.gcode = gcode
+        self.model.gcode_preview = preview
+        self.gcode_part_loader(True)(gcode)
+
     def slice_cone(self):
+        self.stop_gcode_loading()
         # print(self.model.splanes)
         self.save_settings("cone")
         if len(self.model.splanes) == 0 or not isinstance(self.model.splanes[0], Cone):
             showErrorDialog(self.view.locale.AddOneConeError)
             return
 
+        if self.cone_slicing is not None or self.model.stl_mesh is None:  # the previous one is not finished
+            return
+
         cone = self.model.splanes[0]
-        # slicing runs somewhere here
-        # print(f"slicing is performed for model {self.model.opened_stl}")
-        result = cross_stl(load_mesh(self.model.opened_stl),
-                           (cone.cone_angle, (cone.x, cone.y, cone.z)))
+        stl_file = self.model.opened_stl
+        stl_mesh = self.model.stl_mesh
+        matrix = gui_utils.matrixArray(self.view.stlActor.GetUserTransform())  # the model as it is shown
+        key = self.slicing_key("cone", cone=[cone.cone_angle, cone.x, cone.y, cone.z], matrix=matrix.tolist())
+        cached = None if key is None else self.slice_cache.toolpath(key)
+        if cached is not None:
+            self.show_cone_gcode(cached)
+            return
+        # slicing runs in another thread, the window stays responsive
+        self.cone_slicing = BackgroundCall(lambda: slice_cone_contours(stl_mesh.triangles(matrix),
+                                                                       (cone.cone_angle, (cone.x, cone.y, cone.z))))
+        self.cone_slicing.done.connect(partial(self.load_cone_slices, stl_file, key))
+        self.cone_slicing.failed.connect(self.cone_slicing_failed)
+        self.view.slice_cone_button.setEnabled(False)
+        self.cone_slicing.start()
+
+    def cone_slicing_failed(self, error):
+        self.cone_slicing = None
+        self.view.slice_cone_button.setEnabled(True)
+        showErrorDialog(error)
+
+    def load_cone_slices(self, stl_file, key, result):
+        self.cone_slicing = None
+        self.view.slice_cone_button.setEnabled(True)
+        if stl_file != self.model.opened_stl:  # another model is opened while slicing
+            return
         # print("result", result)
 
-        new_res = []
+        open_chains = sum(closed.count(False) for _, closed in result)
+        if open_chains:
+            logging.info("cone slicing: %d contours are not closed", open_chains)
 
-        for layer in result:
-            new_layer = []
-            for [point1, point2] in layer:
-                new_layer.append([Point(*point1, 0, 0), Point(*point2, 0, 0)])
-            new_res.append(new_layer)
+        # result is layer-separated list of contours
+        gcode = GCode.fromPaths([paths for paths, _ in result], [Rotation(0, 0)], [0] * len(result))
+        if key is not None:
+            self.slice_cache.putToolpath(key, gcode)
+        self.show_cone_gcode(gcode)
 
-        # result is layer-separated list of segments
-        gcode = GCode(new_res, [Rotation(0, 0)], [0] * len(new_res))
+    def show_cone_gcode(self, gcode):
         self.model.gcode = gcode
+        self.model.opened_gcode = ""  # it is written to a file by save_gcode_file
+        self.model.gcode_preview = False
+        if sett().common.merge_layers:
+            merged = gui_utils.MergedLayers(gcode.rotations)
+            self.view.load_gcode(merged.append(gcode), True, 0, merged)
+            self.simplify_layers()
+            return
         blocks = gui_utils.makeBlocks(gcode.layers, gcode.rotations, gcode.lays2rots)
-        actors = gui_utils.wrapWithActors(blocks, gcode.rotations, gcode.lays2rots)
+        transforms = {}
+        actors = gui_utils.wrapWithActors(blocks, gcode.rotations, gcode.lays2rots, True, transforms)
 
-        self.view.load_gcode(actors, True, 0)
+        self.view.load_gcode(actors, True, 0, transforms=transforms)
 
     def slice_smooth(self, flat5d):
         s = sett()
         s.slicing.flat_5d = flat5d
         self.save_settings("smooth")
 
+        key = self.slicing_key("smooth")
+        if self.load_cached_gcode(key):
+            return
         ft_cmd = s.slicing.ftetwild_cmd.replace("sett.slicing.stl_file", s.slicing.stl_file)
-        call_command(ft_cmd)
-        call_command(s.slicing.smooth_cmd)
-        self.load_gcode(s.slicing.gcode_file, True)
+        self.run_commands([ft_cmd, s.slicing.smooth_cmd], partial(self.load_sliced_gcode, key))
+
+    def run_commands(self, cmds, on_done, data_output=False):
+        # commands run in the event loop, on_done is called after all of them succeed
+        if self.command_job is not None:  # the previous one is not finished
+            return None
+        self.command_job = CommandJob(cmds, data_output)
+        self.command_job.output.connect(self.view.append_log)
+        self.command_job.progress.connect(self.view.set_job_progress)
+        self.command_job.done.connect(partial(self.commands_done, on_done))
+        self.command_job.failed.connect(self.commands_failed)
+        self.command_job.cancelled.connect(self.commands_cancelled)
+        self.view.start_job()
+        self.command_job.start()
+        return self.command_job
+
+    def cancel_commands(self):
+        if self.command_job is not None:
+            self.command_job.cancel()
+
+    def commands_done(self, on_done):
+        self.command_job = None
+        self.view.finish_job()
+        on_done()
+
+    def commands_failed(self, error):
+        self.command_job = None
+        self.view.finish_job()
+        showErrorDialog(error)
+
+    def commands_cancelled(self):
+        self.command_job = None
+        self.view.finish_job()
+        self.view.append_log(self.view.locale.Cancelled)
 
     def save_settings(self, slicing_type):
         s = sett()
@@ -203,29 +558,63 @@ class MainController:
         save_settings()
 
     def save_gcode_file(self):
+        if self.model.gcode_preview:  # the slicer failed or was cancelled, contours are not a print
+            showErrorDialog(self.view.locale.PreviewSaveError)
+            return
         try:
             name = str(self.view.save_gcode_dialog())
             if name != "":
                 if not name.endswith(".gcode"):
                     name += ".gcode"
-                copy2(self.model.opened_gcode, name)
+                if self.model.opened_gcode:
+                    copy2(self.model.opened_gcode, name)
+                elif self.model.gcode is not None:  # e.g. of cone slicing, it is not in a file yet
+                    self.write_gcode_file(name)
         except IOError as e:
             showErrorDialog("Error during file saving:" + str(e))
 
+    def write_gcode_file(self, name):
+        # the file is written in another thread by chunks, it could be a few gigabytes
+        if self.gcode_writing is not None:  # the previous one is not finished
+            return
+        s = sett()
+        gcode = self.model.gcode
+
+        def done(_):
+            if self.model.gcode is gcode:  # the next save copies the file
+                self.model.opened_gcode = name
+
+        def finished():
+            self.gcode_writing.wait()  # finished is emitted by the thread just before it ends
+            self.gcode_writing = None
+
+        self.gcode_writing = BackgroundCall(partial(writeGCode, gcode, name, s.slicing, s.hardware))
+        self.gcode_writing.done.connect(done)
+        self.gcode_writing.failed.connect(lambda error: showErrorDialog("Error during file saving:" + error))
+        self.gcode_writing.finished.connect(finished)
+        self.gcode_writing.start()
+
     def analyze_model(self):
         self.save_settings("vip")
 
         s = sett()
-        call_command(s.analyzer.cmd)
-        self.model.planes = gui_utils.read_planes(s.analyzer.result)
+        self.run_commands([s.analyzer.cmd], self.load_analyzed_model)
+
+    def load_analyzed_model(self):
+        self.model.planes = gui_utils.read_planes(sett().analyzer.result)
         self.load_stl(self.model.opened_stl)
 
     def colorize_model(self):
         self.save_settings("vip")
 
         s = sett()
-        call_command(s.colorizer.cmd)
-        self.load_stl(self.model.opened_stl, colorize=True)
+        self.run_commands([s.colorizer.cmd], self.load_colorized_stl)
+
+    def load_colorized_stl(self):
+        try:
+            self.load_stl(self.model.opened_stl, colorize=True)
+        except (OSError, ValueError) as e:  # no result or it is made for another model
+            showErrorDialog(str(e))
 
     # ######################bottom panel
 
@@ -272,21 +661,237 @@ class MainController:
     #     self.reloadScene()
 
 
-def call_command(cmd):
-    try:
-        cmds = cmd.split(" ")
-        # print(cmds)
-        subprocess.check_output(cmds, stderr=subprocess.STDOUT)
-    except subprocess.CalledProcessError as er:
-        print("Error:", sys.exc_info())
-        print("Error2:", er.output)
-        logging.error(str(sys.exc_info()))
-        gui_utils.showErrorDialog(repr(er.output))
-    except:
-        print("Error:", sys.exc_info())
-        logging.error(str(sys.exc_info()))
-        # print("Error2:", er.output)
-        gui_utils.showErrorDialog(str(sys.exc_info()))
+def slice_cone_contours(triangles, cone):
+    """ contours of cross_stl layers: (paths, closed flags) for every layer """
+    return [chain_paths(layer) for layer in cross_stl(triangles, cone)]
+
+
+class BackgroundCall(QtCore.QThread):
+    """ calls func in another thread, its result or error message is emitted in the Qt thread """
+    done = QtCore.pyqtSignal(object)
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, func):
+        super().__init__()
+        self.func = func
+
+    def run(self):
+        try:
+            result = self.func()
+        except:
+            print("Error:", sys.exc_info())
+            logging.error(str(sys.exc_info()))
+            self.failed.emit(str(sys.exc_info()[1]))
+            return
+        self.done.emit(result)
+
+
+class CommandJob(QtCore.QObject):
+    """
+    runs external commands one by one in the Qt event loop (QProcess),
+    their output is emitted line by line and progress markers in it are emitted as percents of all commands.
+    With data_output stdout of the commands is emitted as it is by data and only stderr is the output.
+    """
+    output = QtCore.pyqtSignal(str)
+    data = QtCore.pyqtSignal(bytes)
+    progress = QtCore.pyqtSignal(int)
+    done = QtCore.pyqtSignal()
+    failed = QtCore.pyqtSignal(str)
+    cancelled = QtCore.pyqtSignal()
+
+    def __init__(self, cmds, data_output=False):
+        super().__init__()
+        self.cmds = list(cmds)
+        self.data_output = data_output
+        self.current = -1
+        self.process = None
+        self.is_cancelled = False
+        self.tail = b""  # the last line while it is not finished
+        self.last_lines = []  # for the error message
+
+    def start(self):
+        self._start_next()
+
+    def cancel(self):
+        if self.process is None:
+            return
+        self.is_cancelled = True
+        self.process.kill()  # finished is emitted after it
+
+    def is_running(self):
+        return self.process is not None
+
+    def _start_next(self):
+        self.current += 1
+        if self.current == len(self.cmds):
+            self.progress.emit(100)
+            self._emit_later(self.done)
+            return
+        self.progress.emit(self.current * 100 // len(self.cmds))
+        cmds = self.cmds[self.current].split(" ")
+        self.output.emit("> " + self.cmds[self.current])
+        self.process = QtCore.QProcess(self)  # owned by the job, it is deleted later, not in its own signal
+        if self.data_output:
+            self.process.readyReadStandardOutput.connect(self._read_data)
+            self.process.readyReadStandardError.connect(self._read_output)
+        else:
+            self.process.setProcessChannelMode(QtCore.QProcess.MergedChannels)
+            self.process.readyReadStandardOutput.connect(self._read_output)
+        self.process.finished.connect(self._finished)
+        self.process.errorOccurred.connect(self._error)
+        self.process.start(cmds[0], cmds[1:])
+
+    def _read_data(self):
+        data = bytes(self.process.readAllStandardOutput())
+        if data:
+            self.data.emit(data)
+
+    def _read_output(self):
+        output = self.process.readAllStandardError() if self.data_output else self.process.readAllStandardOutput()
+        lines = (self.tail + bytes(output)).replace(b"\r", b"\n").split(b"\n")
+        self.tail = lines.pop()
+        for line in lines:
+            self._emit_line(line)
+
+    def _emit_line(self, line):
+        line = line.decode(errors="replace").rstrip()
+        if not line:
+            return
+        self.last_lines = (self.last_lines + [line])[-OUTPUT_IN_ERROR:]
+        self.output.emit(line)
+        fraction = parse_progress(line)
+        if fraction is not None:
+            self.progress.emit(int((self.current + fraction) * 100 / len(self.cmds)))
+
+    def _emit_later(self, signal, *args):
+        # receivers may drop the job, it is not deleted while the signal of its process is handled
+        QtCore.QTimer.singleShot(0, lambda: signal.emit(*args))
+
+    def _release_process(self):
+        self.process.deleteLater()
+        self.process = None
+
+    def _error(self, error):
+        if error == QtCore.QProcess.FailedToStart:  # finished is not emitted
+            self._release_process()
+            message = "Failed to start: " + self.cmds[self.current]
+            logging.error(message)
+            self._emit_later(self.failed, message)
+
+    def _finished(self, exit_code, exit_status):
+        if self.data_output:
+            self._read_data()
+        self._read_output()
+        if self.tail:
+            self._emit_line(self.tail)
+            self.tail = b""
+        self._release_process()
+        if self.is_cancelled:
+            self._emit_later(self.cancelled)
+        elif exit_status != QtCore.QProcess.NormalExit or exit_code != 0:
+            # the rest of the commands and loading of the results are skipped, the results are not updated
+            message = "%s\nexit code %d\n%s" % (self.cmds[self.current], exit_code, "\n".join(self.last_lines))
+            print("Error:", message)
+            logging.error(message)
+            self._emit_later(self.failed, message)
+        else:
+            self.last_lines = []
+            self._start_next()
+
+
+class GCodeStream(QtCore.QObject):
+    """
+    parses gcode while the slicer writes it: to stdout (pass its data to write, it is saved to the file as well)
+    or to the file (it is read as it grows), parts are emitted as soon as their layers are finished.
+    Errors of reading and parsing stop it and are emitted by failed, the file is opened in __init__ when it is
+    written from stdout, so it raises OSError then.
+    """
+    part = QtCore.pyqtSignal(object)
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, filename, from_stdout):
+        super().__init__()
+        self.parser = GCodeStreamParser()
+        self.filename = filename
+        self.from_stdout = from_stdout
+        self.file = None
+        self.tail_timer = None
+        self.error = None
+        if from_stdout:
+            self.file = open(filename, "wb")
+        else:
+            if os.path.exists(filename):  # the previous result is not read as the new one
+                os.remove(filename)
+            self.tail_timer = QtCore.QTimer()
+            self.tail_timer.timeout.connect(self.read_file)
+            self.tail_timer.start(GCODE_TAIL_INTERVAL)
+
+    def write(self, data):
+        if self.file is None:  # stopped
+            return
+        try:
+            self.file.write(data)
+            self._feed(data)
+        except (OSError, ValueError) as e:
+            self._fail(e)
+
+    def read_file(self):
+        if self.error is not None:
+            return
+        try:
+            if self.file is None:
+                if not os.path.exists(self.filename):  # the slicer has not created it yet
+                    return
+                self.file = open(self.filename, "rb")
+            self._feed(self.file.read())
+        except (OSError, ValueError) as e:
+            self._fail(e)
+
+    def finish(self):
+        """ emits the rest of gcode, call it after the slicer exits, returns False if the stream failed """
+        if not self.from_stdout:
+            self.read_file()
+        self.stop()
+        if self.error is not None:
+            return False
+        try:
+            self.part.emit(self.parser.finish())
+        except ValueError as e:
+            self._fail(e)
+            return False
+        return True
+
+    def stop(self):
+        if self.tail_timer is not None:
+            self.tail_timer.stop()
+            self.tail_timer = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _fail(self, error):
+        self.stop()
+        if self.error is None:
+            self.error = str(error)
+            self.failed.emit(self.error)
+
+    def _feed(self, data):
+        part = self.parser.feed(data)
+        if part is not None and part.layersCount() > 0:
+            self.part.emit(part)
+
+
+def parse_progress(line):
+    """ fraction of the work from "42%", "42.5 %" or "3/10" (the last one in the line), None if there is none """
+    percents = PERCENT_RE.findall(line)
+    if percents:
+        return min(float(percents[-1]), 100) / 100
+    counts = COUNT_RE.findall(line)
+    if counts:
+        done, total = map(int, counts[-1])
+        if 0 < total and done <= total:
+            return done / total
+    return None
 
 
 def save_splanes_to_file(splanes, filename):
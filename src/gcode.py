@@ -1,15 +1,139 @@
+import hashlib
+import json
+import logging
+import os
+import struct
+from functools import partial
 from typing import List
 
+import numpy as np
+
 from src import gui_utils
 import vtk
 
 
+POINT_DTYPE = np.float32  # precision of stored coordinates, vtkPoints keeps floats anyway
+
+
 class GCode:
+    """
+    Toolpath stored in columns (CSR style) instead of Point objects:
+    points - (n, 5) array of x, y, z, a, b of all vertices,
+    path_offsets - start of each path in points, the last item is n,
+    layer_offsets - start of each layer in path_offsets, the last item is the number of paths.
+    layers is a list-like view which creates Points on demand.
+    """
+
     def __init__(self, layers, rotations, lays2rots):
-        self.layers: List[List[Point]] = layers
+        points, path_offsets, layer_offsets = packLayers(layers)
+        self.setArrays(points, path_offsets, layer_offsets)
         self.rotations: List[Rotation] = rotations
         self.lays2rots = lays2rots
 
+    @classmethod
+    def fromArrays(cls, points, path_offsets, layer_offsets, rotations, lays2rots):
+        gc = cls.__new__(cls)
+        gc.setArrays(points, path_offsets, layer_offsets)
+        gc.rotations = rotations
+        gc.lays2rots = lays2rots
+        return gc
+
+    @classmethod
+    def fromPaths(cls, layers, rotations, lays2rots):
+        """ layers are lists of paths, a path is an array of points with x, y, z (a = b = 0) or x, y, z, a, b """
+        paths = [path for layer in layers for path in layer]
+        sizes = [len(path) for path in paths]
+        points = np.zeros((sum(sizes), 5), dtype=POINT_DTYPE)
+        if paths:
+            xyzab = np.concatenate([np.asarray(path).reshape(len(path), -1) for path in paths])
+            points[:, :xyzab.shape[1]] = xyzab
+        path_offsets = np.concatenate(([0], np.cumsum(sizes, dtype=np.int64)))
+        layer_offsets = np.concatenate(([0], np.cumsum([len(layer) for layer in layers], dtype=np.int64)))
+        return cls.fromArrays(points, path_offsets, layer_offsets, rotations, lays2rots)
+
+    def setArrays(self, points, path_offsets, layer_offsets):
+        self.points = np.ascontiguousarray(points, dtype=POINT_DTYPE).reshape(-1, 5)
+        self.path_offsets = np.asarray(path_offsets, dtype=np.int64)
+        self.layer_offsets = np.asarray(layer_offsets, dtype=np.int64)
+        self._buffers = None  # storage with spare capacity for extend()
+
+    def extend(self, other):
+        """
+        Appends layers of other, which is the next part of the same toolpath (see streamGCode):
+        rotations are shared, lays2rots are indices in them. Amortized O(len(other)).
+        """
+        if self._buffers is None:
+            self._buffers = [self.points, self.path_offsets, self.layer_offsets]
+        sizes = [len(self.points), len(self.path_offsets), len(self.layer_offsets)]
+        added = [other.points, other.path_offsets[1:] + sizes[0], other.layer_offsets[1:] + sizes[1] - 1]
+        for i in range(3):
+            buf = self._buffers[i]
+            if len(buf) < sizes[i] + len(added[i]):
+                grown = np.empty((max(2 * len(buf), sizes[i] + len(added[i])),) + buf.shape[1:], dtype=buf.dtype)
+                grown[:sizes[i]] = buf[:sizes[i]]
+                self._buffers[i] = buf = grown
+            buf[sizes[i]:sizes[i] + len(added[i])] = added[i]
+        self.points, self.path_offsets, self.layer_offsets = (
+            buf[:size + len(add)] for buf, size, add in zip(self._buffers, sizes, added))
+        self.rotations = other.rotations
+        self.lays2rots.extend(other.lays2rots)
+
+    @property
+    def layers(self):
+        return LayersView(self)
+
+    def layersCount(self):
+        return len(self.layer_offsets) - 1
+
+    def layerSlice(self, start, stop=None):
+        """
+        Points and path offsets of layers [start, stop) without copying.
+        Offsets are indices in self.points: subtract offsets[0] to index the returned points.
+        """
+        if stop is None:
+            stop = start + 1
+        offsets = self.path_offsets[self.layer_offsets[start]:self.layer_offsets[stop] + 1]
+        return self.points[offsets[0]:offsets[-1]], offsets
+
+
+class LayersView:
+    """ read only List[List[List[Point]]] over GCode columns, Points of a layer are created when it is taken """
+
+    def __init__(self, gcode):
+        self.gcode = gcode
+
+    def __len__(self):
+        return self.gcode.layersCount()
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("layer index out of range")
+        points, offsets = self.gcode.layerSlice(i)
+        offsets = offsets - offsets[0]
+        values = points.tolist()
+        return [[Point(*v) for v in values[offsets[k]:offsets[k + 1]]] for k in range(len(offsets) - 1)]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def packLayers(layers):
+    """ converts List[List[List[Point]]] to columns of GCode """
+    coords = []
+    path_offsets = [0]
+    layer_offsets = [0]
+    for layer in layers:
+        for path in layer:
+            coords.extend((p.x, p.y, p.z, p.a, p.b) for p in path)
+            path_offsets.append(len(coords))
+        layer_offsets.append(len(path_offsets) - 1)
+    return np.array(coords, dtype=POINT_DTYPE).reshape(-1, 5), path_offsets, layer_offsets
+
 
 class Rotation:
     def __init__(self, x, z):
@@ -32,7 +156,7 @@ class Point:
         cur = [self.x, self.y, self.z]
         if self.a == 0:
             return cur
-        tf = gui_utils.prepareTransform(Rotation(self.a, self.b), rot)
+        tf = gui_utils.cachedTransform(Rotation(self.a, self.b), rot)
         res = tf.TransformPoint(cur)
         return res
 
@@ -74,7 +198,10 @@ def parseRotation(args):
     return e
 
 
-def readGCode(filename):
+def readGCode(filename, fast=False):
+    if fast:  # bulk numpy tokenizer, see parseGCodeFast
+        with open(filename, "rb") as f:
+            return parseGCodeFast(f.read())
     with open(filename) as f:
         lines = [line.strip() for line in f]
     return parseGCode(lines)
@@ -164,3 +291,537 @@ def parseGCode(lines):
     layers.append(layer)  # add dummy layer for back rotations
     lays2rots.append(len(rotations) - 1)
     return GCode(layers, rotations, lays2rots)
+
+
+_WHITESPACES = b" \t\r\x0b\x0c"
+_AXES = b"XYZABE"  # columns of parsed words, E is used only by rotations
+_CHUNK = 1 << 20  # words converted at once, bounds temporary memory
+_STREAM_CHUNK = 1 << 20  # bytes read at once by streamGCode
+_LAYER_SPLIT = b"\n;LAYER:"  # the file is split before layer markers, so parts could be parsed separately
+
+
+def parseGCodeFast(text):
+    """
+    The same as parseGCode, but tokenizes the whole text at once with numpy instead of walking line by line.
+    Only per-layer bookkeeping (rotations) is done in python, so it is much faster on big files
+    and no Point objects are created.
+
+    text - bytes or str of the whole file or list of lines
+    """
+    return GCode.fromArrays(*parseGCodeArrays(text))
+
+
+class ParserState:
+    """ everything parseGCodeArrays needs to continue parsing from a ;LAYER: line in the middle of the file """
+
+    def __init__(self):
+        self.position = np.zeros(5)  # x, y, z, a, b
+        self.relative = False
+        self.tool = 0
+        self.rotations = [Rotation(0, 0)]
+        self.ended = False  # ;End is found, the rest of the file should be skipped
+
+
+def parseGCodeArrays(text, state=None, finish=True):
+    """
+    Parses gcode into columns: points - (n, 5) array of x, y, z, a, b,
+    path_offsets - start of each path in points (CSR style, last item is n),
+    layer_offsets - start of each layer in path_offsets (last item is the number of paths).
+    Rotations and lays2rots are the same as in GCode.
+
+    state - ParserState to continue from (it is updated), text must start at a ;LAYER: line then
+    finish - add dummy layer at the end, False for all parts of the file except the last one
+    """
+    if state is None:
+        state = ParserState()
+    if isinstance(text, (list, tuple)):
+        text = "\n".join(text)
+    if isinstance(text, str):
+        text = text.encode()
+    buf = np.frombuffer(text, dtype=np.uint8)
+
+    # lines: [first, last) are bounds of the stripped line
+    newlines = np.flatnonzero(buf == ord("\n"))
+    first = np.concatenate(([0], newlines + 1))
+    last = np.concatenate((newlines, [len(buf)]))
+    _stripLines(buf, first, last)
+
+    # the End marker stops parsing, everything after it is ignored
+    end_lines = np.flatnonzero(_startsWith(buf, first, last, b";End"))
+    if len(end_lines) > 0:
+        buf = buf[:first[end_lines[0]]]  # words are searched in the whole buffer
+        first, last = first[:end_lines[0]], last[:end_lines[0]]
+        state.ended = True
+
+    length = last - first
+    c0, c1, c2, c3 = (_charAt(buf, first + i, last) for i in range(4))
+    space = ord(" ")
+    is_g0 = (c0 == ord("G")) & (c1 == ord("0")) & ((length == 2) | (c2 == space))
+    is_g1 = (c0 == ord("G")) & (c1 == ord("1")) & ((length == 2) | (c2 == space))
+    is_g90 = (c0 == ord("G")) & (c1 == ord("9")) & (c2 == ord("0")) & ((length == 3) | (c3 == space))
+    is_g91 = (c0 == ord("G")) & (c1 == ord("9")) & (c2 == ord("1")) & ((length == 3) | (c3 == space))
+    is_tool = (length == 2) & (c0 == ord("T")) & (c1 >= ord("0")) & (c1 <= ord("2"))
+    is_layer = _startsWith(buf, first, last, b";LAYER:")
+
+    # selected tool and positioning mode are the last ones seen before the line
+    tool = _fillForward(is_tool, c1.astype(np.int64) - ord("0"), state.tool)
+    relative = _fillForward(is_g90 | is_g91, is_g91, state.relative)
+
+    is_move = is_g0 | (is_g1 & (tool == 0))
+    is_rot = is_g1 & (tool != 0)
+    move_lines = np.flatnonzero(is_move)
+    rot_lines = np.flatnonzero(is_rot)
+
+    values, given = _parseWords(buf, first, last, is_move | is_rot, is_move)
+    moves = np.zeros((len(move_lines), 5))
+    for axis in range(5):
+        moves[:, axis] = _resolveAxis(values[axis][move_lines], given[axis][move_lines], relative[move_lines],
+                                      state.position[axis])
+    rot_values = np.where(given[5][rot_lines], values[5][rot_lines], 0.0)
+
+    # every layer marker and rotation finishes the layer and starts a new path from the current position,
+    # the last (fake) one is the finishLayer() after the loop
+    fin_lines = np.flatnonzero(is_layer | is_rot)
+    fin_lines = np.concatenate((fin_lines, [len(first)]))
+    prev_move = np.searchsorted(move_lines, fin_lines)  # index in moves shifted by the starting point
+    fin_points = np.concatenate((state.position[None], moves))[prev_move]
+
+    # merge moves and finishes into one stream of vertices ordered by line
+    n_moves, n_fins = len(move_lines), len(fin_lines)
+    move_pos = np.arange(n_moves) + np.searchsorted(fin_lines, move_lines)
+    fin_pos = np.arange(n_fins) + np.searchsorted(move_lines, fin_lines)
+    vertices = np.empty((n_moves + n_fins, 5))
+    vertices[move_pos] = moves
+    vertices[fin_pos] = fin_points
+    starts_path = np.zeros(len(vertices), dtype=bool)
+    starts_path[move_pos] = is_g0[move_lines]
+    starts_path[fin_pos] = True
+    group = np.zeros(len(vertices), dtype=np.int64)  # index of finish which closes the vertex layer
+    group[fin_pos[:-1]] = 1
+    group = np.cumsum(group)
+
+    # paths with less than two points are skipped
+    path_starts = np.flatnonzero(starts_path)
+    if len(path_starts) == 0 or path_starts[0] != 0:
+        path_starts = np.concatenate(([0], path_starts))
+    path_ends = np.concatenate((path_starts[1:], [len(vertices)]))
+    keep = path_ends - path_starts > 1
+    path_starts, path_ends = path_starts[keep], path_ends[keep]
+    path_groups = group[path_starts]
+
+    # vertices of dropped paths are removed, offsets are recalculated
+    lengths = path_ends - path_starts
+    path_offsets = np.concatenate(([0], np.cumsum(lengths)))
+    take = np.repeat(path_starts - path_offsets[:-1], lengths) + np.arange(path_offsets[-1])
+    points = vertices[take]
+
+    group_paths = np.bincount(path_groups, minlength=n_fins)
+    group_offsets = np.concatenate(([0], np.cumsum(group_paths)))
+
+    rotations = state.rotations
+    lays2rots = []
+    layer_offsets = [0]
+    rot_idx = np.searchsorted(fin_lines, rot_lines)
+    fin_rot = np.full(n_fins, -1)
+    fin_rot[rot_idx] = np.arange(len(rot_lines))
+    for g in range(n_fins):
+        if group_paths[g] > 0:
+            layer_offsets.append(group_offsets[g + 1])
+            # kept as parseGCode does it, so both parsers give the same rotations: a layer which ends with A != 0
+            # adds a rotation of A and B of its last point, although the bed is rotated only by T1/T2 moves
+            if fin_points[g][3] != 0:
+                last_point = points[path_offsets[group_offsets[g + 1]] - 1]
+                rotations.append(Rotation(float(last_point[3]), float(last_point[4])))
+            lays2rots.append(len(rotations) - 1)
+        r = fin_rot[g]
+        if r >= 0:
+            if tool[rot_lines[r]] == 1:  # rotate
+                rotations.append(Rotation(rotations[-1].x_rot, float(rot_values[r])))
+            else:  # inclines
+                rotations.append(Rotation(float(rot_values[r]), rotations[-1].z_rot))
+
+    state.position = fin_points[-1]
+    if len(first) > 0:
+        state.tool, state.relative = int(tool[-1]), bool(relative[-1])
+    if finish:
+        layer_offsets.append(layer_offsets[-1])  # add dummy layer for back rotations
+        lays2rots.append(len(rotations) - 1)
+    return points, path_offsets, np.array(layer_offsets), rotations, lays2rots
+
+
+class GCodeStreamParser:
+    """
+    Incremental parseGCodeFast: feed() it with the next bytes of the file (or pipe),
+    it returns GCode with the layers finished so far. All returned parts share one rotations list.
+    """
+
+    def __init__(self):
+        self.state = ParserState()
+        self._buf = bytearray()
+
+    @property
+    def ended(self):
+        return self.state.ended
+
+    def feed(self, data):
+        """ returns GCode with new layers or None if no layer is finished yet """
+        if self.state.ended:
+            return None
+        searched = max(0, len(self._buf) - len(_LAYER_SPLIT))
+        self._buf.extend(data)
+        split = self._buf.rfind(_LAYER_SPLIT, searched)
+        if split < 0:
+            return None
+        text = bytes(self._buf[:split + 1])
+        del self._buf[:split + 1]
+        return GCode.fromArrays(*parseGCodeArrays(text, self.state, False))
+
+    def finish(self):
+        """ parses the rest of data, the result ends with the dummy layer """
+        text = b"" if self.state.ended else bytes(self._buf)
+        self._buf = bytearray()
+        return GCode.fromArrays(*parseGCodeArrays(text, self.state, True))
+
+
+def streamGCode(filename, chunk_size=_STREAM_CHUNK):
+    """
+    Reads and parses gcode file part by part, yields GCode parts as soon as their layers are finished.
+    Joined with GCode.extend they are the same as readGCode(filename).
+    """
+    parser = GCodeStreamParser()
+    with open(filename, "rb") as f:
+        for data in iter(partial(f.read, chunk_size), b""):
+            part = parser.feed(data)
+            if part is not None and part.layersCount() > 0:
+                yield part
+            if parser.ended:
+                break
+    yield parser.finish()
+
+
+TOOLPATH_EXT = ".toolpath"  # parsed GCode saved by saveToolpath, also the sidecar of a gcode file
+_TOOLPATH_MAGIC = b"SPYCERTP"
+_TOOLPATH_VERSION = 1
+_TOOLPATH_ALIGN = 64
+_TOOLPATH_ARRAYS = ["points", "path_offsets", "layer_offsets", "lays2rots"]
+_SIGNATURE_SAMPLE = 1 << 20  # bytes from the start and from the end of the source hashed for its signature
+_PART_POINTS = 1 << 18  # points in a part of splitLayers
+_WRITE_POINTS = 1 << 16  # moves formatted at once by gcodeChunks
+_WRITE_BUFFER = 1 << 22  # bytes of the file buffer of writeGCode
+_DIGITS4 = np.frombuffer(b"".join(b"%04d" % i for i in range(10000)), dtype=np.uint32)  # chars of 0000-9999
+_POWERS10 = 10 ** np.arange(1, 19, dtype=np.int64)  # numbers less than 10^k have at most k digits
+
+
+def saveToolpath(gc, filename, source=None):
+    """
+    Saves arrays of GCode in a file which loadToolpath maps to memory without parsing:
+    a json header with rotations, source signature and array positions, then raw aligned arrays.
+    source - signature (see sourceSignature) of the gcode file the toolpath is parsed from.
+    """
+    arrays = [gc.points, gc.path_offsets, gc.layer_offsets, np.asarray(gc.lays2rots, dtype=np.int64)]
+    header = {"rotations": [[r.x_rot, r.z_rot] for r in gc.rotations], "source": source, "arrays": {}}
+    offset = 0
+    for name, arr in zip(_TOOLPATH_ARRAYS, arrays):
+        header["arrays"][name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+        offset += -(-arr.nbytes // _TOOLPATH_ALIGN) * _TOOLPATH_ALIGN
+    text = json.dumps(header).encode()
+    start = -(-(len(_TOOLPATH_MAGIC) + 8 + len(text)) // _TOOLPATH_ALIGN) * _TOOLPATH_ALIGN
+    with open(filename, "wb") as f:
+        f.write(_TOOLPATH_MAGIC + struct.pack("<II", _TOOLPATH_VERSION, len(text)) + text)
+        for name, arr in zip(_TOOLPATH_ARRAYS, arrays):
+            f.seek(start + header["arrays"][name]["offset"])
+            f.write(np.ascontiguousarray(arr).tobytes())
+        f.truncate(start + offset)
+
+
+def loadToolpath(filename, source=None):
+    """
+    GCode saved by saveToolpath, its arrays are mapped to memory, pages are read when they are used.
+    Raises ValueError if the file is broken or it is saved for another source signature.
+    """
+    with open(filename, "rb") as f:
+        head = f.read(len(_TOOLPATH_MAGIC) + 8)
+        if len(head) < len(_TOOLPATH_MAGIC) + 8 or head[:len(_TOOLPATH_MAGIC)] != _TOOLPATH_MAGIC:
+            raise ValueError("not a toolpath file: " + filename)
+        version, size = struct.unpack("<II", head[len(_TOOLPATH_MAGIC):])
+        if version != _TOOLPATH_VERSION:
+            raise ValueError("unknown toolpath version %d: %s" % (version, filename))
+        header = json.loads(f.read(size))
+    if source is not None and header["source"] != source:
+        raise ValueError("toolpath is saved for another source: " + filename)
+    start = -(-(len(head) + size) // _TOOLPATH_ALIGN) * _TOOLPATH_ALIGN
+    arrays = []
+    for name in _TOOLPATH_ARRAYS:
+        info = header["arrays"][name]
+        shape = tuple(info["shape"])
+        if np.prod(shape) == 0:  # empty arrays could not be mapped
+            arrays.append(np.zeros(shape, dtype=info["dtype"]))
+        else:
+            arrays.append(np.memmap(filename, dtype=info["dtype"], mode="r", offset=start + info["offset"],
+                                    shape=shape))
+    points, path_offsets, layer_offsets, lays2rots = arrays
+    rotations = [Rotation(x, z) for x, z in header["rotations"]]
+    return GCode.fromArrays(points, path_offsets, layer_offsets, rotations, lays2rots.tolist())
+
+
+def sourceSignature(filename):
+    """ modification time, size and hash of the start and the end of the file, they change when it is rewritten """
+    stat = os.stat(filename)
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        h.update(f.read(_SIGNATURE_SAMPLE))
+        if stat.st_size > _SIGNATURE_SAMPLE:
+            f.seek(max(_SIGNATURE_SAMPLE, stat.st_size - _SIGNATURE_SAMPLE))
+            h.update(f.read())
+    return {"mtime": stat.st_mtime_ns, "size": stat.st_size, "sample": h.hexdigest()}
+
+
+def loadSidecar(filename):
+    """ GCode of the gcode file from its sidecar toolpath file, None if there is no sidecar or it is stale """
+    try:
+        return loadToolpath(filename + TOOLPATH_EXT, sourceSignature(filename))
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def saveSidecar(gc, filename, source):
+    """ saves GCode parsed from the gcode file with the source signature taken before parsing """
+    sidecar = filename + TOOLPATH_EXT
+    try:
+        saveToolpath(gc, sidecar + ".part", source)
+        os.replace(sidecar + ".part", sidecar)  # a half written sidecar is never read
+    except OSError as e:
+        logging.warning("toolpath of %s is not saved: %s", filename, e)
+
+
+def splitLayers(gc, points_count=_PART_POINTS):
+    """ GCode parts with whole layers and about points_count points, joined with GCode.extend they are gc """
+    layer_points = gc.path_offsets[gc.layer_offsets]
+    start = 0
+    while start < gc.layersCount():
+        stop = max(start + 1, int(np.searchsorted(layer_points, layer_points[start] + points_count, "right")) - 1)
+        stop = min(stop, gc.layersCount())
+        first_path, last_path = gc.layer_offsets[start], gc.layer_offsets[stop]
+        first_point = gc.path_offsets[first_path]
+        yield GCode.fromArrays(gc.points[first_point:gc.path_offsets[last_path]],
+                               gc.path_offsets[first_path:last_path + 1] - first_point,
+                               gc.layer_offsets[start:stop + 1] - first_path, gc.rotations, gc.lays2rots[start:stop])
+        start = stop
+
+
+def extrusionPerMM(slicing, hardware):
+    """ length of the filament for 1 mm of a line of line_width and layer_height """
+    line_area = slicing.line_width * slicing.layer_height
+    return hardware.flow * line_area / (np.pi * (hardware.bar_diameter / 2) ** 2)
+
+
+def gcodeChunks(gc, slicing, hardware, points_count=_WRITE_POINTS):
+    """
+    Text of the gcode file of the toolpath (e.g. of cone or planar slicing) by chunks of bytes with
+    about points_count moves, so the file is never in memory as a whole: every path is G0 to its first point
+    and G1 to the rest, absolute E of G1 moves is the length of the line by extrusionPerMM.
+    Points are in the frames of their layers, rotations are written before layers as parseGCode reads them:
+    G1 E of tool 2 is the incline (x_rot), of tool 1 is the rotation (z_rot).
+    """
+    yield (";Generated by spycer\n"
+           "M140 S%d\nM104 S%d\nM190 S%d\nM109 S%d\n"
+           "G21\nG90\nM82\nG92 E0\nG1 F%d\n" % (slicing.bed_temperature, slicing.extruder_temperature,
+                                                 slicing.bed_temperature, slicing.extruder_temperature,
+                                                 slicing.print_speed * 60)).encode()
+    per_mm = extrusionPerMM(slicing, hardware)
+    e = 0.0
+    first_layer = 0
+    rotation = (0.0, 0.0)
+    for part in splitLayers(gc, points_count):
+        xyz = part.points[:, :3].astype(np.float64)
+        starts = part.path_offsets[:-1]
+        lengths = np.zeros(len(xyz))
+        lengths[1:] = np.linalg.norm(np.diff(xyz, axis=0), axis=1)
+        lengths[starts] = 0  # travel to the path
+        extruded = e + np.cumsum(lengths * per_mm)
+        if len(extruded):
+            e = float(extruded[-1])
+        is_g0 = np.zeros(len(xyz), dtype=bool)
+        is_g0[starts] = True
+
+        # the same as "G1 X%.3f Y%.3f Z%.3f E%.5f\n" % ... for every move, G0 has no E
+        columns = [_literalColumn(b"G1 X", len(xyz)), _fixedColumn(xyz[:, 0], 3),
+                   _literalColumn(b" Y", len(xyz)), _fixedColumn(xyz[:, 1], 3),
+                   _literalColumn(b" Z", len(xyz)), _fixedColumn(xyz[:, 2], 3),
+                   _literalColumn(b" E", len(xyz)), _fixedColumn(extruded, 5),
+                   _literalColumn(b"\n", len(xyz))]
+        columns[0][0][is_g0, 1] = ord("0")
+        for chars, used in columns[6:8]:
+            used[is_g0] = False
+        chars = np.concatenate([chars for chars, _ in columns], axis=1)
+        used = np.concatenate([used for _, used in columns], axis=1)
+        text = chars[used].tobytes()
+
+        # layer markers before the first moves of layers, layers without paths are not written
+        line_ends = np.cumsum(used.sum(axis=1))
+        pieces, prev = [], 0
+        for layer, (path, end) in enumerate(zip(part.layer_offsets[:-1].tolist(), part.layer_offsets[1:].tolist())):
+            if path < end:
+                pos = int(line_ends[starts[path] - 1]) if starts[path] > 0 else 0
+                layer_rotation = part.rotations[part.lays2rots[layer]]
+                pieces += [text[prev:pos], _rotationLines(rotation, layer_rotation),
+                           b";LAYER:%d\n" % (first_layer + layer)]
+                rotation = (layer_rotation.x_rot, layer_rotation.z_rot)
+                prev = pos
+        pieces.append(text[prev:])
+        first_layer += part.layersCount()
+        yield b"".join(pieces)
+    yield b";End\nM104 S0\nM140 S0\n"
+
+
+def writeGCode(gc, filename, slicing, hardware):
+    """ writes the gcode file of the toolpath by gcodeChunks, returns the number of written bytes """
+    size = 0
+    with open(filename, "wb", buffering=_WRITE_BUFFER) as f:
+        for chunk in gcodeChunks(gc, slicing, hardware):
+            size += f.write(chunk)
+    return size
+
+
+def _rotationLines(current, rotation):
+    """ gcode which rotates the bed from current (x_rot, z_rot) to the rotation """
+    lines = b""
+    if rotation.x_rot != current[0]:
+        lines += b"T2\nG1 E%.3f\n" % rotation.x_rot
+    if rotation.z_rot != current[1]:
+        lines += b"T1\nG1 E%.3f\n" % rotation.z_rot
+    return lines + b"T0\n" if lines else lines
+
+
+def _literalColumn(text, rows):
+    """ the text in every row: chars and mask of used chars for _fixedColumn """
+    chars = np.empty((rows, len(text)), dtype=np.uint8)
+    chars[:] = np.frombuffer(text, dtype=np.uint8)
+    return chars, np.ones(chars.shape, dtype=bool)
+
+
+def _fixedColumn(values, decimals):
+    """
+    ascii of values with the given number of decimals in rows of chars of the same width,
+    used chars of a row (mask) are the number without leading zeros as "%.*f" formats it
+    """
+    q = np.rint(np.abs(values) * 10 ** decimals).astype(np.int64)
+    count = max(decimals + 1, len(str(int(q.max())))) if len(q) else decimals + 1  # digits of the widest
+    groups = -(-count // 4)
+    digits = np.empty((len(q), groups), dtype=np.uint32)  # 4 chars of 4 digits at once from the table
+    rest = q.copy()
+    for g in range(groups - 1, -1, -1):
+        digits[:, g] = _DIGITS4.take(rest % 10000)
+        rest //= 10000
+    digits = digits.view(np.uint8)[:, groups * 4 - count:]
+    point = count - decimals  # digits before the point
+    chars = np.empty((len(q), count + 2), dtype=np.uint8)
+    chars[:, 0] = ord("-")
+    chars[:, 1:point + 1] = digits[:, :point]
+    chars[:, point + 1] = ord(".")
+    chars[:, point + 2:] = digits[:, point:]
+    used = np.ones(chars.shape, dtype=bool)
+    used[:, 0] = (values < 0) & (q != 0)
+    q_digits = np.maximum(decimals + 1, np.searchsorted(_POWERS10, q, side="right") + 1)
+    used[:, 1:point + 1] = np.arange(point) >= (count - q_digits)[:, None]
+    return chars, used
+
+
+def _stripLines(buf, first, last):
+    ws = np.zeros(256, dtype=bool)
+    ws[list(_WHITESPACES)] = True
+    todo = np.flatnonzero(first < last)
+    while len(todo) > 0:
+        todo = todo[ws[buf[first[todo]]]]
+        first[todo] += 1
+        todo = todo[first[todo] < last[todo]]
+    todo = np.flatnonzero(first < last)
+    while len(todo) > 0:
+        todo = todo[ws[buf[last[todo] - 1]]]
+        last[todo] -= 1
+        todo = todo[first[todo] < last[todo]]
+
+
+def _charAt(buf, pos, last):
+    """ byte at pos or 0 if pos is outside of the line """
+    res = buf[np.minimum(pos, len(buf) - 1)] if len(buf) > 0 else np.zeros(len(pos), dtype=np.uint8)
+    return np.where(pos < last, res, 0)
+
+
+def _startsWith(buf, first, last, prefix):
+    res = np.ones(len(first), dtype=bool)
+    for i, c in enumerate(prefix):
+        res &= _charAt(buf, first + i, last) == c
+    return res
+
+
+def _fillForward(mask, values, default):
+    """ for every item the value of the last item with mask set before or at it """
+    idx = np.where(mask, np.arange(len(mask)), -1)
+    np.maximum.accumulate(idx, out=idx)
+    return np.where(idx >= 0, values[np.maximum(idx, 0)], default)
+
+
+def _parseWords(buf, first, last, lines_mask, coords_mask):
+    """
+    Finds words (X1.5, E3 and so on) of the selected lines and parses their values:
+    coordinates for lines from coords_mask and E for the others.
+    Returns values and given flags of each axis from _AXES for every line.
+    """
+    n = len(first)
+    values = np.zeros((len(_AXES), n))
+    given = np.zeros((len(_AXES), n), dtype=bool)
+
+    spaces = np.flatnonzero(buf == ord(" "))
+    line = np.searchsorted(first, spaces, side="right") - 1
+    inside = (line >= 0) & (spaces >= first[np.maximum(line, 0)]) & (spaces + 1 < last[np.maximum(line, 0)])
+    inside &= lines_mask[np.maximum(line, 0)]
+    word_end = np.concatenate((spaces[1:], [len(buf)]))
+    spaces, line, word_end = spaces[inside], line[inside], word_end[inside]
+    starts = spaces + 1
+    word_end = np.minimum(word_end, last[line])
+
+    # the comment finishes the list of words
+    letter = buf[starts]
+    comments = np.flatnonzero(letter == ord(";"))
+    comment_lines, idx = np.unique(line[comments], return_index=True)
+    cut = np.full(n, len(buf))
+    cut[comment_lines] = starts[comments[idx]]
+    axis_of = np.full(256, -1)
+    axis_of[list(_AXES)] = np.arange(len(_AXES))
+    axis = axis_of[letter]
+    keep = (axis >= 0) & (starts < cut[line]) & ((axis < 5) == coords_mask[line])
+    starts, word_end, line, axis = starts[keep], word_end[keep], line[keep], axis[keep]
+
+    parsed = _parseFloats(buf, starts + 1, word_end)
+    values[axis, line] = parsed  # the last word wins, as in parseArgs
+    given[axis, line] = True
+    return values, given
+
+
+def _parseFloats(buf, starts, ends):
+    """ float() of every buf[starts[i]:ends[i]], words are copied to a fixed width bytes array and cast at once """
+    res = np.empty(len(starts))
+    for c in range(0, len(starts), _CHUNK):
+        s, e = starts[c:c + _CHUNK], ends[c:c + _CHUNK]
+        cols = np.arange(max(1, (e - s).max(initial=1)))
+        chars = buf[np.minimum(s[:, None] + cols, len(buf) - 1)]
+        chars[cols >= (e - s)[:, None]] = 0  # zero padding is ignored by bytes dtype
+        res[c:c + _CHUNK] = chars.view("S%d" % len(cols))[:, 0].astype(np.float64)
+    return res
+
+
+def _resolveAxis(values, given, relative, cur=0.0):
+    """ absolute coordinates of moves: keeps previous value if not given, sums deltas in relative mode """
+    res = np.empty(len(values))
+    bounds = np.concatenate(([0], np.flatnonzero(np.diff(relative)) + 1, [len(values)]))
+    for s, e in zip(bounds[:-1], bounds[1:]):
+        if s == e:
+            continue
+        if relative[s]:
+            deltas = np.where(given[s:e], values[s:e], 0.0)
+            res[s:e] = np.cumsum(np.concatenate(([cur], deltas)))[1:]
+        else:
+            res[s:e] = _fillForward(given[s:e], values[s:e], cur)
+        cur = res[e - 1]
+    return res
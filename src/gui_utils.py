@@ -1,11 +1,14 @@
 from typing import Tuple, List, Dict
 
+import numpy as np
 import vtk
 from PyQt5.QtWidgets import QMessageBox
+from vtk.util import numpy_support
 from vtkmodules.vtkCommonColor import vtkNamedColors
 from vtkmodules.vtkFiltersSources import vtkLineSource, vtkConeSource
 from vtkmodules.vtkRenderingCore import vtkActor, vtkPolyDataMapper
 
+from src import stl_loader
 from src.settings import sett, get_color
 
 
@@ -164,15 +167,35 @@ def createAxes(interactor):
 
 
 def createStlActor(filename):
-    reader = vtk.vtkSTLReader()
-    reader.SetFileName(filename)
-    reader.Update()
-    return build_actor(reader), reader
+    """
+    returns the actor and the polydata of the stl, big meshes are drawn simplified while the scene moves
+    (the actor chooses the simplified copy when the full mesh takes longer than the time given for a frame)
+    """
+    points, cells = stl_loader.weldVertices(stl_loader.readTriangles(filename))
+    output = stl_loader.polyData(points, cells)
+    lod_triangles = sett().common.stl_lod_triangles
+    if not lod_triangles or len(cells) <= lod_triangles:
+        return build_actor(output, True), output
+    actor = vtk.vtkLODActor()
+    mapper = vtk.vtkPolyDataMapper()
+    mapper.SetInputData(output)
+    actor.SetMapper(mapper)
+    lod_mapper = vtk.vtkPolyDataMapper()
+    lod_mapper.SetInputData(stl_loader.polyData(*stl_loader.decimated(points, cells, lod_triangles)))
+    actor.AddLODMapper(lod_mapper)
+    return actor, output
+
+
+def lodTriangles(actor):
+    """ triangles of the simplified copy of the stl drawn while the scene moves, 0 if there is none """
+    if not isinstance(actor, vtk.vtkLODActor) or actor.GetLODMappers().GetNumberOfItems() == 0:
+        return 0
+    return actor.GetLODMappers().GetItemAsObject(0).GetInput().GetNumberOfPolys()
 
 
 def createStlActorInOrigin(filename, colorize=False):
-    actor, reader = createStlActor(filename)
-    output = reader.GetOutput()
+    """ returns the actor moved to the plane center and the polydata of the stl """
+    actor, output = createStlActor(filename)
 
     if colorize:
         actor = colorizeSTL(output)
@@ -183,48 +206,318 @@ def createStlActorInOrigin(filename, colorize=False):
     transform.Translate(-origin[0] + s.hardware.plane_center_x, -origin[1] + s.hardware.plane_center_y,
                         -origin[2] + s.hardware.plane_center_z)
     actor.SetUserTransform(transform)
-    return actor
+    return actor, output
+
+
+def stlTriangles(polydata):
+    """ (n, 9) array of vertices of triangles of the polydata read from stl """
+    if polydata.GetNumberOfPolys() == 0:
+        return np.zeros((0, 9), dtype=np.float32)
+    points = numpy_support.vtk_to_numpy(polydata.GetPoints().GetData())
+    cells = numpy_support.vtk_to_numpy(polydata.GetPolys().GetConnectivityArray()).reshape(-1, 3)
+    return points[cells].reshape(-1, 9)
 
 
 def makeBlocks(layers, rotations, lays2rots):
+    points, path_offsets, layer_offsets = layersColumns(layers)
+    xyz = rotatedXYZ(points, path_offsets, layer_offsets, rotations, lays2rots).astype(np.float32)
     blocks = []
-    for i in range(len(layers)):
-        points = vtk.vtkPoints()
-        lines = vtk.vtkCellArray()
-        block = vtk.vtkPolyData()
-        points_count = 0
-        for path in layers[i]:
-            line = vtk.vtkLine()
-            for k in range(len(path) - 1):
-                points.InsertNextPoint(path[k].xyz(rotations[lays2rots[i]]))
-                line.GetPointIds().SetId(0, points_count + k)
-                line.GetPointIds().SetId(1, points_count + k + 1)
-                lines.InsertNextCell(line)
-            points.InsertNextPoint(path[-1].xyz(rotations[lays2rots[i]]))  # not forget to add last point
-            points_count += len(path)
-        block.SetPoints(points)
-        block.SetLines(lines)
-        blocks.append(block)
+    for i in range(len(layer_offsets) - 1):
+        offsets = path_offsets[layer_offsets[i]:layer_offsets[i + 1] + 1]
+        blocks.append(makePolyData(xyz[offsets[0]:offsets[-1]], offsets - offsets[0]))
     return blocks
 
 
-def wrapWithActors(blocks, rotations, lays2rots):
+def makePolyData(xyz, offsets):
+    """
+    Polydata with a polyline for every path: path k is xyz[offsets[k]:offsets[k + 1]].
+    Numpy arrays are given to vtk without copying and without per point calls.
+    """
+    points = vtk.vtkPoints()
+    points.SetData(numpy_support.numpy_to_vtk(np.ascontiguousarray(xyz, dtype=np.float32)))
+    lines = vtk.vtkCellArray()
+    lines.SetData(numpy_support.numpy_to_vtkIdTypeArray(np.ascontiguousarray(offsets, dtype=np.int64)),
+                  numpy_support.numpy_to_vtkIdTypeArray(np.arange(len(xyz), dtype=np.int64)))
+    block = vtk.vtkPolyData()
+    block.SetPoints(points)
+    block.SetLines(lines)
+    return block
+
+
+def layersColumns(layers):
+    """ points, path_offsets and layer_offsets of GCode.layers view or of List[List[List[Point]]] """
+    gc = getattr(layers, "gcode", None)
+    if gc is None:
+        from src.gcode import packLayers
+        return packLayers(layers)
+    return gc.points, gc.path_offsets, gc.layer_offsets
+
+
+def rotatedXYZ(points, path_offsets, layer_offsets, rotations, lays2rots):
+    """
+    Point.xyz of every point at once: points with a != 0 are grouped by (a, b, layer rotation)
+    and every group is transformed by one cached matrix.
+    """
+    xyz = points[:, :3].astype(np.float64)
+    counts = np.diff(path_offsets[layer_offsets])
+    layer_rots = np.repeat(np.asarray(lays2rots[:len(counts)], dtype=np.int64), counts)
+    rotated = np.flatnonzero(points[:, 3] != 0)
+    if len(rotated) == 0:
+        return xyz
+    keys = np.column_stack((points[rotated, 3], points[rotated, 4], layer_rots[rotated]))
+    # neighbour vertices mostly have the same key, so only heads of runs are sorted
+    heads = np.flatnonzero(np.concatenate(([True], np.any(keys[1:] != keys[:-1], axis=1))))
+    keys, run_group = np.unique(keys[heads], axis=0, return_inverse=True)
+    group = np.repeat(run_group.ravel(), np.diff(np.concatenate((heads, [len(rotated)]))))
+    order = np.argsort(group, kind="stable")
+    bounds = np.searchsorted(group[order], np.arange(len(keys) + 1))
+    from src.gcode import Rotation
+    for k, (a, b, rot) in enumerate(keys.tolist()):
+        idx = rotated[order[bounds[k]:bounds[k + 1]]]
+        xyz[idx] = transformPoints(transformMatrix(Rotation(a, b), rotations[int(rot)]), xyz[idx])
+    return xyz
+
+
+def transformPoints(matrix, xyz):
+    # the same order of operations as in vtkTransform.TransformPoint, so results are equal bit to bit
+    return np.column_stack([xyz[:, 0] * matrix[i, 0] + xyz[:, 1] * matrix[i, 1] + xyz[:, 2] * matrix[i, 2] +
+                            matrix[i, 3] for i in range(3)])
+
+
+_transforms = {}  # prepareTransform results by angles and rotation center
+_TRANSFORMS_LIMIT = 100000
+
+
+def cachedTransform(cancelRot, applyRot):
+    """ prepareTransform which is created once for the pair of rotations, do not modify it """
+    return _cachedTransform(cancelRot, applyRot)[0]
+
+
+def transformMatrix(cancelRot, applyRot):
+    """ 4x4 numpy matrix of cachedTransform """
+    return _cachedTransform(cancelRot, applyRot)[1]
+
+
+def matrixArray(tf):
+    """ 4x4 numpy matrix of vtkTransform """
+    m = tf.GetMatrix()
+    return np.array([[m.GetElement(i, j) for j in range(4)] for i in range(4)])
+
+
+def _cachedTransform(cancelRot, applyRot):
+    sh = sett().hardware
+    key = (cancelRot.x_rot, cancelRot.z_rot, applyRot.x_rot, applyRot.z_rot,
+           sh.rotation_center_x, sh.rotation_center_y, sh.rotation_center_z)
+    res = _transforms.get(key)
+    if res is None:
+        if len(_transforms) >= _TRANSFORMS_LIMIT:
+            _transforms.clear()
+        tf = prepareTransform(cancelRot, applyRot)
+        res = (tf, matrixArray(tf))
+        _transforms[key] = res
+    return res
+
+
+def wrapWithActors(blocks, rotations, lays2rots, mark_last=True, transforms=None):
+    """
+    Actors of layers with the same rotation share one transform: transforms[rotation index].
+    Pass the same transforms dict for the next parts of the gcode.
+    """
+    if transforms is None:
+        transforms = {}
     actors = []
     s = sett()
     for i in range(len(blocks)):
         block = blocks[i]
         actor = build_actor(block, True)
         # rotate to abs coords firstly and then apply last rotation
-        tnf = prepareTransform(rotations[lays2rots[i]], rotations[0])
+        tnf = transforms.get(lays2rots[i])
+        if tnf is None:
+            tnf = prepareTransform(rotations[lays2rots[i]], rotations[0])
+            transforms[lays2rots[i]] = tnf
         actor.SetUserTransform(tnf)
 
         actor.GetProperty().SetColor(get_color(s.colors.layer))
         actors.append(actor)
 
-    actors[-1].GetProperty().SetColor(get_color(s.colors.last_layer))
+    if mark_last:
+        actors[-1].GetProperty().SetColor(get_color(s.colors.last_layer))
     return actors
 
 
+def simplifyPaths(xyz, offsets, step):
+    """
+    Paths (path k is xyz[offsets[k]:offsets[k + 1]]) simplified for drawing from afar:
+    of consecutive points in the same cell of a grid with the given step only the first one is kept,
+    the first and the last points of paths are always kept. Returns xyz and offsets of the simplified paths.
+    """
+    if len(xyz) == 0:
+        return xyz, offsets
+    grid = ((xyz - xyz.min(axis=0)) * np.float32(1 / step)).astype(np.int64)  # not negative, so floor
+    dims = grid.max(axis=0) + 1
+    cells = (grid[:, 0] * dims[1] + grid[:, 1]) * dims[2] + grid[:, 2]
+    keep = np.ones(len(xyz), dtype=bool)
+    np.not_equal(cells[1:], cells[:-1], out=keep[1:])
+    filled = np.diff(offsets) > 0
+    keep[offsets[:-1][filled]] = True
+    keep[offsets[1:][filled] - 1] = True
+    kept_before = np.concatenate(([0], np.cumsum(keep)))
+    return xyz[keep], kept_before[offsets]
+
+
+class MergedLayers:
+    """
+    All layers of the toolpath in a few polydata chunks instead of an actor per layer.
+    Points are moved to the frame of the first rotation, so one transform rotates everything.
+    Every cell (path) has its layer index as scalar: visible layers are a prefix of cells,
+    the last visible layer is colored by the lookup table.
+    Chunks lower than lod_layers layers under the shown one are drawn by simplified paths
+    once they are made (see unsimplified), so the number of drawn points does not grow with the number of layers.
+    """
+    CHUNK_POINTS = 1 << 20  # layers are added to a chunk while it is smaller
+
+    def __init__(self, rotations):
+        self.rotations = rotations
+        self.layers_count = 0
+        self.actors = []
+        self.transform = vtk.vtkTransform()  # current rotation, shared by all chunks
+        self._chunks = []
+        s = sett()
+        self.lod_step = s.common.toolpath_lod_step  # mm, 0 - no simplified chunks
+        self.lod_layers = s.common.toolpath_lod_layers  # layers under the shown one in full detail
+        self._lut = vtk.vtkLookupTable()
+        self._lut.SetNumberOfTableValues(2)
+        self._lut.SetTableValue(0, *get_color(s.colors.layer), 1)
+        self._lut.SetTableValue(1, *get_color(s.colors.last_layer), 1)
+        self._lut.Build()
+
+    def append(self, gcode):
+        """ adds layers of gcode (the next part of the same toolpath), returns new actors """
+        points, path_offsets, layer_offsets = gcode.points, gcode.path_offsets, gcode.layer_offsets
+        xyz = rotatedXYZ(points, path_offsets, layer_offsets, gcode.rotations, gcode.lays2rots)
+        layer_points = np.diff(path_offsets[layer_offsets])
+        layer_rots = np.repeat(np.asarray(gcode.lays2rots[:len(layer_points)]), layer_points)
+        for rot in np.unique(layer_rots).tolist():  # as wrapWithActors does with actors
+            idx = np.flatnonzero(layer_rots == rot)
+            xyz[idx] = transformPoints(transformMatrix(gcode.rotations[rot], self.rotations[0]), xyz[idx])
+        xyz = xyz.astype(np.float32)
+
+        new_actors = []
+        start = 0
+        before = np.concatenate(([0], np.cumsum(layer_points)))  # points before the layer
+        while start < len(layer_points):
+            end = max(start + 1, np.searchsorted(before, before[start] + self.CHUNK_POINTS, side="right") - 1)
+            new_actors.append(self._addChunk(xyz, path_offsets, layer_offsets[start:end + 1]))
+            start = end
+        self.actors.extend(new_actors)
+        return new_actors
+
+    def _addChunk(self, xyz, path_offsets, layer_offsets):
+        offsets = path_offsets[layer_offsets[0]:layer_offsets[-1] + 1]
+        chunk = MergedChunk(self.layers_count, layer_offsets - layer_offsets[0], offsets - offsets[0],
+                            xyz[offsets[0]:offsets[-1]])
+        self.layers_count += len(layer_offsets) - 1
+        chunk.mapper = self._mapper(chunk.block)
+        chunk.mapper.SetScalarRange(1 << 30, (1 << 30) + 1)  # all layers are shown, none is highlighted
+        chunk.actor = vtk.vtkActor()
+        chunk.actor.SetMapper(chunk.mapper)
+        chunk.actor.SetUserTransform(self.transform)
+        self._chunks.append(chunk)
+        return chunk.actor
+
+    def _mapper(self, block):
+        mapper = vtk.vtkPolyDataMapper()
+        mapper.SetInputData(block)
+        mapper.SetLookupTable(self._lut)
+        mapper.SetScalarModeToUseCellData()
+        mapper.ScalarVisibilityOn()
+        return mapper
+
+    def unsimplified(self):
+        """ the first chunk without simplified paths or None, its paths are simplified by simplifyPaths """
+        if not self.lod_step:
+            return None
+        return next((chunk for chunk in self._chunks if chunk.lod_mapper is None), None)
+
+    def setSimplified(self, chunk, xyz, offsets):
+        """ draws the chunk by the simplified paths when it is lower than lod_layers under the shown layer """
+        lod_block = makePolyData(xyz, offsets)
+        scalars = numpy_support.numpy_to_vtk(chunk.layer_of_path)
+        scalars.SetName("layer")
+        lod_block.GetCellData().SetScalars(scalars)
+        chunk.lod_mapper = self._mapper(lod_block)
+        chunk.lod_mapper.SetScalarRange(1 << 30, (1 << 30) + 1)  # all layers have the first color
+        if chunk.shown is not None:
+            chunk.show(chunk.shown, self.lod_layers)
+
+    def show(self, value):
+        """ shows layers [0, value], value layer is highlighted """
+        for chunk in self._chunks:
+            chunk.show(value - chunk.first_layer, self.lod_layers)
+
+    def hide(self):
+        for actor in self.actors:
+            actor.VisibilityOff()
+
+    def setRotation(self, rotation):
+        self.transform.SetMatrix(prepareTransform(self.rotations[0], rotation).GetMatrix())
+
+
+class MergedChunk:
+    """ consecutive layers of MergedLayers in one polydata """
+
+    def __init__(self, first_layer, layer_offsets, path_offsets, xyz):
+        self.first_layer = first_layer
+        self.layer_offsets = layer_offsets
+        self.path_offsets = path_offsets
+        self.layer_of_path = np.repeat(np.arange(len(layer_offsets) - 1, dtype=np.int32) + first_layer,
+                                       np.diff(layer_offsets))
+        self.xyz = xyz
+        self.block = makePolyData(xyz, path_offsets)
+        self.connectivity = np.arange(len(xyz), dtype=np.int64)
+        self.actor = None
+        self.mapper = None  # of the block
+        self.lod_mapper = None  # of the simplified block, when it is made
+        self.shown = None  # the last shown layer
+        self._cells = len(path_offsets) - 1
+        self._highlighted = None
+        self._setCells(self._cells)
+
+    def show(self, layer, lod_layers=0):
+        """ layer is relative to the chunk, the chunk is simplified when all its layers are lod_layers lower """
+        layers = len(self.layer_offsets) - 1
+        self.shown = layer
+        self.actor.SetVisibility(layer >= 0)
+        if layer < 0:
+            return
+        mapper = self.lod_mapper if self.lod_mapper is not None and layer >= layers + lod_layers else self.mapper
+        if self.actor.GetMapper() is not mapper:  # every mapper keeps its buffers, so switching is cheap
+            self.actor.SetMapper(mapper)
+        if mapper is self.lod_mapper:
+            return
+        self._setCells(self.layer_offsets[min(layer + 1, layers)])
+        highlighted = layer + self.first_layer if layer < layers else None
+        if highlighted != self._highlighted:
+            self._highlighted = highlighted
+            if highlighted is None:  # all layers are lower than the range, so they get the first color
+                self.mapper.SetScalarRange(1 << 30, (1 << 30) + 1)
+            else:
+                self.mapper.SetScalarRange(highlighted - 1, highlighted)
+
+    def _setCells(self, cells):
+        if cells == self._cells and self.block.GetCellData().GetScalars() is not None:
+            return
+        self._cells = cells
+        offsets = self.path_offsets[:cells + 1]
+        lines = vtk.vtkCellArray()
+        lines.SetData(numpy_support.numpy_to_vtkIdTypeArray(offsets),
+                      numpy_support.numpy_to_vtkIdTypeArray(self.connectivity[:offsets[-1]]))
+        self.block.SetLines(lines)
+        scalars = numpy_support.numpy_to_vtk(self.layer_of_path[:cells])
+        scalars.SetName("layer")
+        self.block.GetCellData().SetScalars(scalars)
+
+
 #  R(V - rotcentr) + rotcenter
 def prepareTransform(cancelRot, applyRot):
     sh = sett().hardware
@@ -266,53 +559,31 @@ def plane_tf(rotation):
 
 
 def colorizeSTL(output):
-    polys = output.GetPolys()
-    allpoints = output.GetPoints()
-
-    tocolor = []
-    with open(sett().colorizer.result, "rb") as f:
-        content = f.read()
-        for b in content:
-            if b == 1:
-                tocolor.append(True)
-            else:
-                tocolor.append(False)
-
-    triangles = vtk.vtkCellArray()
-    triangles2 = vtk.vtkCellArray()
-    for i in range(polys.GetSize()):
-        idList = vtk.vtkIdList()
-        polys.GetNextCell(idList)
-        num = idList.GetNumberOfIds()
-        if num != 3:
-            break
-
-        triangle = vtk.vtkTriangle()
-        triangle.GetPointIds().SetId(0, idList.GetId(0))
-        triangle.GetPointIds().SetId(1, idList.GetId(1))
-        triangle.GetPointIds().SetId(2, idList.GetId(2))
-
-        if tocolor[i]:
-            triangles.InsertNextCell(triangle)
-        else:
-            triangles2.InsertNextCell(triangle)
-
-    trianglePolyData = vtk.vtkPolyData()
-    trianglePolyData.SetPoints(allpoints)
-    trianglePolyData.SetPolys(triangles)
-    trianglePolyData2 = vtk.vtkPolyData()
-    trianglePolyData2.SetPoints(allpoints)
-    trianglePolyData2.SetPolys(triangles2)
-
-    actor = build_actor(trianglePolyData, True)
-    actor.GetProperty().SetColor(get_color(sett().colorizer.color))
-    actor2 = build_actor(trianglePolyData2, True)
-
-    assembly = vtk.vtkAssembly()
-    assembly.AddPart(actor)
-    assembly.AddPart(actor2)
-
-    return assembly
+    """
+    actor of the stl polydata with triangles marked by the colorizer drawn in its color,
+    the mask of the colorizer (a byte per triangle of the file) is a cell scalar mapped by a lookup table
+    """
+    mask = np.fromfile(sett().colorizer.result, dtype=np.uint8)
+    if len(mask) != output.GetNumberOfPolys():
+        raise ValueError("Colorizer result has %d triangles, the model has %d" % (len(mask), output.GetNumberOfPolys()))
+
+    colored = vtk.vtkPolyData()
+    colored.ShallowCopy(output)  # the polydata of the model stays without scalars
+    colored.GetCellData().SetScalars(numpy_support.numpy_to_vtk((mask == 1).astype(np.uint8)))
+
+    lut = vtk.vtkLookupTable()
+    lut.SetNumberOfTableValues(2)
+    lut.SetTableValue(0, 1, 1, 1, 1)  # default color of actors
+    lut.SetTableValue(1, *get_color(sett().colorizer.color), 1)
+    lut.Build()
+
+    actor = build_actor(colored, True)
+    mapper = actor.GetMapper()
+    mapper.SetLookupTable(lut)
+    mapper.SetScalarModeToUseCellData()
+    mapper.SetScalarRange(0, 1)
+    mapper.ScalarVisibilityOn()
+    return actor
 
 
 def build_actor(source, as_is=False):
@@ -45,6 +45,11 @@ class Locale:
     AddOneConeError = "Add at least one cone (it should be first in the list)"
     SmoothSlice = "Non planar 5d (Beta)"
     SmoothFlatSlice = "Non planar (Beta)"
+    Cancel = "Cancel"
+    Cancelled = "Cancelled"
+    PreviewSaveError = "It is a preview of slicing without infill, slice the model to save gcode"
+    StlLoaded = "{}: {} triangles, {} vertices, loaded in {:.2f} s"
+    StlLod = "{} triangles while moving"
 
     def __init__(self, **entries):
         self.__dict__.update(entries)
@@ -96,7 +101,12 @@ dicts = {
         AddOnePlaneError="Добавьте хотя бы одну плоскость",
         AddOneConeError="Первой фигурой должен быть конус",
         SmoothSlice="Непланарная 5d (Beta)",
-        SmoothFlatSlice="Непланарная (Beta)"
+        SmoothFlatSlice="Непланарная (Beta)",
+        Cancel="Отменить",
+        Cancelled="Отменено",
+        PreviewSaveError="Это предпросмотр нарезки без заполнения, нарежьте модель, чтобы сохранить gcode",
+        StlLoaded="{}: треугольников {}, вершин {}, загружено за {:.2f} с",
+        StlLod="при движении треугольников {}"
 
     ),
 }
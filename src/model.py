@@ -1,20 +1,56 @@
-from src import gui_utils, gcode
+import os
+import threading
+
+import numpy as np
+
+from src import gui_utils, gcode, stl_loader
 
 
 class MainModel:
     def __init__(self):
         self.current_slider_value = None
         self.opened_stl = ""
+        self.stl_mesh = None
         self.gcode = None
         self.opened_gcode = ""
+        self.gcode_preview = False  # contours shown while the slicer runs, they are not printed
         self.splanes = []
         self.planesActors = []
 
-    def load_gcode(self, filename):
+    def set_stl(self, filename, polydata):
+        self.opened_stl = filename
+        self.stl_mesh = StlMesh(filename, polydata)
+
+    def load_gcode(self, filename, save_sidecar=True):
+        """ the whole gcode file at once, it is read as stream_gcode reads it """
+        for _ in self.stream_gcode(filename, save_sidecar):
+            pass
+        return self.gcode
+
+    def stream_gcode(self, filename, save_sidecar=True):
+        """
+        yields parts of the gcode file as soon as they are parsed, self.gcode grows with them,
+        the parsed file is saved to the sidecar toolpath file if save_sidecar
+        """
+        self.start_gcode(filename)
+        sidecar = gcode.loadSidecar(filename)
+        if sidecar is not None:  # parsed before, parts are views of the mapped toolpath
+            self.gcode = sidecar
+            yield from gcode.splitLayers(sidecar)
+            return
+        source = gcode.sourceSignature(filename)  # taken before reading, a file changed meanwhile is parsed again
+        for part in gcode.streamGCode(filename):
+            self.gcode.extend(part)
+            yield part
+        if save_sidecar:
+            gcode.saveSidecar(self.gcode, filename, source)
+
+    def start_gcode(self, filename):
+        """ empty gcode, parts of it are added by self.gcode.extend while it is read or written """
         self.current_slider_value = None
         self.opened_gcode = filename
-        self.gcode = gcode.readGCode(filename)
-        return self.gcode
+        self.gcode_preview = False
+        self.gcode = gcode.GCode([], [gcode.Rotation(0, 0)], [])
 
     def add_splane(self):
         if len(self.splanes) == 0:
@@ -25,3 +61,43 @@ class MainModel:
 
     def add_cone(self):
         self.splanes.append(gui_utils.Cone(60, (10, 10, 10), 15))
+
+
+class StlMesh:
+    """
+    Triangles of the opened stl for slicing. They are taken from the polydata shown in the window,
+    so the file is read again only if it is changed after opening.
+    """
+
+    def __init__(self, filename, polydata):
+        self.filename = filename
+        self._polydata = polydata
+        self._stat = fileStat(filename)
+        self._triangles = None
+        self._matrix = None
+        self._transformed = None
+        self._lock = threading.Lock()  # slicings of different kinds call it from their threads at once
+
+    def triangles(self, matrix):
+        """ (n, 9) array of triangles moved by 4x4 matrix of the actor transform, the last result is kept """
+        with self._lock:
+            stat = fileStat(self.filename)
+            if stat is not None and stat != self._stat:
+                self._polydata, self._stat = stl_loader.readPolyData(self.filename), stat
+                self._triangles = self._matrix = None
+            if self._triangles is None:
+                self._triangles = gui_utils.stlTriangles(self._polydata)
+                self._polydata = None
+            if self._matrix is None or not np.array_equal(self._matrix, matrix):
+                matrix = np.array(matrix, dtype=np.float64)
+                xyz = self._triangles.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+                self._transformed, self._matrix = xyz.reshape(-1, 9), matrix
+            return self._transformed
+
+
+def fileStat(filename):
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
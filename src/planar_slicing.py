@@ -0,0 +1,224 @@
+"""
+Planar multi-axis slicing of the model by the slicing planes of "vip" mode without goosli
+
+Plane k takes the part of the model above it, later planes take parts from earlier ones:
+a point belongs to the region of the last plane it is above, points below all planes are the base region.
+The base is sliced by horizontal layers, other regions by layers parallel to their planes. Every region
+is sliced in the frame of the printer when the bed is rotated so that its plane is horizontal
+(the rotation of its layers), layer contours are closed along the planes cutting the region.
+Without planes the model is sliced by horizontal layers only (slice_layers), a preview of "3axes" slicing.
+"""
+from typing import List
+
+import numpy as np
+
+from src import gui_utils
+from src.contours import chain_loops, chain_segments
+from src.gcode import GCode, Rotation
+from src.settings import sett
+
+_EDGES = np.array([[0, 1], [1, 2], [2, 0]])
+
+
+def slice_planes(triangles, planes: List[gui_utils.Plane], layer_height=None) -> GCode:
+    """
+    Toolpath of the layer contours of the model
+
+    triangles - (n, 3, 3) triangles of the model as it is shown
+    planes - slicing planes, their order is the order of regions
+    layer_height - by default it is slicing.layer_height
+    Layers of every region are in its printer frame, lays2rots are the regions of layers.
+    """
+    if layer_height is None:
+        layer_height = sett().slicing.layer_height
+    triangles = np.asarray(triangles, dtype=np.float64).reshape(-1, 3, 3)
+    rotations = [Rotation(0, 0)] + [plane_rotation(plane) for plane in planes]
+    normals = np.array([plane_normal(plane) for plane in planes]).reshape(-1, 3)
+    offsets = np.einsum("ij,ij->i", normals, np.array([[p.x, p.y, p.z] for p in planes]).reshape(-1, 3))
+
+    layers, lays2rots = [], []
+    for region, rotation in enumerate(rotations):
+        matrix = machine_matrix(rotation)
+        # planes in the frame of the region: n.x = d, the plane of the region is z = its d
+        region_normals = normals @ matrix[:3, :3].T
+        region_offsets = offsets + region_normals @ matrix[:3, 3]
+        region_layers = slice_region(triangles @ matrix[:3, :3].T + matrix[:3, 3], region,
+                                     region_normals, region_offsets, layer_height)
+        for paths in region_layers:
+            layers.append([np.column_stack((path, np.tile([rotation.x_rot, rotation.z_rot], (len(path), 1))))
+                           for path in paths])
+            lays2rots.append(region)
+    return GCode.fromPaths(layers, rotations, lays2rots)
+
+
+def slice_layers(triangles, layer_height=None) -> GCode:
+    """
+    Toolpath of the contours of horizontal layers, a preview of "3axes" slicing
+
+    All layers are crossed in one pass by cross_layers and joined by chain_loops at once,
+    chain_segments joins them when the mesh is not closed or its triangles are not oriented the same way.
+    """
+    if layer_height is None:
+        layer_height = sett().slicing.layer_height
+    triangles = np.asarray(triangles, dtype=np.float64).reshape(-1, 3, 3)
+    z = triangles[:, :, 2]
+    heights = layer_heights(z.min(), z.max(), layer_height) if len(z) else []
+    if len(heights) == 0:
+        return GCode.fromPaths([], [Rotation(0, 0)], [])
+    segments, _ = cross_layers(triangles, heights)
+    loops = chain_loops(segments)
+    if loops is None:
+        paths = [path for path in chain_segments(segments)[0] if len(path) > 1]
+        loops = (np.concatenate(paths) if paths else np.zeros((0, 3)),
+                 np.concatenate(([0], np.cumsum([len(path) for path in paths]))).astype(np.int64))
+    points, path_offsets = loops
+
+    # paths of all layers are sorted by their layers, empty layers are skipped
+    lengths = np.diff(path_offsets)
+    path_layers = np.rint((points[path_offsets[:-1], 2] - heights[0]) / layer_height).astype(np.int64)
+    order = np.argsort(path_layers, kind="stable")
+    lengths = lengths[order]
+    starts = np.cumsum(lengths) - lengths
+    index = np.arange(lengths.sum()) + np.repeat(path_offsets[:-1][order] - starts, lengths)
+    counts = np.bincount(path_layers, minlength=len(heights))
+    layer_offsets = np.concatenate(([0], np.cumsum(counts[counts > 0])))
+    return GCode.fromArrays(np.pad(points[index], ((0, 0), (0, 2))), np.concatenate(([0], np.cumsum(lengths))),
+                            layer_offsets, [Rotation(0, 0)], [0] * (len(layer_offsets) - 1))
+
+
+def layer_heights(bottom, top, layer_height):
+    """ heights of the middles of layers from bottom up to top """
+    return bottom + layer_height * (np.arange(int(np.floor((top - bottom) / layer_height))) + 0.5)
+
+
+def plane_rotation(plane):
+    """ rotation of the bed which makes the plane horizontal """
+    return Rotation(-plane.incline, -plane.rot)
+
+
+def plane_normal(plane):
+    """ normal of the plane as create_splane_actor rotates it """
+    incline, rot = np.radians(plane.incline), np.radians(plane.rot)
+    return np.array([np.sin(rot) * np.sin(incline), -np.cos(rot) * np.sin(incline), np.cos(incline)])
+
+
+def machine_matrix(rotation):
+    """ 4x4 matrix from the coordinates of the model to the printer frame when the bed is rotated """
+    return gui_utils.matrixArray(gui_utils.plane_tf(rotation))
+
+
+def slice_region(triangles, region, normals, offsets, layer_height):
+    """
+    Contours of layers of the region, triangles and planes (normals . x = offsets) are in its printer frame.
+    Region 0 is below all planes, region k is above plane k - 1 and below the later ones.
+    """
+    signed = triangles @ normals.T - offsets  # (n, 3 vertices, planes)
+    later = np.arange(len(offsets)) >= region
+    if region > 0:  # triangles below the plane of the region do not cross its layers
+        triangles = triangles[np.any(signed[:, :, region - 1] >= 0, axis=1)]
+        signed = signed[np.any(signed[:, :, region - 1] >= 0, axis=1)]
+    # triangles above a later plane are not in the region, but they close contours of caps
+    out = np.any(np.all(signed[:, :, later] >= 0, axis=1), axis=1)
+    if np.all(out):
+        return []
+
+    z = triangles[:, :, 2]
+    bottom = offsets[region - 1] if region > 0 else z.min()
+    heights = layer_heights(bottom, z[~out].max(), layer_height)
+    segments, layer_offsets = cross_layers(triangles, heights)
+
+    bounds = np.flatnonzero(later)
+    layers = []
+    for i in range(len(heights)):
+        layer_segments = segments[layer_offsets[i]:layer_offsets[i + 1]]
+        parts = [clip_segments(layer_segments, normals[bounds], offsets[bounds])]
+        for k in bounds:  # caps are on their planes, so they are clipped by the others only
+            others = bounds[bounds != k]
+            parts.append(clip_segments(cap_segments(layer_segments, normals[k], offsets[k]),
+                                       normals[others], offsets[others]))
+        paths, _ = chain_segments(np.concatenate(parts))
+        paths = [path for path in paths if len(path) > 1]
+        if paths:
+            layers.append(paths)
+    return layers
+
+
+def cross_layers(triangles, heights):
+    """
+    Segments of the triangles crossing horizontal planes z = heights
+
+    A triangle crosses the contiguous range of layers between its lowest and highest vertex,
+    all pairs of triangles and layers are found at once from triangles sorted by the lowest vertex.
+    Returns segments (m, 2, 3) and offsets, segments of layer i are segments[offsets[i]:offsets[i + 1]].
+    Seen from above, the side of a segment its triangle faces (by the order of vertices) is on the right,
+    so contours of a closed mesh with outward triangles go counterclockwise around the model.
+    Vertices on a layer are below it: a triangle crosses layers from its lowest vertex up to its highest one
+    (excluding it), so a triangle with an edge on the layer above the rest of it gives this edge.
+    """
+    heights = np.asarray(heights, dtype=np.float64)
+    z = triangles[:, :, 2]
+    lowest = z.min(axis=1)
+    order = np.argsort(lowest, kind="stable")
+    first = np.searchsorted(heights, lowest[order], side="left")
+    spans = np.maximum(np.searchsorted(heights, z.max(axis=1)[order], side="left") - first, 0)
+    pair_triangles = np.repeat(order, spans)
+    starts = np.cumsum(spans) - spans
+    pair_layers = np.arange(len(pair_triangles)) - np.repeat(starts - first, spans)
+    by_layer = np.argsort(pair_layers, kind="stable")
+    pair_triangles, pair_layers = pair_triangles[by_layer], pair_layers[by_layer]
+
+    # a triangle touching the layer by its lowest vertex only gives a point, not a segment
+    above = triangles[pair_triangles, :, 2] > heights[pair_layers, None]
+    touching = (above.sum(axis=1) == 2) & (lowest[pair_triangles] == heights[pair_layers])
+    pair_triangles, pair_layers, above = pair_triangles[~touching], pair_layers[~touching], above[~touching]
+
+    points = triangles[pair_triangles]  # (pairs, 3, 3)
+    level = heights[pair_layers]
+    crossing = above[:, _EDGES[:, 0]] != above[:, _EDGES[:, 1]]  # two edges of every pair
+    edges = _EDGES[np.argsort(~crossing, axis=1, kind="stable")[:, :2]]  # (pairs, 2 edges, 2 ends)
+    rows = np.arange(len(points))[:, None]
+    p_1, p_2 = points[rows, edges[:, :, 0]], points[rows, edges[:, :, 1]]
+    t = (level[:, None] - p_1[:, :, 2]) / (p_2[:, :, 2] - p_1[:, :, 2])
+    segments = p_1 + t[:, :, None] * (p_2 - p_1)
+    segments[:, :, 2] = level[:, None]
+    normals = np.cross(points[:, 1] - points[:, 0], points[:, 2] - points[:, 0])
+    direction = segments[:, 1] - segments[:, 0]
+    backward = direction[:, 1] * normals[:, 0] - direction[:, 0] * normals[:, 1] < 0  # direction . (e_z x normal)
+    segments[backward] = segments[backward, ::-1]
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(pair_layers, minlength=len(heights)))))
+    return segments, offsets
+
+
+def clip_segments(segments, normals, offsets):
+    """ parts of segments (m, 2, 3) below all planes normals . x = offsets """
+    for normal, offset in zip(normals, offsets):
+        signed = segments @ normal - offset
+        keep = np.any(signed < 0, axis=1)
+        segments, signed = segments[keep], signed[keep]
+        inside = signed < 0
+        cut = inside[:, 0] != inside[:, 1]
+        end = inside[cut, 0].astype(int)  # the end out of the plane
+        a, b = segments[cut, 0], segments[cut, 1]
+        sa, sb = signed[cut, 0], signed[cut, 1]
+        rows = np.flatnonzero(cut)
+        segments[rows, end] = a + (b - a) * (sa / (sa - sb))[:, None]
+    return segments
+
+
+def cap_segments(segments, normal, offset):
+    """
+    Segments along the plane normal . x = offset closing contours of the layer cut by it:
+    the line of the plane in the layer crosses contours an even number of times, every odd interval is inside.
+    """
+    signed = segments @ normal - offset
+    inside = signed < 0
+    cut = inside[:, 0] != inside[:, 1]
+    if not np.any(cut):
+        return np.zeros((0, 2, 3))
+    a, b = segments[cut, 0], segments[cut, 1]
+    sa, sb = signed[cut, 0], signed[cut, 1]
+    points = a + (b - a) * (sa / (sa - sb))[:, None]  # as clip_segments cuts them
+    direction = np.cross([0.0, 0.0, 1.0], normal)
+    points = points[np.argsort(points @ direction, kind="stable")]
+    points = points[:len(points) // 2 * 2]  # an odd one is of a hole in the mesh
+    return points.reshape(-1, 2, 3)
@@ -0,0 +1,164 @@
+"""
+Cache of slicing results. The key is made of everything the result depends on:
+content of the stl file, its transform and the rest of slicing settings, content of the figures file.
+Entries are files named <key>.<extension>, the least recently used entries are removed
+when the total size of the cache is more than its limit. Use time is the access time of the files,
+modification time is kept (it is a part of the signature of a gcode file for its sidecar toolpath file).
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from functools import partial
+from shutil import copy2
+
+from src import gcode
+from src.settings import sett
+
+# settings which do not change the result of slicing
+_IGNORED_SETTINGS = {"stl_file", "gcode_file", "gcode_stream", "splanes_file", "mesh_file", "workers", "engine",
+                     "preview"}
+_READ_CHUNK = 1 << 20
+
+_hashes = {}  # filename -> ((mtime, size), hash of its content)
+
+
+def fromSettings():
+    """ SliceCache configured in common settings, None if caching is off """
+    common = sett().common
+    size = common.slice_cache_size
+    if not size:
+        return None
+    return SliceCache(common.slice_cache_dir, size * 1024 * 1024)
+
+
+def fileHash(filename):
+    """ sha256 of the file content, it is computed again only when the file is changed """
+    stat = os.stat(filename)
+    stat = (stat.st_mtime_ns, stat.st_size)
+    cached = _hashes.get(filename)
+    if cached is not None and cached[0] == stat:
+        return cached[1]
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for data in iter(partial(f.read, _READ_CHUNK), b""):
+            h.update(data)
+    _hashes[filename] = (stat, h.hexdigest())
+    return _hashes[filename][1]
+
+
+def slicingKey(kind, stl_file, files=(), **values):
+    """
+    key of slicing the stl file with the current slicing and hardware settings (the transform is there),
+    files - other input files of the slicer (e.g. the file of figures), values - other parameters of slicing
+    """
+    s = sett()
+    data = {
+        "kind": kind,
+        "stl": fileHash(stl_file),
+        "slicing": {k: v for k, v in settingsDict(s.slicing).items() if k not in _IGNORED_SETTINGS},
+        "hardware": settingsDict(s.hardware),
+        "files": [fileHash(f) if os.path.exists(f) else None for f in files],
+        "values": values,
+    }
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def settingsDict(settings):
+    return {k: settingsDict(v) if hasattr(v, "__dict__") else v for k, v in vars(settings).items()}
+
+
+class SliceCache:
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size  # bytes
+
+    def gcodeFile(self, key):
+        """ cached gcode file of the key or None """
+        return self._hit(key, ".gcode")
+
+    def putGCodeFile(self, key, filename):
+        self._put(key, ".gcode", partial(copy2, filename))
+
+    def toolpathFile(self, key):
+        """ cached toolpath file of the key (e.g. the sidecar of its gcode file) or None """
+        return self._hit(key, gcode.TOOLPATH_EXT)
+
+    def putToolpathFile(self, key, filename):
+        self._put(key, gcode.TOOLPATH_EXT, partial(copy2, filename))
+
+    def toolpath(self, key):
+        """ cached GCode of the key or None, its arrays are mapped to memory """
+        filename = self._hit(key, gcode.TOOLPATH_EXT)
+        if filename is None:
+            return None
+        try:
+            return gcode.loadToolpath(filename)
+        except (OSError, ValueError, KeyError):
+            logging.warning("slice cache: broken entry %s", filename)
+            self._remove(key)
+            return None
+
+    def putToolpath(self, key, gc):
+        self._put(key, gcode.TOOLPATH_EXT, partial(gcode.saveToolpath, gc))
+
+    def _path(self, key, ext):
+        return os.path.join(self.directory, key + ext)
+
+    def _hit(self, key, ext):
+        filename = self._path(key, ext)
+        try:
+            _touch(filename)  # the entry is recently used
+        except OSError:
+            return None
+        return filename
+
+    def _put(self, key, ext, save):
+        filename = self._path(key, ext)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            temp = filename + ".part"
+            save(temp)
+            os.replace(temp, filename)  # a half written entry is never read
+            _touch(filename)  # copies keep access time of their sources
+            self._evict(key)
+        except OSError as e:
+            logging.warning("slice cache: %s is not saved: %s", filename, e)
+
+    def _entries(self):
+        """ key -> [files, size, last use time] """
+        entries = {}
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or entry.name.endswith(".part"):
+                continue
+            stat = entry.stat()
+            files, size, used = entries.get(entry.name.split(".")[0], ([], 0, 0))
+            entries[entry.name.split(".")[0]] = (files + [entry.path], size + stat.st_size,
+                                                 max(used, stat.st_atime))
+        return entries
+
+    def _evict(self, keep):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries.values())
+        for key, (files, size, _) in sorted(entries.items(), key=lambda item: item[1][2]):
+            if total <= self.max_size:
+                break
+            if key == keep:
+                continue
+            self._remove(key, files)
+            total -= size
+
+    def _remove(self, key, files=None):
+        if files is None:
+            files = self._entries().get(key, ([],))[0]
+        for filename in files:
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+
+def _touch(filename):
+    """ sets access time to now, modification time is kept """
+    os.utime(filename, ns=(time.time_ns(), os.stat(filename).st_mtime_ns))
@@ -0,0 +1,179 @@
+"""
+Snapshots of gcode and stl files without the window (see preview.py)
+
+The scene is made by the same functions of gui_utils as the window makes it and is rendered
+by an offscreen vtk render window to png files. Qt has no OpenGL without a display, so the scene
+is not in the widget of MainWindow but in a plain vtkRenderWindow.
+A snapshot of a layer is the scene of the window when its slider is at the layer: layers [0, layer]
+are shown, the layer is highlighted and the bed is rotated as it is while the layer is printed.
+"""
+import logging
+import os
+import time
+
+import vtk
+
+from src import gui_utils
+from src.model import MainModel
+from src.settings import sett, get_color
+
+
+class Scene:
+    def __init__(self, width=800, height=600):
+        self.render = vtk.vtkRenderer()
+        self.render.SetBackground(get_color(sett().colors.background))
+        self.render_window = vtk.vtkRenderWindow()
+        self.render_window.SetOffScreenRendering(1)
+        self.render_window.SetSize(width, height)
+        self.render_window.AddRenderer(self.render)
+
+        # the same point of view as the window has
+        camera = self.render.GetActiveCamera()
+        camera.SetPosition(5, 5, 5)
+        camera.SetFocalPoint(0, 0, 0)
+        camera.SetViewUp(0, 0, 1)
+
+        self.planeActor = gui_utils.createPlaneActorCircle()
+        self.boxActors = gui_utils.createBoxActors()
+        self.gcode = None
+        self.actors = []
+        self.merged = None
+        self.layer_transforms = {}
+        self.clear()
+
+    def clear(self):
+        self.render.RemoveAllViewProps()
+        self.render.AddActor(self.planeActor)
+        self.planeActor.SetUserTransform(vtk.vtkTransform())
+        for b in self.boxActors:
+            self.render.AddActor(b)
+        self.gcode = None
+        self.actors = []
+        self.merged = None
+        self.layer_transforms = {}
+
+    def load_stl(self, filename):
+        self.clear()
+        stl_actor, _ = gui_utils.createStlActorInOrigin(filename)
+        self.render.AddActor(stl_actor)
+        self.render.ResetCamera()
+
+    def load_gcode(self, gc):
+        """ layers are shown as the controller shows them: merged or an actor per layer """
+        self.clear()
+        self.gcode = gc
+        if sett().common.merge_layers:
+            self.merged = gui_utils.MergedLayers(gc.rotations)
+            self.actors = self.merged.append(gc)
+        else:
+            blocks = gui_utils.makeBlocks(gc.layers, gc.rotations, gc.lays2rots)
+            self.actors = gui_utils.wrapWithActors(blocks, gc.rotations, gc.lays2rots, False, self.layer_transforms)
+        for actor in self.actors:
+            self.render.AddActor(actor)
+        self.planeActor.SetUserTransform(gui_utils.plane_tf(gc.rotations[0]))
+        self.render.ResetCamera()
+
+    def layers_count(self):
+        return self.merged.layers_count if self.merged else len(self.actors)
+
+    def show_layers(self, value):
+        """ the scene of the window with the slider at value, layers_count shows all layers """
+        last = value >= self.layers_count()
+        if self.merged:
+            self.merged.show(value)
+        else:
+            for layer, actor in enumerate(self.actors):
+                actor.SetVisibility(layer <= value)
+                actor.GetProperty().SetColor(get_color(sett().colors.last_layer if layer == value else
+                                                       sett().colors.layer))
+                actor.GetProperty().SetLineWidth(4 if layer == value else 1)
+
+        rotation = self.gcode.rotations[self.gcode.lays2rots[0] if last else self.gcode.lays2rots[value]]
+        if self.merged:
+            self.merged.setRotation(rotation)
+        else:
+            for rot, tf in self.layer_transforms.items():
+                tf.SetMatrix(gui_utils.cachedTransform(self.gcode.rotations[rot], rotation).GetMatrix())
+        self.planeActor.SetUserTransform(gui_utils.plane_tf(rotation))
+
+    def render_frame(self):
+        """ renders the scene, returns seconds it takes """
+        start = time.perf_counter()
+        self.render_window.Render()
+        return time.perf_counter() - start
+
+    def save_png(self, filename):
+        image = vtk.vtkWindowToImageFilter()
+        image.SetInput(self.render_window)
+        image.ReadFrontBufferOff()
+        image.Update()
+        writer = vtk.vtkPNGWriter()
+        writer.SetFileName(filename)
+        writer.SetInputConnection(image.GetOutputPort())
+        writer.Write()
+
+
+def read_gcode(filename):
+    """
+    GCode of the file read by the model: from the sidecar toolpath file if the window has saved it,
+    previews do not write files next to their inputs, so it is not saved here
+    """
+    return MainModel().load_gcode(filename, save_sidecar=False)
+
+
+def parse_layers(specs, layers_count):
+    """
+    slider values of specs: numbers and ranges first:last[:step] (last is included),
+    negative values count from the end, "all" is all layers shown
+    """
+    values = set()
+    for spec in specs:
+        if spec == "all":
+            values.add(layers_count)
+            continue
+        parts = [int(p) for p in spec.split(":")]
+        first, last = (p if p >= 0 else layers_count + p for p in (parts[0], parts[min(1, len(parts) - 1)]))
+        step = parts[2] if len(parts) > 2 else 1
+        if step <= 0:
+            raise ValueError("step of layers %s is not positive" % spec)
+        values.update(range(max(first, 0), min(last, layers_count) + 1, step))
+    return sorted(values)
+
+
+def rotation_layers(gc, layers_count):
+    """ the last layer of every run of layers printed with the same rotation of the bed """
+    lays2rots = gc.lays2rots[:layers_count]
+    return [i for i in range(layers_count) if i + 1 == layers_count or lays2rots[i + 1] != lays2rots[i]]
+
+
+def snapshot_file(filename, out_dir, layers=(), rotations=False, size=(800, 600), frames=1):
+    """
+    Renders snapshots of the gcode or stl file to png files <name>_<layer>.png (<name>.png of stl) in out_dir,
+    layers - specs of parse_layers, rotations - snapshots of rotation_layers as well, all layers by default.
+    Every snapshot is rendered frames times, returns names of png files and seconds of frames.
+    """
+    scene = Scene(*size)
+    name = os.path.splitext(os.path.basename(filename))[0]
+    if os.path.splitext(filename)[1].upper() == ".STL":
+        scene.load_stl(filename)
+        shots = [(None, os.path.join(out_dir, name + ".png"))]
+    else:
+        scene.load_gcode(read_gcode(filename))
+        count = scene.layers_count()
+        values = set(parse_layers(layers, count))
+        if rotations:
+            values.update(rotation_layers(scene.gcode, count))
+        if not values:
+            values.add(count)
+        shots = [(v, os.path.join(out_dir, "%s_%05d.png" % (name, v))) for v in sorted(values)]
+
+    images, times = [], []
+    for value, png in shots:
+        if value is not None:
+            scene.show_layers(value)
+        for _ in range(max(frames, 1)):
+            times.append(scene.render_frame())
+        scene.save_png(png)
+        images.append(png)
+    logging.info("snapshots of %s: %d images", filename, len(images))
+    return images, times
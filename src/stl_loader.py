@@ -0,0 +1,103 @@
+"""
+Reading of stl files into numpy arrays and vtk polydata without vtkSTLReader:
+binary files are mapped to memory, ascii ones are parsed with regular expressions.
+"""
+import re
+
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+BINARY_HEADER = 84  # 80 bytes of the header and the number of triangles
+BINARY_DTYPE = np.dtype([("normal", "<f4", (3,)), ("vectors", "<f4", (3, 3)), ("attr", "<u2")])
+_ASCII_VERTEX = re.compile(rb"vertex\s+(\S+)\s+(\S+)\s+(\S+)")
+_AREA_SAMPLE = 100000  # triangles used to estimate the area of the mesh for decimation
+_HASH_FACTORS = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9], dtype=np.uint64)
+
+
+def readTriangles(filename):
+    """ (n, 3, 3) float32 array of triangles in the order of the file """
+    with open(filename, "rb") as f:
+        header = f.read(BINARY_HEADER)
+        f.seek(0, 2)
+        size = f.tell()
+    if len(header) == BINARY_HEADER:
+        count = int(np.frombuffer(header, dtype="<u4", offset=80)[0])
+        if size == BINARY_HEADER + count * BINARY_DTYPE.itemsize:  # "solid" at the start does not mean ascii
+            if count == 0:
+                return np.zeros((0, 3, 3), dtype=np.float32)
+            records = np.memmap(filename, dtype=BINARY_DTYPE, mode="r", offset=BINARY_HEADER, shape=(count,))
+            return np.array(records["vectors"])
+    with open(filename, "rb") as f:
+        vertices = _ASCII_VERTEX.findall(f.read())
+    if len(vertices) % 3 != 0:
+        raise ValueError("broken stl file: %s" % filename)
+    return np.array(vertices, dtype=np.float64).astype(np.float32).reshape(-1, 3, 3)
+
+
+def weldVertices(triangles):
+    """
+    Joins equal vertices of triangles: returns points (m, 3) and cells (n, 3) with indices of points.
+    Vertices are grouped by a 64-bit hash of their coordinates and compared exactly inside the groups.
+    """
+    xyz = np.ascontiguousarray(triangles, dtype=np.float32).reshape(-1, 3) + np.float32(0)  # -0 is 0
+    if len(xyz) == 0:
+        return np.zeros((0, 3), dtype=np.float32), np.zeros((0, 3), dtype=np.int64)
+    bits = xyz.view(np.uint32)
+    with np.errstate(over="ignore"):
+        hashes = bits[:, 0] * _HASH_FACTORS[0]
+        hashes ^= bits[:, 1] * _HASH_FACTORS[1]
+        hashes ^= bits[:, 2] * _HASH_FACTORS[2]
+    order = np.argsort(hashes)
+    hashes = hashes[order]
+    keys = xyz.view("V12").ravel()[order]  # 12 bytes of the vertex
+    new = np.ones(len(order), dtype=bool)
+    new[1:] = (hashes[1:] != hashes[:-1]) | (keys[1:] != keys[:-1])
+    ids = np.empty(len(order), dtype=np.int64)
+    ids[order] = np.cumsum(new) - 1
+    points = np.empty((int(new.sum()), 3), dtype=np.float32)
+    points[ids] = xyz
+    return points, ids.reshape(-1, 3)
+
+
+def polyData(points, cells):
+    """ polydata with triangles, numpy arrays are given to vtk without copying """
+    vtk_points = vtk.vtkPoints()
+    vtk_points.SetData(numpy_support.numpy_to_vtk(np.ascontiguousarray(points, dtype=np.float32)))
+    polys = vtk.vtkCellArray()
+    polys.SetData(numpy_support.numpy_to_vtkIdTypeArray(np.arange(0, 3 * len(cells) + 1, 3, dtype=np.int64)),
+                  numpy_support.numpy_to_vtkIdTypeArray(np.ascontiguousarray(cells, dtype=np.int64).ravel()))
+    polydata = vtk.vtkPolyData()
+    polydata.SetPoints(vtk_points)
+    polydata.SetPolys(polys)
+    return polydata
+
+
+def readPolyData(filename):
+    """ polydata of the stl file with welded vertices, its cells are in the order of triangles in the file """
+    return polyData(*weldVertices(readTriangles(filename)))
+
+
+def decimated(points, cells, triangles):
+    """
+    Simplified mesh with about the given number of triangles for drawing while the scene moves:
+    vertices in the same cell of a uniform grid are joined (vertex clustering), degenerate triangles are removed.
+    Returns points and cells like weldVertices.
+    """
+    if len(cells) <= triangles or len(cells) == 0:
+        return points, cells
+    sample = cells[::max(1, len(cells) // _AREA_SAMPLE)]  # the area is estimated by a part of triangles
+    corners = points[sample].astype(np.float64)
+    area = 0.5 * np.linalg.norm(np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]), axis=1).sum()
+    area *= len(cells) / len(sample)
+    # a surface crosses about area / step^2 cells of the grid, every vertex has about two triangles
+    step = np.sqrt(2 * area / max(triangles, 1)) if area > 0 else 1.0
+    grid = np.floor((points - points.min(axis=0)) / step).astype(np.int64)
+    dims = grid.max(axis=0) + 1
+    _, clusters = np.unique((grid[:, 0] * dims[1] + grid[:, 1]) * dims[2] + grid[:, 2], return_inverse=True)
+    clusters = clusters.ravel()
+    counts = np.bincount(clusters)
+    simple_points = np.stack([np.bincount(clusters, points[:, i]) for i in range(3)], axis=1) / counts[:, None]
+    simple_cells = clusters[cells]
+    a, b, c = simple_cells.T
+    return simple_points.astype(np.float32), simple_cells[(a != b) & (b != c) & (a != c)]
@@ -1,3 +1,4 @@
+import os
 from typing import Type, Optional
 
 import vtk
@@ -5,7 +6,8 @@ from PyQt5 import QtCore
 from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import (QMainWindow, QWidget, QLabel, QLineEdit, QComboBox, QGridLayout, QSlider,
                              QCheckBox, QVBoxLayout,
-                             QPushButton, QFileDialog, QScrollArea, QGroupBox, QAction, QDialog, QListWidget)
+                             QPushButton, QFileDialog, QScrollArea, QGroupBox, QAction, QDialog, QListWidget,
+                             QPlainTextEdit, QProgressBar)
 from vtk.qt.QVTKRenderWindowInteractor import QVTKRenderWindowInteractor
 
 from src import locales, gui_utils, interactor_style
@@ -58,6 +60,8 @@ class MainWindow(QMainWindow):
 
         # ###################TODO:
         self.actors = []
+        self.merged = None  # gui_utils.MergedLayers when all layers are drawn by a few actors
+        self.layer_transforms = {}  # rotation index -> transform shared by actors of its layers
         self.stlActor = None
         # self.colorizeModel()
 
@@ -343,12 +347,50 @@ class MainWindow(QMainWindow):
         high_layout = QVBoxLayout()
         high_layout.addWidget(settings_group)
         high_layout.addWidget(buttons_group)
+        high_layout.addWidget(self.init_job_panel())
         high_layout.addWidget(self.init_figure_panel())
         high_widget = QWidget()
         high_widget.setLayout(high_layout)
 
         return high_widget
 
+    def init_job_panel(self):
+        # output of the external commands
+        job_layout = QGridLayout()
+        job_layout.setSpacing(5)
+
+        self.job_progress = QProgressBar()
+        self.job_progress.setRange(0, 100)
+        job_layout.addWidget(self.job_progress, 0, 0)
+
+        self.cancel_job_button = QPushButton(self.locale.Cancel)
+        self.cancel_job_button.setEnabled(False)
+        job_layout.addWidget(self.cancel_job_button, 0, 1)
+
+        self.job_log = QPlainTextEdit()
+        self.job_log.setReadOnly(True)
+        self.job_log.setMaximumBlockCount(1000)
+        self.job_log.setMaximumHeight(100)
+        job_layout.addWidget(self.job_log, 1, 0, 1, 2)
+
+        job_widget = QWidget()
+        job_widget.setLayout(job_layout)
+        return job_widget
+
+    def start_job(self):
+        self.job_log.clear()
+        self.job_progress.setValue(0)
+        self.cancel_job_button.setEnabled(True)
+
+    def append_log(self, line):
+        self.job_log.appendPlainText(line)
+
+    def set_job_progress(self, percent):
+        self.job_progress.setValue(percent)
+
+    def finish_job(self):
+        self.cancel_job_button.setEnabled(False)
+
     def init_figure_panel(self):
         bottom_layout = QGridLayout()
         bottom_layout.setSpacing(5)
@@ -386,6 +428,9 @@ class MainWindow(QMainWindow):
             for actor in self.actors:
                 actor.VisibilityOff()
             self.stlActor.VisibilityOn()
+        elif self.merged:
+            self.merged.show(self.picture_slider.value())
+            self.stlActor.VisibilityOff()
         else:
             for layer in range(self.picture_slider.value()):
                 self.actors[layer].VisibilityOn()
@@ -412,6 +457,9 @@ class MainWindow(QMainWindow):
         if prev_value is None:
             return new_slider_value
 
+        if self.merged:
+            return self.change_merged_layer_view(prev_value, new_slider_value, gcd)
+
         last = False if len(self.actors) > new_slider_value else True
         prev_last = False if len(self.actors) > prev_value else True
 
@@ -436,10 +484,7 @@ class MainWindow(QMainWindow):
 
         if new_rot != prev_rot:
             curr_rotation = gcd.rotations[new_rot]
-            for block in range(new_slider_value if last else new_slider_value + 1):
-                # revert prev rotation firstly and then apply current
-                tf = gui_utils.prepareTransform(gcd.rotations[gcd.lays2rots[block]], curr_rotation)
-                self.actors[block].SetUserTransform(tf)
+            self.rotate_layers(gcd, curr_rotation)
 
             self.rotate_plane(plane_tf(curr_rotation))
             # for i in range(len(self.planes)):
@@ -447,6 +492,29 @@ class MainWindow(QMainWindow):
         self.reload_scene()
         return new_slider_value
 
+    def rotate_layers(self, gcd, curr_rotation):
+        for rot, tf in self.layer_transforms.items():
+            # revert rotation of the layers firstly and then apply current
+            tf.SetMatrix(gui_utils.cachedTransform(gcd.rotations[rot], curr_rotation).GetMatrix())
+
+    def change_merged_layer_view(self, prev_value, new_slider_value, gcd):
+        layers_count = self.merged.layers_count
+        last = new_slider_value >= layers_count
+        prev_last = prev_value >= layers_count
+
+        self.layers_number_label.setText(str(new_slider_value))
+        self.merged.show(new_slider_value)
+
+        new_rot = gcd.lays2rots[0] if last else gcd.lays2rots[new_slider_value]
+        prev_rot = gcd.lays2rots[0] if prev_last else gcd.lays2rots[prev_value]
+
+        if new_rot != prev_rot:
+            curr_rotation = gcd.rotations[new_rot]
+            self.merged.setRotation(curr_rotation)
+            self.rotate_plane(plane_tf(curr_rotation))
+        self.reload_scene()
+        return new_slider_value
+
     def move_stl2(self):
         if self.move_button.isChecked():
             self.state_moving()
@@ -527,6 +595,12 @@ class MainWindow(QMainWindow):
         self.render.ResetCamera()
         self.reload_scene()
 
+    def show_stl_status(self, filename, triangles, points, lod_triangles, seconds):
+        message = self.locale.StlLoaded.format(os.path.basename(filename), triangles, points, seconds)
+        if lod_triangles:
+            message += ", " + self.locale.StlLod.format(lod_triangles)
+        self.statusBar().showMessage(message)
+
     def hide_splanes(self):
         if self.hide_checkbox.isChecked():
             for s in self.splanes_actors:
@@ -589,7 +663,7 @@ class MainWindow(QMainWindow):
         self.splanes_actors[ind].GetProperty().SetColor(get_color(sett().colors.last_layer))
         self.reload_scene()
 
-    def load_gcode(self, actors, is_from_stl, plane_tf):
+    def load_gcode(self, actors, is_from_stl, plane_tf, merged=None, transforms=None):
         self.clear_scene()
         if is_from_stl:
             self.stlActor.VisibilityOff()
@@ -599,14 +673,51 @@ class MainWindow(QMainWindow):
             self.rotate_plane(plane_tf)
 
         self.actors = actors
+        self.merged = merged
+        self.layer_transforms = {} if transforms is None else transforms
         for actor in self.actors:
             self.render.AddActor(actor)
 
         if is_from_stl:
-            self.state_both(len(self.actors))
+            self.state_both(self.layers_count())
         else:
-            self.state_gcode(len(self.actors))
+            self.state_gcode(self.layers_count())
+
+        self.render.ResetCamera()
+        self.reload_scene()
+
+    def append_gcode(self, actors, gcd):
+        # new layers of the gcode which is still loading, gcd already contains them
+        shown = self.picture_slider.value()
+        first = self.picture_slider.maximum()
+        if self.merged:  # new layers are already counted, chunks share the transform of the merged layers
+            for actor in actors:
+                self.render.AddActor(actor)
+            self.actors.extend(actors)
+            self.picture_slider.setMaximum(self.layers_count())
+            if shown == first:
+                self.picture_slider.setSliderPosition(self.layers_count())
+            else:
+                self.merged.show(shown)
+            self.reload_scene()
+            return
+        if shown < first:  # the slider is moved back, new layers are hidden and rotated as the shown one
+            for actor in actors:
+                actor.VisibilityOff()
+            self.rotate_layers(gcd, gcd.rotations[gcd.lays2rots[shown]])
+        for actor in actors:
+            self.render.AddActor(actor)
+        self.actors.extend(actors)
+
+        self.picture_slider.setMaximum(len(self.actors))
+        if shown == first:  # keep showing all layers
+            self.picture_slider.setSliderPosition(len(self.actors))
+        self.reload_scene()
+
+    def layers_count(self):
+        return self.merged.layers_count if self.merged else len(self.actors)
 
+    def finish_gcode(self):
         self.render.ResetCamera()
         self.reload_scene()
 
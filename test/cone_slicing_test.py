@@ -0,0 +1,142 @@
+import unittest
+
+import numpy as np
+from helpers import meshOf
+
+from src.cone_slicing import cone_cross, cone_cross_edges, cone_heights, cross_edges, cross_stl, layers_index, \
+    mesh_edges, triangle_bounds
+from src.settings import load_settings, sett
+
+
+def randomMesh(triangles, seed):
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform([-15, -15, 0], [15, 15, 30], (triangles, 1, 3))
+    return meshOf(centers + rng.normal(0, 2, (triangles, 3, 3)))
+
+
+def scalarCrossStl(mesh_input, cone, heights):
+    # cross_stl before vectorization
+    layers = []
+    vertex = [*cone[1]]
+    for height in heights:
+        cross_p_list = []
+        vertex[2] = height
+        for triangle in mesh_input:
+            t = [triangle[:3], triangle[3:6], triangle[6:9]]
+
+            points = []
+            for x, y in ((t[0], t[1]), (t[0], t[2]), (t[1], t[2])):
+                cross_p = cone_cross(x, y, cone[0], np.array(vertex))
+                if cross_p:
+                    if len(cross_p) == 3:
+                        if cross_p not in points:
+                            points.append(cross_p)
+                        if len(points) in [2, 4, 6]:
+                            cross_p_list.append(points)
+        layers.append(cross_p_list)
+    return layers
+
+
+class TestConeCross(unittest.TestCase):
+    def testSameAsScalar(self):
+        rng = np.random.default_rng(1)
+        for alpha in [10, 30, 45, 60]:
+            p_1 = rng.uniform(-20, 20, (3000, 3))
+            p_2 = p_1 + rng.normal(0, 8, (3000, 3))
+            roots, points = cone_cross_edges(p_1, p_2, alpha, 5.0)
+            for i in range(len(p_1)):
+                expected = cone_cross(p_1[i], p_2[i], alpha, np.array([0, 0, 5.0]))
+                if expected == 0:
+                    self.assertEqual(0, roots[i])
+                elif len(expected) == 2:
+                    self.assertEqual(2, roots[i])
+                    np.testing.assert_allclose(expected, points[i], atol=1e-9)
+                else:
+                    self.assertEqual(1, roots[i])
+                    np.testing.assert_allclose(expected, points[i, 0], atol=1e-9)
+            for count in range(3):
+                self.assertIn(count, roots)
+
+    def testZeroLengthLine(self):
+        # zero discriminant, cone_cross returns nan point for such edges of degenerate triangles
+        p = np.array([3.0, 1, 2])
+        with np.errstate(invalid="ignore"):
+            expected = cone_cross(p, p, 30, np.array([0, 0, 10.0]))
+        roots, points = cone_cross_edges(p[None], p[None], 30, 10.0)
+        self.assertEqual(3, len(expected))
+        self.assertEqual(1, roots[0])
+        np.testing.assert_array_equal(expected, points[0, 0])
+
+
+class TestCrossStl(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        load_settings()
+
+    def testSameAsScalar(self):
+        model = randomMesh(150, 2)
+        cone = (20, (0.0, 0.0, 10.0))
+        expected = scalarCrossStl(model, cone, cone_heights(mesh_edges(model), cone[0], cone[1][2]))
+        got = cross_stl(model, cone)
+        self.assertEqual(len(expected), len(got))
+        self.assertGreater(sum(map(len, got)), 0)
+        for expected_layer, got_layer in zip(expected, got):
+            self.assertEqual([len(p) for p in expected_layer], [len(p) for p in got_layer])
+            for expected_points, got_points in zip(expected_layer, got_layer):
+                np.testing.assert_allclose(np.array(expected_points, dtype=float), got_points, atol=1e-4)
+
+    def testWorkers(self):
+        model = randomMesh(500, 4)
+        cone = (30, (0.0, 0.0, 5.0))
+        self.assertEqual(cross_stl(model, cone, 1), cross_stl(model, cone, 3))
+
+    def testHeights(self):
+        model = randomMesh(300, 5)
+        edges = mesh_edges(model)
+        step = sett().slicing.layer_height
+        heights = cone_heights(edges, 25, -20.0)
+        np.testing.assert_allclose(np.diff(heights), step)
+
+        # all layers crossing the mesh are in the range
+        crossing = [-20.0 + step * i for i in range(2000) if cross_edges(edges, 25, -20.0 + step * i)]
+        self.assertLessEqual(heights[0], crossing[0])
+        self.assertGreaterEqual(heights[-1], crossing[-1])
+        self.assertLess(heights[-1] - heights[0], crossing[-1] - crossing[0] + 10)
+        self.assertGreater(heights[0], -20.0)
+
+    def testAdaptiveHeights(self):
+        # a fin in the plane of the axis is across the cone, a horizontal plate is more along it
+        fin = [[[5, 0, 0], [15, 0, 0], [15, 0, 10]], [[5, 0, 0], [15, 0, 10], [5, 0, 10]]]
+        plate = [[[5, 5, 12], [15, 5, 12], [15, 15, 12]], [[5, 5, 12], [15, 15, 12], [5, 15, 12]]]
+        s = sett().slicing
+        s.adaptive_layers = True
+        try:
+            heights = cone_heights(mesh_edges(meshOf(np.array(fin + plate, dtype=float))), 30, 0.0)
+        finally:
+            s.adaptive_layers = False
+        steps = np.round(np.diff(heights) / s.min_layer_height, 6)
+        np.testing.assert_array_equal(np.round(steps), steps)
+        self.assertEqual(s.layer_height / s.min_layer_height, steps.max())
+        self.assertLessEqual(2, steps.min())  # cos of the plate and the cone normals is sin(30)
+        self.assertLess(steps.min(), steps.max())
+
+    def testLayersIndex(self):
+        model = randomMesh(3000, 3)
+        model.vectors[::50, 1] = model.vectors[::50, 0]  # degenerate triangles
+        edges = mesh_edges(model)
+        heights = [5 + 0.3 * i for i in range(80)]
+        triangles, offsets = layers_index(triangle_bounds(edges, 35), heights)
+        self.assertLess(len(triangles), len(heights) * len(model.points) // 2)
+        with np.errstate(invalid="ignore"):
+            for i, z_cone in enumerate(heights):
+                candidates = triangles[offsets[i]:offsets[i + 1]]
+                self.assertTrue(np.all(np.diff(candidates) > 0))
+                expected = cross_edges(edges, 35, z_cone)
+                got = cross_edges((edges[0][candidates], edges[1][candidates]), 35, z_cone)
+                self.assertEqual([len(p) for p in expected], [len(p) for p in got])
+                for expected_points, got_points in zip(expected, got):
+                    np.testing.assert_array_equal(expected_points, got_points)
+
+
+if __name__ == '__main__':
+    unittest.main()
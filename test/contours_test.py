@@ -0,0 +1,93 @@
+import unittest
+
+import numpy as np
+
+from src.contours import chain_loops, chain_segments, point_ids
+
+
+def polyline(points):
+    return [[points[i], points[i + 1]] for i in range(len(points) - 1)]
+
+
+class TestChainSegments(unittest.TestCase):
+    def testLoopAndOpenChain(self):
+        square = [[0, 0, 1], [10, 0, 1], [10, 10, 1], [0, 10, 1], [0, 0, 1]]
+        line = [[20, 0, 1], [21, 1, 1], [22, 0, 1], [23, 1, 1]]
+        segments = polyline(square) + polyline(line)
+        rng = np.random.default_rng(0)
+        segments = np.array(segments, dtype=float)[rng.permutation(len(segments))]
+        segments[::2] = segments[::2, ::-1]  # directions do not matter
+        segments += rng.uniform(-1e-8, 1e-8, segments.shape)  # rounding errors of slicing
+
+        paths, closed = chain_segments(segments)
+        self.assertEqual(2, len(paths))
+        loop, chain = (paths[0], paths[1]) if closed[0] else (paths[1], paths[0])
+        self.assertEqual([True, False], sorted(closed, reverse=True))
+
+        self.assertEqual(5, len(loop))
+        np.testing.assert_allclose(loop[0], loop[-1])
+        self.assertEqual(sorted(map(tuple, square[:-1])), sorted(map(tuple, np.round(loop[:-1]).tolist())))
+
+        if chain[0][0] > chain[-1][0]:
+            chain = chain[::-1]
+        np.testing.assert_allclose(line, chain, atol=1e-7)
+
+    def testBranchAndShortSegments(self):
+        # two loops with a common point, a segment shorter than tolerance and a nan one
+        segments = polyline([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 0, 0], [-1, 0, 0], [-1, -1, 0], [0, 0, 0]])
+        segments.append([[5, 5, 5], [5, 5, 5 + 1e-9]])
+        segments.append([[5, 5, 5], [np.nan, np.nan, np.nan]])
+        paths, closed = chain_segments(segments)
+        self.assertEqual([7], [len(p) for p in paths])
+        self.assertEqual([True], closed)
+
+    def testEmpty(self):
+        self.assertEqual(([], []), chain_segments([]))
+
+    def testPointIds(self):
+        ids = point_ids(np.array([[1, 2, 3], [0, 0, 0], [1, 2, 3 + 1e-8], [1, 2, 3.1]]))
+        self.assertEqual(ids[0], ids[2])
+        self.assertEqual(3, len(set(ids.tolist())))
+        self.assertEqual([0, 1, 2], sorted(set(ids.tolist())))
+
+
+class TestChainLoops(unittest.TestCase):
+    def testLoops(self):
+        t = np.linspace(0, 2 * np.pi, 50)[:-1]
+        rings = [np.stack([r * np.cos(t) + x, r * np.sin(t), np.full_like(t, z)], axis=1)
+                 for r, x, z in [(5, 0, 0), (2, 0, 0), (3, 20, 0), (5, 0, 0.2)]]
+        rings[1] = rings[1][::-1]  # a hole goes clockwise
+        segments = np.concatenate([np.stack([ring, np.roll(ring, -1, axis=0)], axis=1) for ring in rings])
+        rng = np.random.default_rng(1)
+        segments = segments[rng.permutation(len(segments))] + rng.uniform(-1e-12, 1e-12, segments.shape)
+
+        points, offsets = chain_loops(segments)
+        self.assertEqual([50] * 4, np.diff(offsets).tolist())
+        loops = [points[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+        for loop in loops:
+            np.testing.assert_array_equal(loop[0], loop[-1])
+            # consecutive points are the ends of a segment in its direction
+            for a, b in zip(loop[:-1], loop[1:]):
+                self.assertLess(np.abs(segments - [a, b]).max(axis=(1, 2)).min(), 1e-7)
+        for ring in rings:  # every ring is one of loops
+            self.assertEqual(1, sum(np.abs(loop[:-1] - ring[0]).sum(axis=1).min() < 1e-6 and
+                                    len(loop) == len(ring) + 1 for loop in loops))
+
+    def testNotLoops(self):
+        square = [[0, 0, 1], [10, 0, 1], [10, 10, 1], [0, 10, 1], [0, 0, 1]]
+        self.assertIsNone(chain_loops(polyline(square[:-1])))  # an open chain
+        reversed_segment = polyline(square)
+        reversed_segment[0] = reversed_segment[0][::-1]
+        self.assertIsNone(chain_loops(reversed_segment))
+        # two loops with a common point
+        self.assertIsNone(chain_loops(polyline([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 0, 0], [-1, 0, 0],
+                                                [-1, -1, 0], [0, 0, 0]])))
+
+    def testEmpty(self):
+        points, offsets = chain_loops([])
+        self.assertEqual((0, 3), points.shape)
+        self.assertEqual([0], offsets.tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
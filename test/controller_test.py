@@ -0,0 +1,156 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+from PyQt5 import QtCore
+from helpers import sampleGCode
+
+from src.controller import CommandJob, GCodeStream, parse_progress
+from src.gcode import GCode, Rotation, readGCode
+from src.settings import load_settings
+
+
+def runJob(job):
+    loop = QtCore.QEventLoop()
+    events = []
+    job.output.connect(lambda line: events.append(("output", line)))
+    job.progress.connect(lambda percent: events.append(("progress", percent)))
+    job.done.connect(lambda: events.append(("done",)))
+    job.failed.connect(lambda error: events.append(("failed", error)))
+    job.cancelled.connect(lambda: events.append(("cancelled",)))
+    for signal in (job.done, job.failed, job.cancelled):
+        signal.connect(loop.quit)
+    QtCore.QTimer.singleShot(0, job.start)
+    QtCore.QTimer.singleShot(20000, loop.quit)
+    loop.exec_()
+    return events
+
+
+def pythonCmd(name):
+    return "%s %s" % (sys.executable, name)
+
+
+class TestCommandJob(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def script(self, name, text):
+        filename = os.path.join(self.tmp.name, name)
+        with open(filename, "w") as f:
+            f.write(text)
+        return pythonCmd(filename)
+
+    def testOutputAndProgress(self):
+        first = self.script("first.py", "for i in range(1, 5):\n    print('layer %d/4' % i, flush=True)\n")
+        second = self.script("second.py", "import sys\nprint('50%')\nsys.stdout.write('last line')\n")
+        events = runJob(CommandJob([first, second]))
+        self.assertEqual(("done",), events[-1])
+        lines = [e[1] for e in events if e[0] == "output"]
+        self.assertEqual(["> " + first, "layer 1/4", "layer 2/4", "layer 3/4", "layer 4/4",
+                          "> " + second, "50%", "last line"], lines)
+        progress = [e[1] for e in events if e[0] == "progress"]
+        self.assertEqual([0, 12, 25, 37, 50, 50, 75, 100], progress)
+
+    def testFailureStopsCommands(self):
+        failing = self.script("failing.py", "import sys\nprint('bad input')\nsys.exit(3)\n")
+        never = self.script("never.py", "print('should not run')\n")
+        events = runJob(CommandJob([failing, never]))
+        self.assertEqual("failed", events[-1][0])
+        self.assertIn("exit code 3", events[-1][1])
+        self.assertIn("bad input", events[-1][1])
+        self.assertNotIn(("output", "should not run"), events)
+
+        events = runJob(CommandJob(["no_such_command_for_spycer"]))
+        self.assertEqual("failed", events[-1][0])
+
+    def testCancel(self):
+        sleeping = self.script("sleeping.py", "import time\nprint('started', flush=True)\ntime.sleep(60)\n")
+        job = CommandJob([sleeping, sleeping])
+        job.output.connect(lambda line: line == "started" and job.cancel())
+        events = runJob(job)
+        self.assertEqual(("cancelled",), events[-1])
+        self.assertFalse(job.is_running())
+        self.assertEqual(1, events.count(("output", "started")))
+
+
+class TestGCodeStream(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        load_settings()
+        cls.app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+    def slice(self, from_stdout):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, "source.gcode")
+            with open(source, "w") as f:
+                f.write("\n".join(sampleGCode()) + "\n")
+            out = os.path.join(tmp, "out.gcode")
+            with open(out, "w") as f:
+                f.write(";LAYER:0\nG0 X100 Y100 Z100\n")  # the previous result
+            stub = os.path.join(os.path.dirname(__file__), "stub_slicer.py")
+            cmd = "%s %s %s 0.05" % (pythonCmd(stub), source, "-" if from_stdout else out)
+
+            stream = GCodeStream(out, from_stdout)
+            parts = []
+            stream.part.connect(parts.append)
+            job = CommandJob([cmd], from_stdout)
+            job.data.connect(stream.write)
+            parts_before_exit = []
+            job.done.connect(lambda: parts_before_exit.append(len(parts)))
+            job.done.connect(stream.finish)
+            events = runJob(job)
+            self.assertEqual(("done",), events[-1])
+            self.assertIn(("output", "layer 31/31"), events)
+
+            gcode = GCode([], [Rotation(0, 0)], [])
+            for part in parts:
+                gcode.extend(part)
+            expected = readGCode(source)
+            self.assertEqual(expected.layersCount(), gcode.layersCount())
+            np.testing.assert_array_equal(expected.points, gcode.points)
+            np.testing.assert_array_equal(expected.layer_offsets, gcode.layer_offsets)
+            self.assertLess(5, parts_before_exit[0])  # layers are parsed while they are written
+            np.testing.assert_array_equal(expected.points, readGCode(out).points)
+
+    def testStdout(self):
+        self.slice(True)
+
+    def testFile(self):
+        self.slice(False)
+
+    def testFailed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            stream = GCodeStream(os.path.join(tmp, "out.gcode"), True)
+            errors, parts = [], []
+            stream.failed.connect(errors.append)
+            stream.part.connect(parts.append)
+            stream.write(b";LAYER:0\nG1 Xabc Y1\n;LAYER:1\nG1 X1 Y1\n")
+            stream.write(b";LAYER:2\n")  # stopped, it is ignored
+            self.assertFalse(stream.finish())
+            self.assertEqual(1, len(errors))
+            self.assertEqual([], parts)
+            with self.assertRaises(OSError):
+                GCodeStream(os.path.join(tmp, "missing", "out.gcode"), True)
+
+
+class TestParseProgress(unittest.TestCase):
+    def testMarkers(self):
+        self.assertEqual(0.42, parse_progress("slicing: 42%"))
+        self.assertEqual(0.425, parse_progress("42.5 % done"))
+        self.assertEqual(0.3, parse_progress("layer 3/10"))
+        self.assertEqual(0.5, parse_progress("10% 20/40 50%"))
+        self.assertIsNone(parse_progress("layer 11/10"))
+        self.assertIsNone(parse_progress("reading model.stl"))
+
+
+if __name__ == '__main__':
+    unittest.main()
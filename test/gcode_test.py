@@ -1,6 +1,15 @@
+import os
+import tempfile
 import unittest
 
-from src.gcode import parseArgs, parseRotation, Rotation, parseGCode
+import numpy as np
+from helpers import sampleGCode
+
+from src.gcode import parseArgs, parseRotation, Rotation, parseGCode, parseGCodeFast, GCode, Point, streamGCode, \
+    loadSidecar, loadToolpath, saveToolpath, splitLayers, TOOLPATH_EXT, extrusionPerMM, gcodeChunks, readGCode, \
+    writeGCode, GCodeStreamParser, _fixedColumn
+from src.model import MainModel
+from src.settings import load_settings, sett
 
 
 class TestParseGCode(unittest.TestCase):
@@ -68,5 +77,287 @@ class TestParseGCode(unittest.TestCase):
         self.assertSequenceEqual([0, 0, 1, 1], gode.lays2rots)
 
 
+def flatGCode(gc):
+    layers = [[[(p.x, p.y, p.z, p.a, p.b) for p in path] for path in layer] for layer in gc.layers]
+    rotations = [(r.x_rot, r.z_rot) for r in gc.rotations]
+    return layers, rotations, list(gc.lays2rots)
+
+
+class TestParseGCodeFast(unittest.TestCase):
+    def assertSameAsParseGCode(self, gcode):
+        self.assertEqual(flatGCode(parseGCode(gcode)), flatGCode(parseGCodeFast(gcode)))
+        self.assertEqual(flatGCode(parseGCode(gcode)), flatGCode(parseGCodeFast("\n".join(gcode).encode())))
+
+    def testSimple(self):
+        self.assertSameAsParseGCode([
+            ";LAYER:0",
+            "G0 F1800 X81.848 Y55.873 Z0.2",
+            "G1 F1650 X83.547 Z1.5 Y53.478 E0.09767",
+            ";Put printing message on LCD screen",
+            "G1 X83.756 Y53.208 E0.10902",
+            "G0 X56.78 Y12.34 Z0.5",
+            "G1 F1650 X5 Z6 Y7 E0.09767",
+            ";LAYER:1",
+            "G0 X84.696 Y66.058 Z2.3",
+            "G1 X85.223 Y65.95 E30.50471",
+            "G62 X35 Z6.7",
+            ";LAYER:2",
+            "G1 X89.223 Y67.95 E30.50471",
+            "G1 X23.3 Z4.45",
+            "G0 F1800 X85.188 Y66.146",
+            ";End gcode ",
+            "G1 X23.3 Z4.45"
+        ])
+
+    def testRelativeAndRotations(self):
+        self.assertSameAsParseGCode([
+            "G1 X1 Y2 Z3",
+            "G1 X2 ;X100 comment",
+            ";LAYER:0",
+            "G1 X5 Y5",
+            "G91",
+            "G1 X0.1 Y-0.2",
+            "G1 X0.1 A1.5",
+            "G90",
+            "G1 Y7 B-2",
+            "  T2  ",
+            "G1 E30",
+            "T0",
+            ";LAYER:1",
+            "G0 X1 Y1 Z0.4 A30 B15",
+            "G1  X2  Y+2.5 ",
+            "G1 X3 Y.5",
+            ";LAYER:2",
+            "G1 X4 Y4",
+            "T1",
+            "G1 E-45.5 ;rotate",
+            "G0 X1 Y1",
+            "T0",
+            "G1 X2 Y2",
+            ";LAYER:3",
+            "G1 X3 Y3 A0 B0",
+            ";LAYER:4",
+        ])
+
+    def testEmpty(self):
+        self.assertSameAsParseGCode([])
+        self.assertSameAsParseGCode([";LAYER:0", "G0 X1"])
+
+    def testEndFirst(self):
+        self.assertSameAsParseGCode([";End", "G1 X1"])
+        self.assertSameAsParseGCode(["G1 X1 Y1", ";End", "G1 X1 Y2 ;comment"])
+        parser = GCodeStreamParser()
+        self.assertIsNone(parser.feed(b";End\nG1 X1\n"))
+        self.assertEqual(flatGCode(parseGCode([";End", "G1 X1"])), flatGCode(parser.finish()))
+
+    def testBadNumber(self):
+        self.assertRaises(ValueError, parseGCodeFast, ["G1 X1..2"])
+
+
+class TestGCodeColumns(unittest.TestCase):
+    def testLayersView(self):
+        layers = [[[Point(1, 2, 3, 0, 0), Point(4, 5, 6, 0, 0)], [Point(7, 8, 9, 10, 11), Point(1, 1, 1, 10, 11)]],
+                  [[Point(0.5, 0.25, 0.125, 0, 0), Point(2, 2, 2, 0, 0), Point(3, 3, 3, 0, 0)]],
+                  []]
+        gc = GCode(layers, [Rotation(0, 0)], [0, 0, 0])
+        self.assertEqual((7, 5), gc.points.shape)
+        self.assertSequenceEqual([0, 2, 4, 7], gc.path_offsets.tolist())
+        self.assertSequenceEqual([0, 2, 3, 3], gc.layer_offsets.tolist())
+        self.assertEqual(3, len(gc.layers))
+        self.assertEqual(flatGCode(gc)[0], [[[(p.x, p.y, p.z, p.a, p.b) for p in path] for path in layer]
+                                            for layer in layers])
+        self.assertEqual([], gc.layers[-1])
+
+    def testLayerSlice(self):
+        gc = parseGCodeFast([";LAYER:0", "G0 X1", "G1 X2", "G0 X3", "G1 X4", ";LAYER:1", "G1 X5", "G1 X6"])
+        points, offsets = gc.layerSlice(1, 3)
+        self.assertSequenceEqual([4, 7], offsets.tolist())
+        self.assertSequenceEqual([4, 5, 6], points[:, 0].tolist())
+        points, offsets = gc.layerSlice(0)
+        self.assertSequenceEqual([0, 2, 4], offsets.tolist())
+        self.assertSequenceEqual([1, 2, 3, 4], points[:, 0].tolist())
+
+
+class TestStreamGCode(unittest.TestCase):
+    def testSameAsParseGCode(self):
+        gcode = []
+        for layer in range(20):
+            gcode.append(";LAYER:" + str(layer))
+            if layer == 7:
+                gcode += ["T1", "G1 E-30", "T0"]
+            if layer == 12:
+                gcode += ["G91", "G1 X0.5 Y-0.5 A10", "G1 X0.5 B2", "G90"]
+            gcode.append("G0 X1 Y" + str(layer) + " Z" + str(layer * 0.2))
+            gcode += ["G1 X" + str(i) + " Y" + str(i * 2 + layer) + " E1" for i in range(10)]
+        gcode += [";End", "G1 X100 Y100"]
+
+        fd, filename = tempfile.mkstemp(suffix=".gcode")
+        with os.fdopen(fd, "w") as f:
+            f.write("\n".join(gcode))
+        try:
+            expected = flatGCode(parseGCode(gcode))
+            for chunk_size in [16, 100, 1 << 20]:
+                gc = GCode([], [Rotation(0, 0)], [])
+                parts = 0
+                for part in streamGCode(filename, chunk_size):
+                    gc.extend(part)
+                    parts += 1
+                self.assertEqual(expected, flatGCode(gc))
+                self.assertEqual(chunk_size > len(gcode) * 20, parts == 2)  # all layers and the dummy one
+        finally:
+            os.remove(filename)
+
+
+def isMapped(arr):
+    while arr is not None and not isinstance(arr, np.memmap):
+        arr = arr.base
+    return arr is not None
+
+
+def raggedGCode():
+    # layers with paths of 0 to 6 moves
+    return sampleGCode(points=lambda layer: layer % 7)
+
+
+class TestToolpath(unittest.TestCase):
+    def assertSameGCode(self, expected, got):
+        np.testing.assert_array_equal(expected.points, got.points)
+        np.testing.assert_array_equal(expected.path_offsets, got.path_offsets)
+        np.testing.assert_array_equal(expected.layer_offsets, got.layer_offsets)
+        self.assertEqual(list(expected.lays2rots), list(got.lays2rots))
+        self.assertEqual([(r.x_rot, r.z_rot) for r in expected.rotations],
+                         [(r.x_rot, r.z_rot) for r in got.rotations])
+
+    def testSaveLoad(self):
+        gc = parseGCodeFast(raggedGCode())
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "out" + TOOLPATH_EXT)
+            saveToolpath(gc, filename, {"size": 1})
+            got = loadToolpath(filename)
+            self.assertSameGCode(gc, got)
+            self.assertTrue(isMapped(got.points))
+            self.assertSameGCode(gc, loadToolpath(filename, {"size": 1}))
+            with self.assertRaises(ValueError):
+                loadToolpath(filename, {"size": 2})
+
+            saveToolpath(GCode([], [Rotation(0, 0)], []), filename)
+            self.assertEqual(0, loadToolpath(filename).layersCount())
+
+    def testSplitLayers(self):
+        gc = parseGCodeFast(raggedGCode())
+        for points_count in [1, 10, 1 << 20]:
+            joined = GCode([], [Rotation(0, 0)], [])
+            parts = list(splitLayers(gc, points_count))
+            for part in parts:
+                joined.extend(part)
+            self.assertSameGCode(gc, joined)
+            self.assertEqual(points_count > len(gc.points), len(parts) == 1)
+
+    def testSidecar(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "model.gcode")
+            with open(filename, "w") as f:
+                f.write("\n".join(raggedGCode()))
+            model = MainModel()
+            self.assertIsNone(loadSidecar(filename))
+            expected = GCode([], [Rotation(0, 0)], [])
+            for part in model.stream_gcode(filename):
+                expected.extend(part)
+            self.assertTrue(os.path.exists(filename + TOOLPATH_EXT))
+
+            parts = list(model.stream_gcode(filename))  # from the sidecar
+            self.assertTrue(isMapped(model.gcode.points))
+            self.assertSameGCode(expected, model.gcode)
+            joined = GCode([], [Rotation(0, 0)], [])
+            for part in parts:
+                joined.extend(part)
+            self.assertSameGCode(expected, joined)
+            self.assertSameGCode(expected, model.load_gcode(filename))
+
+            # the changed file is parsed again
+            with open(filename, "a") as f:
+                f.write("\n;LAYER:30\nG1 X5 Y5 Z7")
+            stat = os.stat(filename)
+            os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+            self.assertIsNone(loadSidecar(filename))
+            self.assertEqual(expected.layersCount() + 1, model.load_gcode(filename).layersCount())
+            self.assertEqual(expected.layersCount() + 1, loadSidecar(filename).layersCount())
+
+
+class TestWriteGCode(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        load_settings()
+
+    def testFixedColumn(self):
+        rng = np.random.default_rng(3)
+        values = np.concatenate([rng.uniform(-300, 300, 2000), rng.uniform(-1, 1, 500), [0, -0.0, -0.0001, 12345.6789,
+                                                                                          99999.9999, 0.0005, 1e9]])
+        for decimals in [3, 5]:
+            chars, used = _fixedColumn(values, decimals)
+            got = [bytes(row[mask]).decode() for row, mask in zip(chars, used)]
+            expected = [("%." + str(decimals) + "f") % v for v in values]
+            # a few halves are rounded differently and there is no -0
+            self.assertLess(sum(g != e for g, e in zip(got, expected)), 10)
+            for g, e in zip(got, expected):
+                self.assertAlmostEqual(float(e), float(g), delta=1.01 * 10 ** -decimals)
+                self.assertEqual(len(e.split(".")[1]), len(g.split(".")[1]))
+                self.assertFalse(g.startswith("-") and float(g) == 0)
+
+    def testSameToolpath(self):
+        rng = np.random.default_rng(4)
+        layers = [[rng.uniform(-50, 50, (rng.integers(2, 40), 3)) for _ in range(rng.integers(0, 5))]
+                  for _ in range(40)]
+        gc = GCode.fromPaths(layers, [Rotation(0, 0)], [0] * len(layers))
+        s = sett()
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "out.gcode")
+            writeGCode(gc, filename, s.slicing, s.hardware)
+            got = readGCode(filename, fast=True)
+            with open(filename) as f:
+                moves = [line.split() for line in f if line.startswith("G1 X")]
+
+        not_empty = [layer for layer in layers if layer]
+        self.assertEqual(len(not_empty) + 1, got.layersCount())  # and the dummy layer
+        expected = GCode.fromPaths(not_empty, [Rotation(0, 0)], [0] * len(not_empty))
+        np.testing.assert_allclose(expected.points, got.points, atol=6e-4)
+        np.testing.assert_array_equal(expected.path_offsets, got.path_offsets)
+        np.testing.assert_array_equal(expected.layer_offsets, got.layer_offsets[:-1])
+
+        # E grows by the length of the lines
+        e = np.array([float(move[4][1:]) for move in moves])
+        lengths = np.concatenate([np.linalg.norm(np.diff(path, axis=0), axis=1) for layer in layers for path in layer])
+        np.testing.assert_allclose(np.cumsum(lengths) * extrusionPerMM(s.slicing, s.hardware), e, atol=1e-5)
+        self.assertAlmostEqual(s.hardware.flow * s.slicing.line_width * s.slicing.layer_height,
+                               extrusionPerMM(s.slicing, s.hardware) * np.pi * (s.hardware.bar_diameter / 2) ** 2)
+
+    def testRotations(self):
+        rng = np.random.default_rng(5)
+        rotations = [Rotation(0, 0), Rotation(-30, -45), Rotation(-20, 90)]
+        regions = [0, 1, 1, 2, 0]
+        layers = [[np.column_stack((rng.uniform(-50, 50, (10, 3)), np.tile([rotations[r].x_rot, rotations[r].z_rot],
+                                                                             (10, 1))))] for r in regions]
+        gc = GCode.fromPaths(layers, rotations, regions)
+        s = sett()
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "out.gcode")
+            writeGCode(gc, filename, s.slicing, s.hardware)
+            for fast in [False, True]:
+                got = readGCode(filename, fast=fast)
+                np.testing.assert_allclose(gc.points[:, :3], got.points[:, :3], atol=6e-4)
+                for layer, region in enumerate(regions):
+                    rotation = got.rotations[got.lays2rots[layer]]
+                    self.assertEqual((rotations[region].x_rot, rotations[region].z_rot),
+                                     (rotation.x_rot, rotation.z_rot))
+
+    def testChunks(self):
+        layers = [[np.full((30, 3), layer, dtype=float)] for layer in range(20)]
+        gc = GCode.fromPaths(layers, [Rotation(0, 0)], [0] * len(layers))
+        s = sett()
+        chunks = list(gcodeChunks(gc, s.slicing, s.hardware, 100))
+        self.assertGreater(len(chunks), 5)
+        self.assertEqual(b"".join(list(gcodeChunks(gc, s.slicing, s.hardware))), b"".join(chunks))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,166 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from helpers import sampleGCode, saveStl
+from vtk.util import numpy_support
+
+from src import gui_utils
+from src.gcode import GCodeStreamParser, Rotation, parseGCodeFast
+from src.settings import load_settings, sett
+
+
+class TestRotatedXYZ(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        load_settings()
+
+    def testSameAsPrepareTransform(self):
+        gc = parseGCodeFast(sampleGCode(12, 10, True))
+
+        xyz = gui_utils.rotatedXYZ(gc.points, gc.path_offsets, gc.layer_offsets, gc.rotations, gc.lays2rots)
+        for i in range(gc.layersCount()):
+            points, offsets = gc.layerSlice(i)
+            rot = gc.rotations[gc.lays2rots[i]]
+            for k, (x, y, z, a, b) in enumerate(points.tolist()):
+                expected = [x, y, z]
+                if a != 0:
+                    expected = gui_utils.prepareTransform(Rotation(a, b), rot).TransformPoint(expected)
+                self.assertSequenceEqual(list(expected), xyz[offsets[0] + k].tolist())
+        self.assertTrue(np.any(gc.points[:, 3] != 0))
+
+
+class TestMergedLayers(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        load_settings()
+
+    def testSameAsLayerActors(self):
+        lines = sampleGCode(12, 10, True)
+        gc = parseGCodeFast(lines)
+        text = "\n".join(lines).encode()
+        parser = GCodeStreamParser()  # the file is loaded by two parts
+        parts = [parser.feed(text[:len(text) // 2]), parser.feed(text[len(text) // 2:]), parser.finish()]
+        merged = gui_utils.MergedLayers(parts[0].rotations)
+        merged.CHUNK_POINTS = 25
+        actors = sum((merged.append(part) for part in parts if part is not None), [])
+        self.assertEqual(gc.layersCount(), merged.layers_count)
+        self.assertGreater(len(actors), 2)
+        blocks = gui_utils.makeBlocks(gc.layers, gc.rotations, gc.lays2rots)
+
+        for value in [0, 3, 7, 11, gc.layersCount()]:
+            merged.show(value)
+            rot = gc.rotations[gc.lays2rots[min(value, gc.layersCount() - 1)]]
+            merged.setRotation(rot)
+            shown, expected = [], []
+            for chunk in merged._chunks:
+                if not chunk.actor.GetVisibility():
+                    continue
+                lines = chunk.block.GetLines()
+                points = chunk.block.GetPoints()
+                for k in range(lines.GetNumberOfConnectivityIds()):
+                    shown.append(merged.transform.TransformPoint(points.GetPoint(k)))
+            for layer in range(min(value + 1, gc.layersCount())):
+                tf = gui_utils.prepareTransform(gc.rotations[gc.lays2rots[layer]], rot)
+                for k in range(blocks[layer].GetNumberOfPoints()):
+                    expected.append(tf.TransformPoint(blocks[layer].GetPoint(k)))
+            np.testing.assert_allclose(np.array(shown), np.array(expected), atol=1e-3)
+
+    def testColorsOfLoaded(self):
+        gc = parseGCodeFast(sampleGCode(12, 10, True))
+        merged = gui_utils.MergedLayers(gc.rotations)
+        merged.CHUNK_POINTS = 25
+        merged.append(gc)
+        s = sett()
+        layer, last_layer = (tuple(round(c * 255) for c in gui_utils.get_color(color))
+                             for color in (s.colors.layer, s.colors.last_layer))
+
+        def colors(chunk):
+            mapped = numpy_support.vtk_to_numpy(chunk.mapper.MapScalars(chunk.block, 1.0))
+            return {tuple(c[:3]) for c in mapped.tolist()}
+
+        # a loaded toolpath is shown with the slider at the end: all layers have the color of layers
+        for chunk in merged._chunks:
+            self.assertEqual({layer}, colors(chunk))
+        merged.show(5)
+        chunk = next(c for c in merged._chunks if c.first_layer <= 5 < c.first_layer + len(c.layer_offsets) - 1)
+        self.assertIn(last_layer, colors(chunk))
+
+    def testSimplifiedChunks(self):
+        gc = parseGCodeFast(sampleGCode(12, 10, True))
+        merged = gui_utils.MergedLayers(gc.rotations)
+        merged.CHUNK_POINTS = 25
+        merged.lod_step, merged.lod_layers = 3.0, 2
+        merged.append(gc)
+        merged.show(gc.layersCount())
+        chunks = []
+        while merged.unsimplified() is not None:
+            chunk = merged.unsimplified()
+            merged.setSimplified(chunk, *gui_utils.simplifyPaths(chunk.xyz, chunk.path_offsets, merged.lod_step))
+            chunks.append(chunk)
+        self.assertEqual(merged._chunks, chunks)
+
+        for value in [0, 5, 11]:
+            merged.show(value)
+            for chunk in merged._chunks:
+                self.assertEqual(chunk.first_layer <= value, bool(chunk.actor.GetVisibility()))
+                if chunk.actor.GetVisibility():
+                    last_layer = chunk.first_layer + len(chunk.layer_offsets) - 2
+                    lod = chunk.actor.GetMapper() is chunk.lod_mapper
+                    self.assertEqual(last_layer + merged.lod_layers < value, lod)
+
+    def testSimplifyPaths(self):
+        t = np.linspace(0, 2 * np.pi, 500)
+        circle = np.stack([10 * np.cos(t), 10 * np.sin(t), np.zeros_like(t)], axis=1)
+        xyz = np.concatenate([circle, circle[:7] + 1, circle[:1]]).astype(np.float32)
+        offsets = np.array([0, 500, 507, 508])
+        simple, simple_offsets = gui_utils.simplifyPaths(xyz, offsets, 1.0)
+        self.assertEqual(len(offsets), len(simple_offsets))
+        self.assertLess(len(simple), 100)
+        for k in range(len(offsets) - 1):
+            path = xyz[offsets[k]:offsets[k + 1]]
+            simple_path = simple[simple_offsets[k]:simple_offsets[k + 1]]
+            np.testing.assert_array_equal(path[[0, -1]], simple_path[[0, -1]])
+            # simplified points are points of the path in the same order
+            rows = [np.flatnonzero(np.all(path == p, axis=1))[0] for p in simple_path]
+            self.assertEqual(sorted(rows), rows)
+            self.assertLessEqual(np.abs(np.diff(simple_path, axis=0)).max(initial=0), 3)
+
+
+def lutColor(actor, value):
+    return tuple(actor.GetMapper().GetLookupTable().GetTableValue(value)[:3])
+
+
+class TestColorizeSTL(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        load_settings()
+
+    def testMask(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.uniform(-10, 10, (300, 3, 3))
+        mask = rng.integers(0, 2, 300).astype(np.uint8)
+        s = sett().colorizer
+        old_result = s.result
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "model.stl")
+            saveStl(filename, vectors)
+            s.result = os.path.join(tmp, "colorize_triangles.bin")
+            try:
+                mask.tofile(s.result)
+                actor, output = gui_utils.createStlActorInOrigin(filename, True)
+                scalars = actor.GetMapper().GetInput().GetCellData().GetScalars()
+                np.testing.assert_array_equal(mask, numpy_support.vtk_to_numpy(scalars))
+                self.assertIsNone(output.GetCellData().GetScalars())
+                self.assertEqual(lutColor(actor, 1), tuple(gui_utils.get_color(s.color)))
+
+                mask[:-1].tofile(s.result)  # made for another model
+                with self.assertRaises(ValueError):
+                    gui_utils.createStlActorInOrigin(filename, True)
+            finally:
+                s.result = old_result
+
+
+if __name__ == '__main__':
+    unittest.main()
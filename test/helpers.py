@@ -0,0 +1,47 @@
+"""
+Sample inputs shared by tests: gcode lines, meshes and stl files
+"""
+import numpy as np
+from stl import mesh
+
+
+def sampleGCode(layers=30, points=20, rotations=False):
+    """
+    lines of gcode with a path of points moves in every layer, points is a number or a function of the layer,
+    moves have A and B, with rotations the bed is inclined and rotated (T2/T1) before some layers
+    """
+    gcode = []
+    for layer in range(layers):
+        gcode.append(";LAYER:" + str(layer))
+        if rotations and layer % 4 == 1:
+            gcode += ["T2", "G1 E" + str(layer * 5), "T0"]
+        if rotations and layer % 5 == 2:
+            gcode += ["T1", "G1 E-" + str(layer * 7), "T0"]
+        gcode.append("G0 X1.5 Y" + str(layer) + " Z" + str(layer * 0.2) + " A" + str(layer % 3 * 15) + " B30")
+        count = points(layer) if callable(points) else points
+        gcode += ["G1 X" + str(i * 1.1) + " Y" + str(i * 2.3 - layer) + " E1" for i in range(count)]
+    return gcode
+
+
+def meshOf(vectors):
+    data = np.zeros(len(vectors), dtype=mesh.Mesh.dtype)
+    data["vectors"] = vectors
+    return mesh.Mesh(data)
+
+
+def saveStl(filename, vectors, ascii=False):
+    """ returns (n, 9) points of triangles as they are read from the saved file """
+    meshOf(vectors).save(filename, mode=mesh.stl.Mode.ASCII if ascii else mesh.stl.Mode.BINARY)
+    return mesh.Mesh.from_file(filename).points
+
+
+def sphereTriangles(rings=40, sectors=80, radius=15.0, center=(0.0, 0.0, 15.0)):
+    """ closed UV sphere, triangles face outward """
+    theta = np.linspace(0, np.pi, rings + 1)
+    phi = np.linspace(0, 2 * np.pi, sectors + 1)
+    grid = np.stack([np.outer(np.sin(theta), np.cos(phi)),
+                     np.outer(np.sin(theta), np.sin(phi)),
+                     np.outer(np.cos(theta), np.ones_like(phi))], axis=-1) * radius + center
+    v00, v01, v10, v11 = grid[:-1, :-1], grid[:-1, 1:], grid[1:, :-1], grid[1:, 1:]
+    return np.concatenate([np.stack([v00, v10, v11], axis=2).reshape(-1, 3, 3),
+                           np.stack([v00, v11, v01], axis=2).reshape(-1, 3, 3)])
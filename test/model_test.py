@@ -0,0 +1,69 @@
+import os
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+from helpers import saveStl
+
+from src import gui_utils
+from src.model import StlMesh
+from src.settings import load_settings
+
+
+class TestStlMesh(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        load_settings()
+
+    def testTriangles(self):
+        rng = np.random.default_rng(0)
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "model.stl")
+            expected = saveStl(filename, rng.uniform(-10, 10, (50, 3, 3)))
+            _, polydata = gui_utils.createStlActorInOrigin(filename)
+            stl_mesh = StlMesh(filename, polydata)
+
+            np.testing.assert_array_equal(expected, stl_mesh.triangles(np.eye(4)))
+
+            tf = gui_utils.vtk.vtkTransform()
+            tf.Translate(1, 2, 3)
+            tf.RotateZ(30)
+            tf.Scale(2, 2, 2)
+            got = stl_mesh.triangles(gui_utils.matrixArray(tf))
+            for i in range(0, 150, 7):
+                np.testing.assert_allclose(tf.TransformPoint(expected.reshape(-1, 3)[i].tolist()),
+                                           got.reshape(-1, 3)[i], atol=1e-9)
+            self.assertIs(got, stl_mesh.triangles(gui_utils.matrixArray(tf)))
+
+            expected = saveStl(filename, rng.uniform(-10, 10, (20, 3, 3)))  # changed file is read again
+            np.testing.assert_array_equal(expected, stl_mesh.triangles(np.eye(4)))
+
+    def testThreads(self):
+        rng = np.random.default_rng(1)
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "model.stl")
+            expected = saveStl(filename, rng.uniform(-10, 10, (5000, 3, 3)))
+            _, polydata = gui_utils.createStlActorInOrigin(filename)
+            stl_mesh = StlMesh(filename, polydata)
+            results = {}
+
+            def run(shift):
+                matrix = np.eye(4)
+                matrix[2, 3] = shift
+                for _ in range(20):
+                    results.setdefault(shift, []).append(stl_mesh.triangles(matrix))
+
+            threads = [threading.Thread(target=run, args=(shift,)) for shift in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            for shift, got in results.items():
+                for triangles in got:
+                    np.testing.assert_allclose(expected.reshape(-1, 3)[:, 2] + shift, triangles.reshape(-1, 3)[:, 2],
+                                               atol=1e-5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import unittest
+
+import numpy as np
+from helpers import sphereTriangles
+
+from src.contours import chain_loops
+from src.gui_utils import Plane
+from src.planar_slicing import cross_layers, machine_matrix, plane_normal, plane_rotation, slice_layers, \
+    slice_planes
+from src.settings import load_settings
+
+
+def modelPoints(gc, layer):
+    # points of the layer in the coordinates of the model
+    rotation = gc.rotations[gc.lays2rots[layer]]
+    points, _ = gc.layerSlice(layer)
+    matrix = np.linalg.inv(machine_matrix(rotation))
+    return points[:, :3] @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+class TestPlanarSlicing(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        load_settings()
+
+    def testPlaneRotation(self):
+        for incline, rot in [(0, 0), (-60, 0), (30, 45), (-45, -120)]:
+            plane = Plane(incline, rot, [1, 2, 3])
+            matrix = machine_matrix(plane_rotation(plane))
+            np.testing.assert_allclose([0, 0, 1], matrix[:3, :3] @ plane_normal(plane), atol=1e-12)
+
+    def testCrossLayers(self):
+        triangles = sphereTriangles()
+        heights = np.arange(0.1, 30, 0.5)
+        segments, offsets = cross_layers(triangles, heights)
+        self.assertEqual(len(heights) + 1, len(offsets))
+        for i, height in enumerate(heights):
+            layer = segments[offsets[i]:offsets[i + 1]]
+            np.testing.assert_allclose(height, layer[:, :, 2])
+            # the sphere is crossed by a circle
+            radius = np.linalg.norm(layer[:, :, :2], axis=2)
+            expected = np.sqrt(15 ** 2 - (height - 15) ** 2)
+            self.assertLess(np.abs(radius - expected).max(), 0.3)
+
+    def testVerticesOnLayers(self):
+        top, bottom = [0, 0, 2], [0, 0, 0]
+        ring = [[1, 0, 1], [0, 1, 1], [-1, 0, 1], [0, -1, 1]]
+        octahedron = np.array([t for k in range(4) for t in ([ring[k], ring[(k + 1) % 4], top],
+                                                             [ring[(k + 1) % 4], ring[k], bottom])], dtype=float)
+        heights = [0.5, 1.0, 1.5, 2.0]
+        segments, offsets = cross_layers(octahedron, heights)
+        self.assertFalse(np.any(np.isnan(segments)))
+        self.assertSequenceEqual([0, 4, 8, 12, 12], offsets.tolist())
+        for i, height in enumerate(heights[:3]):
+            layer = segments[offsets[i]:offsets[i + 1]]
+            # the square of the section, the equator is made of edges of the upper triangles
+            np.testing.assert_allclose(1 - abs(height - 1), np.abs(layer[:, :, :2]).sum(axis=2))
+            _, loops = chain_loops(layer)
+            self.assertSequenceEqual([0, 5], loops.tolist())
+            self.assertTrue(np.all(np.cross(layer[:, 0], layer[:, 1])[:, 2] > 0))
+
+        # the highest vertex is on the layer
+        segments, offsets = cross_layers(np.array([[[0, 0, .375], [1, 0, 0], [0, 1, .125]]]), [.125, .375])
+        self.assertSequenceEqual([0, 1, 1], offsets.tolist())
+        np.testing.assert_allclose(segments[0][np.argsort(segments[0][:, 1])], [[2 / 3, 0, .125], [0, 1, .125]])
+
+    def testOrientation(self):
+        triangles = sphereTriangles()
+        segments, _ = cross_layers(triangles, [15.05])
+        # counterclockwise around the axis of the sphere
+        self.assertTrue(np.all(np.cross(segments[:, 0], segments[:, 1])[:, 2] > 0))
+        segments, _ = cross_layers(triangles[:, ::-1], [15.05])
+        self.assertTrue(np.all(np.cross(segments[:, 0], segments[:, 1])[:, 2] < 0))
+
+    def testLayers(self):
+        triangles = sphereTriangles()
+        expected = slice_planes(triangles, [], 0.5)
+        for mesh in [triangles, triangles[:, ::-1], np.concatenate([triangles[::2], triangles[1::2, ::-1]])]:
+            # loops of a closed mesh, of an inside out one and chained from not oriented triangles
+            gc = slice_layers(mesh, 0.5)
+            self.assertEqual(expected.layersCount(), gc.layersCount())
+            np.testing.assert_array_equal(expected.layer_offsets, gc.layer_offsets)
+            np.testing.assert_array_equal(expected.path_offsets, gc.path_offsets)
+            for layer in range(gc.layersCount()):
+                points, _ = gc.layerSlice(layer)
+                self.assertTrue(np.all(np.abs(expected.layerSlice(layer)[0][0, 2] - points[:, 2]) < 1e-6))
+                np.testing.assert_allclose(points[0], points[-1])
+                self.assertEqual(sorted(map(tuple, np.round(expected.layerSlice(layer)[0][:-1], 3).tolist())),
+                                 sorted(map(tuple, np.round(points[:-1], 3).tolist())))
+        self.assertEqual(0, slice_layers(np.zeros((0, 3, 3)), 0.5).layersCount())
+
+    def testHorizontal(self):
+        gc = slice_planes(sphereTriangles(), [], 0.5)
+        self.assertEqual(60, gc.layersCount())
+        self.assertEqual([0] * 60, list(gc.lays2rots))
+        for layer in range(gc.layersCount()):
+            points, offsets = gc.layerSlice(layer)
+            self.assertEqual(2, len(offsets))  # one closed contour
+            np.testing.assert_allclose(points[0], points[-1], atol=1e-6)
+
+    def testRegions(self):
+        planes = [Plane(-30, 0, [0, 0, 10]), Plane(20, 60, [0, 0, 22])]
+        gc = slice_planes(sphereTriangles(), planes, 0.5)
+        self.assertEqual(3, len(gc.rotations))
+        self.assertEqual(sorted(gc.lays2rots), list(gc.lays2rots))
+        self.assertEqual({0, 1, 2}, set(gc.lays2rots))
+
+        normals = np.array([plane_normal(p) for p in planes])
+        offsets = np.einsum("ij,ij->i", normals, [[p.x, p.y, p.z] for p in planes])
+        for layer in range(gc.layersCount()):
+            region = gc.lays2rots[layer]
+            points, path_offsets = gc.layerSlice(layer)
+            np.testing.assert_allclose([gc.rotations[region].x_rot, gc.rotations[region].z_rot],
+                                       points[0, 3:], atol=1e-5)
+            signed = modelPoints(gc, layer) @ normals.T - offsets
+            # points are above the plane of their region and below the later ones
+            if region > 0:
+                self.assertTrue(np.all(signed[:, region - 1] > -1e-3))
+            self.assertTrue(np.all(signed[:, region:] < 1e-3))
+            # contours are closed
+            path_offsets = path_offsets - path_offsets[0]
+            for start, end in zip(path_offsets[:-1], path_offsets[1:]):
+                np.testing.assert_allclose(points[start, :3], points[end - 1, :3], atol=1e-4)
+
+
+if __name__ == '__main__':
+    unittest.main()
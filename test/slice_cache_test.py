@@ -0,0 +1,114 @@
+import os
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from src import slice_cache
+from src.gcode import GCode, Rotation
+from src.settings import load_settings, sett
+from src.slice_cache import SliceCache, slicingKey
+
+
+def writeFile(filename, data, mtime=None):
+    with open(filename, "wb") as f:
+        f.write(data)
+    if mtime is not None:
+        os.utime(filename, (mtime, mtime))
+
+
+class TestSlicingKey(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        load_settings()
+
+    def testKeyChanges(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            stl = os.path.join(tmp, "model.stl")
+            planes = os.path.join(tmp, "planes.txt")
+            writeFile(stl, b"solid a", 1000)
+            writeFile(planes, b"plane 1")
+            s = sett().slicing
+            key = slicingKey("stl", stl, [planes])
+            self.assertEqual(key, slicingKey("stl", stl, [planes]))
+
+            old_stl_file, s.stl_file = s.stl_file, "other.stl"  # paths do not matter
+            try:
+                self.assertEqual(key, slicingKey("stl", stl, [planes]))
+            finally:
+                s.stl_file = old_stl_file
+
+            changed = [slicingKey("cone", stl, [planes]), slicingKey("stl", stl, [planes], cone=[60, 0, 0, 1])]
+            writeFile(planes, b"plane 2")
+            changed.append(slicingKey("stl", stl, [planes]))
+            old_height, s.layer_height = s.layer_height, s.layer_height + 0.1
+            try:
+                changed.append(slicingKey("stl", stl, [planes]))
+            finally:
+                s.layer_height = old_height
+            old_x, s.originx = s.originx, s.originx + 1
+            try:
+                changed.append(slicingKey("stl", stl, [planes]))
+            finally:
+                s.originx = old_x
+            writeFile(stl, b"solid b", 2000)
+            changed.append(slicingKey("stl", stl, [planes]))
+            self.assertEqual(len(changed) + 1, len({key, *changed}))
+
+
+class TestSliceCache(unittest.TestCase):
+    def testGCodeFilesLru(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = SliceCache(os.path.join(tmp, "cache"), 2500)
+            source = os.path.join(tmp, "out.gcode")
+            now = time.time()
+            for i, key in enumerate("abc"):
+                writeFile(source, key.encode() * 1000)
+                cache.putGCodeFile(key, source)
+                os.utime(cache.gcodeFile(key), (now + i, now + i))
+            # the oldest one is removed
+            self.assertIsNone(cache.gcodeFile("a"))
+            with open(cache.gcodeFile("b"), "rb") as f:
+                self.assertEqual(b"b" * 1000, f.read())
+
+            os.utime(cache._path("c", ".gcode"), (now + 10, now + 10))
+            os.utime(cache._path("b", ".gcode"), (now + 5, now + 5))
+            cache.putGCodeFile("d", source)  # c is used after b
+            self.assertIsNone(cache.gcodeFile("b"))
+            self.assertIsNotNone(cache.gcodeFile("c"))
+            self.assertIsNotNone(cache.gcodeFile("d"))
+            self.assertEqual(["c.gcode", "d.gcode"], sorted(os.listdir(cache.directory)))
+
+    def testToolpath(self):
+        rng = np.random.default_rng(0)
+        gc = GCode.fromPaths([[rng.uniform(0, 10, (5, 3)), rng.uniform(0, 10, (3, 3))], [], [rng.uniform(0, 10, (4, 3))]],
+                             [Rotation(0, 0), Rotation(30, 15)], [0, 1, 1])
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = SliceCache(tmp, 1 << 20)
+            self.assertIsNone(cache.toolpath("key"))
+            cache.putToolpath("key", gc)
+            got = cache.toolpath("key")
+            np.testing.assert_array_equal(gc.points, got.points)
+            np.testing.assert_array_equal(gc.path_offsets, got.path_offsets)
+            np.testing.assert_array_equal(gc.layer_offsets, got.layer_offsets)
+            self.assertEqual([0, 1, 1], got.lays2rots)
+            self.assertEqual([(0, 0), (30, 15)], [(r.x_rot, r.z_rot) for r in got.rotations])
+
+            writeFile(cache._path("key", ".toolpath"), b"broken")
+            self.assertIsNone(cache.toolpath("key"))
+            self.assertEqual([], os.listdir(tmp))
+
+    def testFromSettings(self):
+        load_settings()
+        common = sett().common
+        old_size, common.slice_cache_size = common.slice_cache_size, 0
+        try:
+            self.assertIsNone(slice_cache.fromSettings())
+        finally:
+            common.slice_cache_size = old_size
+        self.assertEqual(common.slice_cache_size * 1024 * 1024, slice_cache.fromSettings().max_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import vtk
+
+from src.gcode import GCode, Rotation, TOOLPATH_EXT
+from src.settings import load_settings, sett
+from src.snapshots import Scene, parse_layers, read_gcode, rotation_layers, snapshot_file
+
+GCODE = """G90
+;LAYER:0
+G0 X10 Y10 Z0.2
+G1 X20 Y10 Z0.2 E1
+G1 X20 Y20 Z0.2 E2
+;LAYER:1
+G0 X10 Y10 Z0.4
+G1 X20 Y10 Z0.4 E3
+T2
+G1 E-30
+T1
+G1 E90
+T0
+;LAYER:2
+G0 X10 Y10 Z0.6 A-30 B90
+G1 X20 Y10 Z0.6 E4 A-30 B90
+;End
+"""
+
+
+def imageSize(filename):
+    reader = vtk.vtkPNGReader()
+    reader.SetFileName(filename)
+    reader.Update()
+    return reader.GetOutput().GetDimensions()[:2]
+
+
+class TestSnapshots(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        load_settings()
+
+    def testParseLayers(self):
+        self.assertEqual([0, 2, 4, 6], parse_layers(["0:6:2"], 10))
+        self.assertEqual([3, 9, 10], parse_layers(["3", "-1", "all"], 10))
+        self.assertEqual([8, 9, 10], parse_layers(["-2:20"], 10))
+        with self.assertRaises(ValueError):
+            parse_layers(["0:5:0"], 10)
+
+    def testRotationLayers(self):
+        gc = GCode.fromPaths([[np.zeros((2, 5))]] * 5, [Rotation(0, 0), Rotation(-30, 90)], [0, 0, 1, 1, 0, 0])
+        self.assertEqual([1, 3, 4], rotation_layers(gc, 5))
+
+    def testSnapshots(self):
+        merge_layers = sett().common.merge_layers
+        try:
+            for merged in (True, False):
+                sett().common.merge_layers = merged
+                with tempfile.TemporaryDirectory() as tmp:
+                    filename = os.path.join(tmp, "part.gcode")
+                    with open(filename, "w") as f:
+                        f.write(GCODE)
+                    images, times = snapshot_file(filename, tmp, ["0"], rotations=True, size=(160, 120), frames=2)
+                    self.assertEqual([os.path.join(tmp, "part_%05d.png" % i) for i in (0, 1, 3)], images)
+                    self.assertEqual(6, len(times))
+                    for image in images:
+                        self.assertEqual((160, 120), imageSize(image))
+                    self.assertFalse(os.path.exists(filename + TOOLPATH_EXT))  # previews do not write sidecars
+        finally:
+            sett().common.merge_layers = merge_layers
+
+    def testShowLayers(self):
+        sett().common.merge_layers, merge_layers = False, sett().common.merge_layers
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                filename = os.path.join(tmp, "part.gcode")
+                with open(filename, "w") as f:
+                    f.write(GCODE)
+                scene = Scene(64, 48)
+                scene.load_gcode(read_gcode(filename))
+                scene.show_layers(1)
+                self.assertEqual([True, True, False, False], [bool(a.GetVisibility()) for a in scene.actors])
+                scene.show_layers(scene.layers_count())
+                self.assertTrue(all(a.GetVisibility() for a in scene.actors))
+        finally:
+            sett().common.merge_layers = merge_layers
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import vtk
+from helpers import saveStl, sphereTriangles
+
+from src import stl_loader
+
+
+class TestReadTriangles(unittest.TestCase):
+    def testBinaryAndAscii(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.uniform(-100, 100, (200, 3, 3)).astype(np.float32)
+        with tempfile.TemporaryDirectory() as tmp:
+            binary = os.path.join(tmp, "binary.stl")
+            saveStl(binary, vectors)
+            with open(binary, "r+b") as f:
+                f.write(b"solid but binary")
+            np.testing.assert_array_equal(vectors, stl_loader.readTriangles(binary))
+
+            ascii = os.path.join(tmp, "ascii.stl")
+            saveStl(ascii, vectors, True)
+            np.testing.assert_allclose(vectors, stl_loader.readTriangles(ascii), rtol=1e-5)
+
+            empty = os.path.join(tmp, "empty.stl")
+            saveStl(empty, np.zeros((0, 3, 3)))
+            self.assertEqual((0, 3, 3), stl_loader.readTriangles(empty).shape)
+
+
+class TestWeldVertices(unittest.TestCase):
+    def testSameAsVtkReader(self):
+        vectors = sphereTriangles(20, 30, 10.0, (0.0, 0.0, 0.0))
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "sphere.stl")
+            saveStl(filename, vectors)
+            reader = vtk.vtkSTLReader()
+            reader.SetFileName(filename)
+            reader.Update()
+            triangles = stl_loader.readTriangles(filename)
+        points, cells = stl_loader.weldVertices(triangles)
+        self.assertEqual(reader.GetOutput().GetNumberOfPoints(), len(points))
+        self.assertEqual(len(vectors), len(cells))  # degenerate triangles at the poles are kept
+        np.testing.assert_array_equal(triangles, points[cells])
+
+        mirrored = np.array([[[0, 0, 0], [1, 0, 0], [0, 1, 0]], [[-0.0, 0, 0], [0, -1, 0], [1, 0, 0]]])
+        points, cells = stl_loader.weldVertices(mirrored)
+        self.assertEqual(4, len(points))
+        self.assertEqual(cells[0, 0], cells[1, 0])
+
+    def testDecimated(self):
+        points, cells = stl_loader.weldVertices(sphereTriangles(200, 300, 10.0, (0.0, 0.0, 0.0)))
+        simple_points, simple_cells = stl_loader.decimated(points, cells, 5000)
+        self.assertLess(2500, len(simple_cells))
+        self.assertLess(len(simple_cells), 10000)
+        self.assertLess(np.abs(np.linalg.norm(simple_points, axis=1) - 10).max(), 0.5)
+        self.assertTrue(np.all(simple_cells[:, 0] != simple_cells[:, 1]))
+        self.assertIs(cells, stl_loader.decimated(points, cells, len(cells))[1])
+
+        polydata = stl_loader.polyData(simple_points, simple_cells)
+        self.assertEqual(len(simple_cells), polydata.GetNumberOfPolys())
+        self.assertEqual(len(simple_points), polydata.GetNumberOfPoints())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+"""
+Stands in for goosli in tests: writes the given gcode layer by layer with pauses,
+to stdout or to the output file, and progress to stderr.
+
+python test/stub_slicer.py SOURCE [OUT] [DELAY]
+"""
+import sys
+import time
+
+
+def main(source, out=None, delay=0.0):
+    with open(source) as f:
+        layers = f.read().split(";LAYER:")
+    stream = sys.stdout if out is None else open(out, "w")
+    for i, layer in enumerate(layers):
+        stream.write(layer if i == 0 else ";LAYER:" + layer)
+        stream.flush()
+        print("layer %d/%d" % (i + 1, len(layers)), file=sys.stderr, flush=True)
+        time.sleep(delay)
+    if out is not None:
+        stream.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1], None if len(sys.argv) < 3 or sys.argv[2] == "-" else sys.argv[2],
+         float(sys.argv[3]) if len(sys.argv) > 3 else 0.0)